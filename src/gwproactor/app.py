@@ -31,6 +31,7 @@ from gwproactor.config.proactor_config import ProactorConfig, ProactorName
 from gwproactor.external_watchdog import ExternalWatchdogCommandBuilder
 from gwproactor.links.link_settings import LinkConfig
 from gwproactor.links.mqtt import QOS
+from gwproactor.links.uplink_scheduler import UplinkPriority
 from gwproactor.logger import ProactorLogger
 from gwproactor.logging_setup import setup_logging
 from gwproactor.message import InternalShutdownMessage
@@ -618,6 +619,7 @@ class App(AppInterface):
         *,
         topic: str = "",
         use_link_topic: bool = False,
+        priority: Optional[UplinkPriority] = None,
     ) -> MQTTMessageInfo:
         if self.proactor is None:
             raise ValueError("publish_message called before proactor instantiated")
@@ -628,6 +630,7 @@ class App(AppInterface):
             context=context,
             topic=topic,
             use_link_topic=use_link_topic,
+            priority=priority,
         )
 
     def publish_upstream(
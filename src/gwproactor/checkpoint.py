@@ -0,0 +1,141 @@
+"""State saved to disk so that a restarted proactor resumes where it left off.
+
+If ProactorSettings.checkpoint_seconds is non-zero, the proactor writes a
+ProactorCheckpoint to Paths.data_dir / CHECKPOINT_FILE_NAME that often, and
+when it stops. When it next starts, the checkpoint is read back:
+
+- ProactorStats and LinkStats counters are added back to the new stats, so
+  received, comm event, timeout and reupload counts span restarts.
+- Events that were acked, but are still in the event persister because
+  their clear had not reached storage (a ThreadedPersister queue or a
+  TieredPersister buffer lost in a crash), are cleared before any reupload,
+  rather than being sent again. Acks arrive out of order, so this is a
+  bounded list of the most recently acked event ids rather than a single
+  watermark.
+
+The file is small JSON, replaced atomically, so a crash while saving leaves
+the previous checkpoint. A missing file is not an error.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel, Field
+from result import Err, Ok, Result
+
+from gwproactor.problems import Problems
+from gwproactor.stats import LinkStats, ProactorStats
+
+CHECKPOINT_FILE_NAME = "checkpoint.json"
+CHECKPOINT_ACKED_EVENTS = 4096
+"""Most recently acked event ids kept for the checkpoint."""
+
+
+class CheckpointError(Exception): ...
+
+
+class LinkStatsCheckpoint(BaseModel):
+    num_received_by_type: dict[str, int] = Field(default_factory=dict)
+    num_received_by_topic: dict[str, int] = Field(default_factory=dict)
+    comm_event_counts: dict[str, int] = Field(default_factory=dict)
+    reuploads_started: int = 0
+    reuploads_completed: int = 0
+    reupload_events_expired: int = 0
+    timeouts: int = 0
+
+    @classmethod
+    def from_stats(cls, stats: LinkStats) -> "LinkStatsCheckpoint":
+        return LinkStatsCheckpoint(
+            num_received_by_type=dict(stats.num_received_by_type),
+            num_received_by_topic=dict(stats.num_received_by_topic),
+            comm_event_counts=dict(stats.comm_event_counts),
+            reuploads_started=stats.reupload_counts.started,
+            reuploads_completed=stats.reupload_counts.completed,
+            reupload_events_expired=stats.reupload_counts.expired,
+            timeouts=stats.timeouts,
+        )
+
+    def restore(self, stats: LinkStats) -> None:
+        """Add the checkpointed counts to stats."""
+        for key, count in self.num_received_by_type.items():
+            stats.num_received_by_type[key] += count
+        for key, count in self.num_received_by_topic.items():
+            stats.num_received_by_topic[key] += count
+        for key, count in self.comm_event_counts.items():
+            stats.comm_event_counts[key] += count
+        stats.reupload_counts.started += self.reuploads_started
+        stats.reupload_counts.completed += self.reuploads_completed
+        stats.reupload_counts.expired += self.reupload_events_expired
+        stats.timeouts += self.timeouts
+
+
+class ProactorCheckpoint(BaseModel):
+    saved_at: float = Field(default_factory=time.time)
+    """time.time() when the checkpoint was made."""
+    acked_event_ids: list[str] = Field(default_factory=list)
+    """Most recently acked persisted events, oldest first."""
+    num_events_received: int = 0
+    num_received_by_type: dict[str, int] = Field(default_factory=dict)
+    num_received_by_topic: dict[str, int] = Field(default_factory=dict)
+    links: dict[str, LinkStatsCheckpoint] = Field(default_factory=dict)
+
+    @classmethod
+    def from_stats(
+        cls, stats: ProactorStats, acked_event_ids: list[str]
+    ) -> "ProactorCheckpoint":
+        return ProactorCheckpoint(
+            acked_event_ids=acked_event_ids,
+            num_events_received=stats.num_events_received,
+            num_received_by_type=dict(stats.num_received_by_type),
+            num_received_by_topic=dict(stats.num_received_by_topic),
+            links={
+                link_name: LinkStatsCheckpoint.from_stats(link_stats)
+                for link_name, link_stats in stats.links.items()
+            },
+        )
+
+    def restore(self, stats: ProactorStats) -> None:
+        """Add the checkpointed counts to stats. Counts of links which no
+        longer exist are dropped."""
+        stats.num_events_received += self.num_events_received
+        for key, count in self.num_received_by_type.items():
+            stats.num_received_by_type[key] += count
+        for key, count in self.num_received_by_topic.items():
+            stats.num_received_by_topic[key] += count
+        for link_name, link_checkpoint in self.links.items():
+            if stats.has_link(link_name):
+                link_checkpoint.restore(stats.link(link_name))
+
+
+def save_checkpoint(
+    path: Path, checkpoint: ProactorCheckpoint
+) -> Result[bool, Problems]:
+    """Write checkpoint to path, replacing any previous checkpoint only once
+    the new one is completely written."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open("w") as f:
+            f.write(checkpoint.model_dump_json())
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(path)
+    except Exception as e:  # noqa: BLE001
+        return Err(
+            Problems().add_error(e).add_error(CheckpointError(f"Saving {path} failed"))
+        )
+    return Ok()
+
+
+def load_checkpoint(path: Path) -> Result[Optional[ProactorCheckpoint], Problems]:
+    """Return the checkpoint saved at path, or None if there is none."""
+    try:
+        if not path.exists():
+            return Ok(None)
+        return Ok(ProactorCheckpoint.model_validate_json(path.read_bytes()))
+    except Exception as e:  # noqa: BLE001
+        return Err(
+            Problems().add_error(e).add_error(CheckpointError(f"Loading {path} failed"))
+        )
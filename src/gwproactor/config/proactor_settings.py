@@ -4,13 +4,73 @@ MQTT_LINK_POLL_SECONDS = 60.0
 ACK_TIMEOUT_SECONDS = 5.0
 NUM_INITIAL_EVENT_REUPLOADS: int = 5
 NUM_INFLIGHT_EVENTS: int = 50
+INFLIGHT_EVENTS_MAX_BYTES: int = 1024 * 1024
+TIERED_PERSISTER_MAX_AGE_SECONDS = 60.0
+EVENT_BATCH_MAX_BYTES: int = 64 * 1024
+ACK_COALESCE_SECONDS = 0.05
 
 
 class ProactorSettings(BaseSettings):
     mqtt_link_poll_seconds: float = MQTT_LINK_POLL_SECONDS
     ack_timeout_seconds: float = ACK_TIMEOUT_SECONDS
     num_initial_event_reuploads: int = NUM_INITIAL_EVENT_REUPLOADS
+    reupload_window_max: int = 0
+    """If greater than num_initial_event_reuploads, the number of reuploaded
+    events awaiting acks at once grows on timely acks, up to this many, and
+    shrinks on ack timeouts and slowing acks, down to reupload_window_min.
+    Otherwise it stays num_initial_event_reuploads. See
+    gwproactor.links.reuploads."""
+    reupload_window_min: int = 1
+    reupload_prefetch_events: int = 0
+    """If non-zero, keep the content of up to this many of the events a
+    reupload will send next in memory, read ahead of their acks. See
+    gwproactor.links.reupload_prefetch."""
     num_inflight_events: int = NUM_INFLIGHT_EVENTS
+    inflight_events_max_bytes: int = INFLIGHT_EVENTS_MAX_BYTES
+    """Most bytes of serialized events held in memory awaiting acks, rather
+    than persisted."""
+    inflight_events_min_bytes: int = 0
+    """If non-zero and less than inflight_events_max_bytes, the in-flight
+    byte limit adapts to event rate and ack latency within these bounds.
+    Otherwise it stays inflight_events_max_bytes. See
+    gwproactor.links.in_flight."""
+    threaded_persister: bool = False
+    """Run event persister disk I/O in a dedicated thread, off the event loop.
+    See gwproactor.persister.threaded."""
+    tiered_persister_bytes: int = 0
+    """If non-zero, keep up to this many bytes of the newest events in memory,
+    writing them to the event persister only when the buffer fills, after
+    tiered_persister_max_age_seconds, or at shutdown. See
+    gwproactor.persister.tiered."""
+    tiered_persister_max_age_seconds: float = TIERED_PERSISTER_MAX_AGE_SECONDS
+    event_batch_max_events: int = 0
+    """If greater than 1, send reuploaded events upstream up to this many,
+    and up to event_batch_max_bytes, per EventBatch message, each answered
+    by one BatchAck. The upstream peer must understand EventBatch. See
+    gwproactor.links.event_batch."""
+    event_batch_max_bytes: int = EVENT_BATCH_MAX_BYTES
+    persist_wire_messages: bool = False
+    """Persist events as the complete upstream Message, so that reupload
+    publishes the stored bytes without decoding and re-encoding them. See
+    gwproactor.links.wire."""
+    uplink_bytes_per_second: float = 0.0
+    """If non-zero, limit the bytes published per second on each link,
+    queueing messages by priority, so that reuploads yield to live traffic.
+    See gwproactor.links.uplink_scheduler."""
+    uplink_messages_per_second: float = 0.0
+    """If non-zero, limit the messages published per second on each link.
+    See gwproactor.links.uplink_scheduler."""
+    uplink_burst_seconds: float = 1.0
+    """How many seconds' worth of the uplink rates may be sent at once."""
+    ack_coalesce_max_ids: int = 0
+    """If greater than 1, answer messages on each link with one MultiAck of
+    up to this many ids, sent at most ack_coalesce_seconds after the first.
+    The peer must understand MultiAck. See gwproactor.links.ack_coalescer."""
+    ack_coalesce_seconds: float = ACK_COALESCE_SECONDS
+    checkpoint_seconds: float = 0.0
+    """If non-zero, save acked events and stats counters to the data
+    directory this often, and at shutdown, and restore them at startup, so
+    that a restart resumes where it left off. See gwproactor.checkpoint."""
 
     model_config = SettingsConfigDict(
         env_prefix="PROACTOR_",
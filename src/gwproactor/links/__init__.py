@@ -1,3 +1,4 @@
+from gwproactor.links.ack_coalescer import AckCoalescer
 from gwproactor.links.acks import (
     DEFAULT_ACK_DELAY,
     AckManager,
@@ -19,12 +20,19 @@ from gwproactor.links.link_state import (
 )
 from gwproactor.links.message_times import LinkMessageTimes, MessageTimes
 from gwproactor.links.mqtt import QOS, MQTTClients, MQTTClientWrapper, Subscription
-from gwproactor.links.reuploads import Reuploads
+from gwproactor.links.reupload_prefetch import ReuploadPrefetch
+from gwproactor.links.reuploads import Reuploads, ReuploadWindow
 from gwproactor.links.timer_interface import TimerManagerInterface
+from gwproactor.links.uplink_scheduler import (
+    TokenBucket,
+    UplinkPriority,
+    UplinkScheduler,
+)
 
 __all__ = [
     "DEFAULT_ACK_DELAY",
     "QOS",
+    "AckCoalescer",
     "AckManager",
     "AckTimerCallback",
     "AckWaitInfo",
@@ -40,11 +48,16 @@ __all__ = [
     "MQTTClientWrapper",
     "MQTTClients",
     "MessageTimes",
+    "ReuploadPrefetch",
+    "ReuploadWindow",
     "Reuploads",
     "RuntimeLinkStateError",
     "StateName",
     "Subscription",
     "TimerManagerInterface",
+    "TokenBucket",
     "Transition",
     "TransitionName",
+    "UplinkPriority",
+    "UplinkScheduler",
 ]
@@ -0,0 +1,77 @@
+"""Acks of many messages in one message.
+
+By default every received message with AckRequired is answered at once by
+its own Ack. On a busy link that is half of the messages sent. If
+ProactorSettings.ack_coalesce_max_ids is greater than 1, LinkManager instead
+collects the ids to be acked on each link in an AckCoalescer, and sends them
+in one MultiAck once ack_coalesce_max_ids ids are waiting or
+ack_coalesce_seconds after the first of them, whichever comes first. A
+single id is still sent as a plain Ack.
+
+ack_coalesce_seconds is added to the peer's ack latency, so it must stay well
+below the peer's ack timeout. Ids waiting when the link goes down are
+dropped; the peer resends or reuploads those messages. The peer must be
+recent enough to understand MultiAck.
+"""
+
+from typing import Any, Callable, Optional
+
+from gwproactor.config.proactor_settings import ACK_COALESCE_SECONDS
+from gwproactor.links.timer_interface import TimerManagerInterface
+
+
+class AckCoalescer:
+    max_ids: int
+    window_seconds: float
+    _timer_manager: TimerManagerInterface
+    _send: Callable[[list[str]], None]
+    _message_ids: list[str]
+    _timer: Optional[Any] = None
+
+    def __init__(
+        self,
+        timer_manager: TimerManagerInterface,
+        send: Callable[[list[str]], None],
+        max_ids: int,
+        window_seconds: float = ACK_COALESCE_SECONDS,
+    ) -> None:
+        self._timer_manager = timer_manager
+        self._send = send
+        self.max_ids = max_ids
+        self.window_seconds = window_seconds
+        self._message_ids = []
+
+    def __len__(self) -> int:
+        return len(self._message_ids)
+
+    def add(self, message_id: str) -> None:
+        """Queue an ack of message_id, sending the queued acks if there are
+        now max_ids of them."""
+        self._message_ids.append(message_id)
+        if len(self._message_ids) >= self.max_ids:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self._timer_manager.start_timer(
+                self.window_seconds, self._window_elapsed
+            )
+
+    def flush(self) -> None:
+        """Send every queued ack now."""
+        if self._timer is not None:
+            self._timer_manager.cancel_timer(self._timer)
+            self._timer = None
+        if self._message_ids:
+            message_ids = self._message_ids
+            self._message_ids = []
+            self._send(message_ids)
+
+    def clear(self) -> None:
+        """Drop every queued ack, as when the link goes down."""
+        self._message_ids = []
+        if self._timer is not None:
+            self._timer_manager.cancel_timer(self._timer)
+            self._timer = None
+
+    def _window_elapsed(self) -> None:
+        self._timer = None
+        self.flush()
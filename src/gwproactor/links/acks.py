@@ -1,6 +1,6 @@
 import functools
 from dataclasses import dataclass
-from typing import Any, Callable, Optional
+from typing import Any, Callable, Optional, Sequence
 
 from gwproactor.links.timer_interface import TimerManagerInterface
 
@@ -79,6 +79,19 @@ class AckManager:
             self._timer_mgr.cancel_timer(wait_info.timer_handle)
         return wait_info
 
+    def cancel_ack_timers_for(
+        self, link_name: str, message_ids: Sequence[str]
+    ) -> list[AckWaitInfo]:
+        """Cancel the ack timers of message_ids, returning the wait info of
+        those that were waiting."""
+        wait_infos = []
+        if (client_acks := self._acks.get(link_name, None)) is not None:
+            for message_id in message_ids:
+                if (wait_info := client_acks.pop(message_id, None)) is not None:
+                    self._timer_mgr.cancel_timer(wait_info.timer_handle)
+                    wait_infos.append(wait_info)
+        return wait_infos
+
     def cancel_ack_timers(self, link_name: str) -> list[AckWaitInfo]:
         if link_name in self._acks:
             wait_infos = list(self._acks[link_name].values())
@@ -89,6 +102,11 @@ class AckManager:
             wait_infos = []
         return wait_infos
 
+    def waiting_for(self, link_name: str, message_id: str) -> bool:
+        if (client_acks := self._acks.get(link_name, None)) is not None:
+            return message_id in client_acks
+        return False
+
     def num_acks(self, link_name: str) -> int:
         if (client_acks := self._acks.get(link_name, None)) is not None:
             return len(client_acks)
@@ -0,0 +1,79 @@
+"""Many events in one upstream message.
+
+If ProactorSettings.event_batch_max_events is greater than 1, reuploaded
+events are not published one per message, each with its own ack timer and
+Ack. Instead they are packed, up to event_batch_max_events events or
+event_batch_max_bytes bytes, into the payload of one EventBatch message.
+The receiver answers with one BatchAck listing the MessageId of every event
+it accepted. The sender then clears each of those events, as it would for
+an Ack. Events in the batch which are not listed stay persisted, to be sent
+again by a later reupload.
+
+The batch payload is built by concatenating the JSON of the events, as
+persisted, so batching adds no decoding or encoding on the sender. The
+upstream peer must be recent enough to understand EventBatch.
+"""
+
+from typing import Optional
+
+from gwproactor.config.proactor_settings import EVENT_BATCH_MAX_BYTES
+from gwproactor.message import EventBatch
+
+_BATCH_PREFIX = b'{"Events":['
+_BATCH_SUFFIX = (
+    b'],"TypeName":"' + EventBatch.model_fields["TypeName"].default.encode() + b'"}'
+)
+
+
+class EventBatchBuilder:
+    """Collect the JSON of events to be sent in one EventBatch."""
+
+    max_events: int
+    max_bytes: int
+    _event_ids: list[str]
+    _event_jsons: list[bytes]
+    _num_bytes: int = 0
+
+    def __init__(self, max_events: int, max_bytes: int = EVENT_BATCH_MAX_BYTES) -> None:
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self._event_ids = []
+        self._event_jsons = []
+
+    def __len__(self) -> int:
+        return len(self._event_ids)
+
+    @property
+    def num_bytes(self) -> int:
+        return self._num_bytes
+
+    @property
+    def full(self) -> bool:
+        return len(self) >= self.max_events or self._num_bytes >= self.max_bytes
+
+    def fits(self, event_json: bytes) -> bool:
+        """Whether event_json can be added without exceeding max_bytes. An
+        empty batch takes any event, however large."""
+        return not self._event_ids or (
+            self._num_bytes + len(event_json) <= self.max_bytes
+        )
+
+    def add(self, event_id: str, event_json: bytes) -> None:
+        self._event_ids.append(event_id)
+        self._event_jsons.append(event_json)
+        self._num_bytes += len(event_json)
+
+    def take(self) -> Optional[tuple[list[str], bytes]]:
+        """Return the ids of the collected events and the EventBatch payload
+        JSON containing them, and empty the builder. Return None if the
+        builder is empty."""
+        if not self._event_ids:
+            return None
+        event_ids = self._event_ids
+        payload_json = b"".join(
+            [_BATCH_PREFIX, b",".join(self._event_jsons), _BATCH_SUFFIX]
+        )
+        self._event_ids = []
+        self._event_jsons = []
+        self._num_bytes = 0
+        return event_ids, payload_json
@@ -0,0 +1,157 @@
+"""Events published as they occur, held in memory until acked.
+
+While the upstream link is active, a new event is published at once and
+kept in memory, rather than persisted, until it is acked; if the link goes
+down first, the event is persisted then. Events that do not fit in memory
+are persisted at once. They are still published, and cleared from storage
+when acked.
+
+InFlightEvents holds these events in the form in which they would be
+persisted, so memory is counted in bytes and going down writes them without
+serializing them. It accepts an event while it holds fewer than max_events
+events and the bytes held stay within limit_bytes, or, if it is empty,
+within max_bytes.
+
+limit_bytes adapts to the link. The events that must be held to publish
+without touching storage are those arriving within one ack latency, so
+limit_bytes is HEADROOM times the arrival rate of event bytes times the
+smoothed ack latency, kept between min_bytes and max_bytes. On a fast link
+that is little memory; on a slow one, memory is bounded by max_bytes and
+the rest of the events are persisted. If min_bytes is zero, or not less
+than max_bytes, limit_bytes is simply max_bytes.
+"""
+
+import math
+import time
+from typing import Iterator, Optional
+
+HEADROOM = 2.0
+"""limit_bytes allows for this many ack latencies of event arrivals."""
+
+LATENCY_SMOOTHING = 0.125
+"""Weight of each ack latency sample in the smoothed latency."""
+
+RATE_TIME_CONSTANT_SECONDS = 10.0
+"""Time constant of the exponentially decaying event byte arrival rate."""
+
+
+class InFlightEvents:
+    max_events: int
+    max_bytes: int
+    min_bytes: int
+    _events: dict[str, tuple[bytes, float]]
+    """Serialized events, in the order added, with the time.monotonic() at
+    which they were added."""
+    _num_bytes: int = 0
+    _byte_rate: float = 0.0
+    _rate_updated_at: Optional[float] = None
+    _smoothed_latency: Optional[float] = None
+
+    def __init__(self, max_events: int, max_bytes: int, min_bytes: int = 0) -> None:
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.min_bytes = min_bytes
+        self._events = {}
+
+    @property
+    def adaptive(self) -> bool:
+        return 0 < self.min_bytes < self.max_bytes
+
+    @property
+    def num_bytes(self) -> int:
+        return self._num_bytes
+
+    @property
+    def byte_rate(self) -> float:
+        """Bytes of events arriving per second, decayed to now."""
+        return self._decayed_rate(time.monotonic())
+
+    @property
+    def smoothed_latency(self) -> Optional[float]:
+        """Smoothed seconds from adding an event to its ack."""
+        return self._smoothed_latency
+
+    @property
+    def limit_bytes(self) -> int:
+        if not self.adaptive or self._smoothed_latency is None:
+            return self.max_bytes
+        needed = HEADROOM * self.byte_rate * self._smoothed_latency
+        return int(min(max(needed, self.min_bytes), self.max_bytes))
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __contains__(self, event_id: str) -> bool:
+        return event_id in self._events
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._events)
+
+    def get(self, event_id: str) -> Optional[bytes]:
+        held = self._events.get(event_id)
+        return held[0] if held is not None else None
+
+    def add(self, event_id: str, event_bytes: bytes) -> bool:
+        """Hold event_bytes if they fit. Return whether they were added. Every
+        event offered counts towards the arrival rate."""
+        now = time.monotonic()
+        self._byte_rate = (
+            self._decayed_rate(now) + len(event_bytes) / RATE_TIME_CONSTANT_SECONDS
+        )
+        self._rate_updated_at = now
+        limit = self.limit_bytes if self._events else self.max_bytes
+        if (
+            len(self._events) >= self.max_events
+            or self._num_bytes + len(event_bytes) > limit
+        ):
+            return False
+        self._events[event_id] = (event_bytes, now)
+        self._num_bytes += len(event_bytes)
+        return True
+
+    def pop(self, event_id: str, *, acked: bool = True) -> Optional[bytes]:
+        """Remove and return the bytes held for event_id. If acked, the time
+        since it was added is a sample of the ack latency."""
+        held = self._events.pop(event_id, None)
+        if held is None:
+            return None
+        event_bytes, added_at = held
+        self._num_bytes -= len(event_bytes)
+        if acked:
+            latency = time.monotonic() - added_at
+            if self._smoothed_latency is None:
+                self._smoothed_latency = latency
+            else:
+                self._smoothed_latency += LATENCY_SMOOTHING * (
+                    latency - self._smoothed_latency
+                )
+        return event_bytes
+
+    def take_all(self) -> list[tuple[str, bytes]]:
+        """Remove and return every held event, oldest first."""
+        events = [
+            (event_id, event_bytes)
+            for event_id, (event_bytes, _) in self._events.items()
+        ]
+        self._events.clear()
+        self._num_bytes = 0
+        return events
+
+    def _decayed_rate(self, now: float) -> float:
+        if self._rate_updated_at is None:
+            return 0.0
+        return self._byte_rate * math.exp(
+            -(now - self._rate_updated_at) / RATE_TIME_CONSTANT_SECONDS
+        )
+
+    def __str__(self) -> str:
+        latency = (
+            f"{self._smoothed_latency * 1000:.1f} ms"
+            if self._smoothed_latency is not None
+            else "-"
+        )
+        return (
+            f"in-flight events: {len(self)} / {self.max_events}  "
+            f"bytes: {self._num_bytes} / {self.limit_bytes}  "
+            f"rate: {self.byte_rate:.0f} B/s  ack latency: {latency}"
+        )
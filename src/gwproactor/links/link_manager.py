@@ -1,9 +1,13 @@
 import asyncio
+import functools
 import json
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future  # noqa: TCH003
 from dataclasses import asdict, dataclass, field
 from typing import Any, Optional, Tuple
 
-from gwproto import Message, MQTTCodec, MQTTTopic
+from gwproto import Header, Message, MQTTCodec, MQTTTopic
 from gwproto.messages import (
     Ack,
     CommEvent,
@@ -13,17 +17,23 @@ from gwproto.messages import (
     MQTTDisconnectEvent,
     MQTTFullySubscribedEvent,
     PeerActiveEvent,
+    Ping,
     PingMessage,
     ProblemEvent,
     ResponseTimeoutEvent,
     StartupEvent,
 )
 from paho.mqtt.client import MQTTMessageInfo
+from pydantic import ValidationError
 from result import Err, Ok, Result
 
+from gwproactor.checkpoint import CHECKPOINT_ACKED_EVENTS
 from gwproactor.config import ProactorSettings
 from gwproactor.links import AckWaitInfo
+from gwproactor.links.ack_coalescer import AckCoalescer
 from gwproactor.links.acks import AckManager, AckTimerCallback
+from gwproactor.links.event_batch import EventBatchBuilder
+from gwproactor.links.in_flight import InFlightEvents
 from gwproactor.links.link_settings import LinkConfig
 from gwproactor.links.link_state import (
     InvalidCommStateInput,
@@ -34,15 +44,21 @@ from gwproactor.links.link_state import (
 )
 from gwproactor.links.message_times import LinkMessageTimes, MessageTimes
 from gwproactor.links.mqtt import QOS, MQTTClients, MQTTClientWrapper
-from gwproactor.links.reuploads import Reuploads
+from gwproactor.links.reupload_prefetch import RetrieveResults, ReuploadPrefetch
+from gwproactor.links.reuploads import Reuploads, ReuploadWindow
 from gwproactor.links.timer_interface import TimerManagerInterface
+from gwproactor.links.uplink_scheduler import UplinkPriority, UplinkScheduler
+from gwproactor.links.wire import encode_wire_message, split_wire_message
 from gwproactor.logger import LoggerOrAdapter, ProactorLogger
 from gwproactor.message import (
+    BatchAck,
+    EventBatch,
     MQTTConnectFailPayload,
     MQTTConnectPayload,
     MQTTDisconnectPayload,
     MQTTReceiptPayload,
     MQTTSubackPayload,
+    MultiAck,
 )
 from gwproactor.persister import (
     ByteDecodingError,
@@ -71,12 +87,31 @@ class LinkManager:
     _stats: ProactorStats
     _event_persister: PersisterInterface
     _reuploads: Reuploads
+    _reupload_prefetch: Optional[ReuploadPrefetch] = None
+    _reupload_epoch: int = 0
+    """Incremented when a reupload is stopped, so that content retrieved
+    for it in another thread is dropped."""
+    _loop: Optional[asyncio.AbstractEventLoop] = None
     _mqtt_clients: MQTTClients
     _mqtt_codecs: dict[str, MQTTCodec]
     _states: LinkStates
     _message_times: MessageTimes
     _acks: AckManager
-    _in_flight_events: dict[str, EventBase]
+    _timer_manager: TimerManagerInterface
+    _uplink_schedulers: dict[str, UplinkScheduler]
+    """Per link, if publishing is rate limited."""
+    _ack_coalescers: dict[str, AckCoalescer]
+    """Per link, if acks are coalesced."""
+    _in_flight_events: InFlightEvents
+    _event_batch: Optional[EventBatchBuilder] = None
+    """Reuploaded events not yet published, if events are sent in batches."""
+    _event_batches: dict[str, list[str]]
+    """Ids of the events in each EventBatch awaiting a BatchAck."""
+    _recently_acked: OrderedDict[str, None]
+    """Most recently acked persisted events, for the checkpoint."""
+    _restored_acked: set[str]
+    """Acked events from the checkpoint, not yet found while the persister
+    reindexes in the background."""
 
     def __init__(  # noqa: PLR0913, PLR0917
         self,
@@ -94,16 +129,38 @@ class LinkManager:
         self._settings = settings
         self._logger = logger
         self._stats = stats
-        self._in_flight_events = {}
+        self._in_flight_events = InFlightEvents(
+            settings.num_inflight_events,
+            settings.inflight_events_max_bytes,
+            settings.inflight_events_min_bytes,
+        )
+        self._event_batches = {}
+        self._recently_acked = OrderedDict()
+        self._restored_acked = set()
+        if settings.event_batch_max_events > 1:
+            self._event_batch = EventBatchBuilder(
+                settings.event_batch_max_events, settings.event_batch_max_bytes
+            )
         self._event_persister = event_persister
         self._reuploads = Reuploads(
             self._logger,
+            self._event_persister,
             self._settings.num_initial_event_reuploads,
+            excluded=self._sent_outside_reupload,
+            min_window=self._settings.reupload_window_min,
+            max_window=self._settings.reupload_window_max,
         )
+        if settings.reupload_prefetch_events > 0:
+            self._reupload_prefetch = ReuploadPrefetch(
+                self._event_persister, settings.reupload_prefetch_events
+            )
         self._mqtt_clients = MQTTClients()
         self._mqtt_codecs = {}
         self._states = LinkStates()
         self._message_times = MessageTimes()
+        self._timer_manager = timer_manager
+        self._uplink_schedulers = {}
+        self._ack_coalescers = {}
         self._acks = AckManager(
             timer_manager, ack_timeout_callback, delay=settings.ack_timeout_seconds
         )
@@ -128,6 +185,14 @@ class LinkManager:
     def num_reuploaded_unacked(self) -> int:
         return self._reuploads.num_reuploaded_unacked
 
+    @property
+    def reupload_prefetch(self) -> Optional[ReuploadPrefetch]:
+        return self._reupload_prefetch
+
+    @property
+    def reupload_window(self) -> ReuploadWindow:
+        return self._reuploads.window
+
     @property
     def ack_manager(self) -> AckManager:
         return self._acks
@@ -205,6 +270,25 @@ class LinkManager:
         self._states.add(settings.client_name)
         self._message_times.add_link(settings.client_name)
         self._stats.add_link(settings.client_name)
+        if (
+            self._settings.uplink_bytes_per_second
+            or self._settings.uplink_messages_per_second
+        ):
+            scheduler = UplinkScheduler(
+                self._timer_manager,
+                bytes_per_second=self._settings.uplink_bytes_per_second,
+                messages_per_second=self._settings.uplink_messages_per_second,
+                burst_seconds=self._settings.uplink_burst_seconds,
+            )
+            self._uplink_schedulers[settings.client_name] = scheduler
+            self._stats.link(settings.client_name).uplink = scheduler.counts
+        if self._settings.ack_coalesce_max_ids > 1:
+            self._ack_coalescers[settings.client_name] = AckCoalescer(
+                self._timer_manager,
+                functools.partial(self._send_acks, settings.client_name),
+                max_ids=self._settings.ack_coalesce_max_ids,
+                window_seconds=self._settings.ack_coalesce_seconds,
+            )
         self.subscribe(
             client=settings.client_name,
             topic=settings.subscription_topic(
@@ -240,6 +324,12 @@ class LinkManager:
         if self._logger.lifecycle_enabled:
             self._logger.lifecycle(self.subscription_str(tag=tag))
 
+    def uplink_scheduler(self, link_name: str) -> Optional[UplinkScheduler]:
+        return self._uplink_schedulers.get(link_name)
+
+    def ack_coalescer(self, link_name: str) -> Optional[AckCoalescer]:
+        return self._ack_coalescers.get(link_name)
+
     def get_reuploads_str(self, verbose: bool = True, num_events: int = 5) -> str:  # noqa: FBT001, FBT002
         return self._reuploads.get_str(verbose=verbose, num_events=num_events)
 
@@ -252,7 +342,11 @@ class LinkManager:
         *,
         topic: str = "",
         use_link_topic: bool = False,
+        priority: Optional[UplinkPriority] = None,
     ) -> MQTTMessageInfo:
+        """If the link is rate limited, the message is sent when priority and
+        the rate allow; by default acks and pings are sent at once and other
+        messages are live. See gwproactor.links.uplink_scheduler."""
         if topic and use_link_topic:
             raise ValueError(
                 f"Error. Specify at most one of use_link_topic "
@@ -269,26 +363,69 @@ class LinkManager:
             )
         elif not topic:
             topic = message.mqtt_topic()
-        payload = self._mqtt_codecs[link_name].encode(message)
-        self._logger.message_summary(
-            direction="OUT mqtt    ",
-            src=message.Header.Src,
-            dst=message.Header.Dst,
-            topic=topic,
+        if priority is None:
+            priority = (
+                UplinkPriority.control
+                if isinstance(message.Payload, (Ack, BatchAck, MultiAck, Ping))
+                else UplinkPriority.live
+            )
+        return self._publish_encoded(
+            link_name,
+            message.Header,
+            topic,
+            self._mqtt_codecs[link_name].encode(message),
+            qos=qos,
+            context=context,
             payload_object=message.Payload,
             message_id=message.Payload.AckMessageID
             if isinstance(message.Payload, Ack)
             else message.Header.MessageId,
+            priority=priority,
         )
-        if message.Header.AckRequired:
-            self._acks.start_ack_timer(
-                link_name, message.Header.MessageId, context=context
+
+    def _publish_encoded(  # noqa: PLR0913
+        self,
+        link_name: str,
+        header: Header,
+        topic: str,
+        payload: bytes,
+        *,
+        qos: int = 0,
+        context: Any = None,
+        payload_object: Any = None,
+        message_id: str = "",
+        priority: UplinkPriority = UplinkPriority.live,
+    ) -> MQTTMessageInfo:
+        def send() -> MQTTMessageInfo:
+            self._logger.message_summary(
+                direction="OUT mqtt    ",
+                src=header.Src,
+                dst=header.Dst,
+                topic=topic,
+                payload_object=payload_object,
+                message_id=message_id,
             )
-        self._message_times.update_send(link_name)
-        return self._mqtt_clients.publish(link_name, topic, payload, qos)
+            if header.AckRequired:
+                self._acks.start_ack_timer(link_name, header.MessageId, context=context)
+            self._message_times.update_send(link_name)
+            return self._mqtt_clients.publish(link_name, topic, payload, qos)
+
+        scheduler = self._uplink_schedulers.get(link_name)
+        if scheduler is None:
+            return send()
+        return scheduler.publish(
+            priority,
+            len(payload),
+            send,
+            message_id=header.MessageId if header.AckRequired else "",
+        )
 
     def publish_upstream(
-        self, payload: Any, qos: QOS = QOS.AtMostOnce, **message_args: Any
+        self,
+        payload: Any,
+        qos: QOS = QOS.AtMostOnce,
+        priority: Optional[UplinkPriority] = None,
+        **message_args: Any,
     ) -> MQTTMessageInfo:
         message = Message[Any](
             Src=self.publication_name,
@@ -297,9 +434,125 @@ class LinkManager:
             **message_args,
         )
         return self.publish_message(
-            self._mqtt_clients.upstream_client, message, qos=qos
+            self._mqtt_clients.upstream_client, message, qos=qos, priority=priority
+        )
+
+    def _upstream_header(self, event: EventBase) -> Header:
+        """Return the Header with which publish_upstream() sends event."""
+        return Header(
+            Src=self.publication_name,
+            Dst=self._mqtt_clients.upstream_topic_dst,
+            MessageType=event.TypeName,
+            MessageId=event.MessageId,
+            AckRequired=True,
+        )
+
+    def _event_bytes(self, event: EventBase) -> bytes:
+        """Return the bytes to persist for event: its JSON or, if
+        settings.persist_wire_messages, the JSON of the complete upstream
+        message. See gwproactor.links.wire."""
+        event_bytes = event.model_dump_json().encode(PERSISTER_ENCODING)
+        if self._settings.persist_wire_messages and self._mqtt_clients.upstream_client:
+            return encode_wire_message(self._upstream_header(event), event_bytes)
+        return event_bytes
+
+    def _wire_message(
+        self, event_id: str, event_bytes: bytes
+    ) -> Optional[tuple[Header, bytes]]:
+        """Return the Header and payload JSON of event_bytes if they were
+        persisted as a complete upstream message that can still be published
+        as is."""
+        split = split_wire_message(event_bytes)
+        if split is not None:
+            header = split[0]
+            if (
+                header.MessageId == event_id
+                and header.Src == self.publication_name
+                and header.Dst == self._mqtt_clients.upstream_topic_dst
+            ):
+                return split
+        return None
+
+    @classmethod
+    def _decoded_event(cls, decoded: Any) -> Any:
+        """Return the event in JSON decoded from storage. A complete upstream
+        message, whose header no longer matches this link, is unwrapped."""
+        if (
+            isinstance(decoded, dict)
+            and decoded.get("TypeName") == Message.type_name()
+            and "Payload" in decoded
+        ):
+            return decoded["Payload"]
+        return decoded
+
+    def _publish_upstream_wire(self, header: Header, event_bytes: bytes) -> None:
+        """Publish event_bytes, persisted as a complete upstream message,
+        without decoding them."""
+        link_name = self._mqtt_clients.upstream_client
+        self._publish_encoded(
+            link_name,
+            header,
+            MQTTTopic.encode(
+                envelope_type=Message.type_name(),
+                src=header.Src,
+                dst=header.Dst,
+                message_type=header.MessageType,
+            ),
+            self._mqtt_codecs[link_name].encode(event_bytes),
+            message_id=header.MessageId,
+            priority=UplinkPriority.reupload,
         )
 
+    def _send_reupload_wire(
+        self, event_id: str, wire_message: tuple[Header, bytes], event_bytes: bytes
+    ) -> None:
+        if self._event_batch is not None:
+            self._add_to_event_batch(event_id, wire_message[1])
+        else:
+            self._publish_upstream_wire(wire_message[0], event_bytes)
+
+    def _send_reupload_decoded(
+        self, event_id: str, event_bytes: bytes, decoded: Any
+    ) -> None:
+        event = self._decoded_event(decoded)
+        if self._event_batch is not None:
+            if event is not decoded:
+                event_bytes = json.dumps(event, separators=(",", ":")).encode(
+                    PERSISTER_ENCODING
+                )
+            self._add_to_event_batch(event_id, event_bytes)
+        else:
+            self.publish_upstream(
+                event, priority=UplinkPriority.reupload, AckRequired=True
+            )
+
+    def _add_to_event_batch(self, event_id: str, event_json: bytes) -> None:
+        if self._event_batch is None:
+            return
+        if not self._event_batch.fits(event_json):
+            self._flush_event_batch()
+        self._event_batch.add(event_id, event_json)
+        if self._event_batch.full:
+            self._flush_event_batch()
+
+    def _flush_event_batch(self) -> None:
+        """Publish any events collected for an EventBatch."""
+        if self._event_batch is None or (batch := self._event_batch.take()) is None:
+            return
+        event_ids, payload_json = batch
+        header = Header(
+            Src=self.publication_name,
+            Dst=self._mqtt_clients.upstream_topic_dst,
+            MessageType=EventBatch.model_fields["TypeName"].default,
+            MessageId=str(uuid.uuid4()),
+            AckRequired=True,
+        )
+        self._event_batches[header.MessageId] = event_ids
+        self._logger.path(
+            "  publishing EventBatch %s  events: %d", header.MessageId, len(event_ids)
+        )
+        self._publish_upstream_wire(header, encode_wire_message(header, payload_json))
+
     def generate_event(self, event: EventT) -> Result[bool, Exception]:
         path_dbg = 0
         error_count = 0
@@ -331,21 +584,18 @@ class LinkManager:
             and self._states[self._mqtt_clients.upstream_client].active()
         ):
             path_dbg |= 0x00000008
-            if len(self._in_flight_events) >= self._settings.num_inflight_events:
+            event_bytes = self._event_bytes(event)
+            if not self._in_flight_events.add(event.MessageId, event_bytes):
                 path_dbg |= 0x00000010
-                result = self._event_persister.persist(
-                    event.MessageId,
-                    event.model_dump_json().encode(PERSISTER_ENCODING),
-                )
+                result = self._event_persister.persist(event.MessageId, event_bytes)
             else:
                 path_dbg |= 0x00000020
-                self._in_flight_events[event.MessageId] = event
                 result = Ok()
             self.publish_upstream(event, AckRequired=True)
         else:
             path_dbg |= 0x00000040
             result = self._event_persister.persist(
-                event.MessageId, event.model_dump_json().encode(PERSISTER_ENCODING)
+                event.MessageId, self._event_bytes(event)
             )
             match result:
                 case Err(problems):
@@ -368,11 +618,74 @@ class LinkManager:
 
     def _start_reupload(self) -> None:
         if not self._reuploads.reuploading():
-            self._continue_reupload(
-                self._reuploads.start_reupload(self._event_persister.pending_ids())
-            )
+            self._continue_reupload(self._reuploads.start_reupload())
+
+    def extend_reupload(self) -> None:
+        """Add persisted events not yet known to the reupload, such as those
+        found by a background reindex, to the reupload. Events that are in
+        flight or awaiting an ack are not added."""
+        if self._restored_acked:
+            self._clear_restored_acked()
+        upstream_client = self._mqtt_clients.upstream_client
+        if upstream_client and self._states[upstream_client].active():
+            self._continue_reupload(self._reuploads.extend_reupload())
+
+    def recently_acked(self) -> list[str]:
+        """Return the most recently acked persisted events, oldest first."""
+        return list(self._recently_acked)
+
+    def _remember_acked(self, event_ids: list[str]) -> None:
+        for event_id in event_ids:
+            self._recently_acked[event_id] = None
+        while len(self._recently_acked) > CHECKPOINT_ACKED_EVENTS:
+            self._recently_acked.popitem(last=False)
 
-    def _continue_reupload(self, event_ids: list[str]) -> None:
+    def restore_acked(self, event_ids: list[str]) -> int:
+        """Clear events acked before a restart that are still persisted, and
+        return how many there were. While the persister reindexes in the
+        background, events it has not yet found are cleared as
+        extend_reupload() finds them."""
+        self._remember_acked(event_ids)
+        self._restored_acked = set(event_ids)
+        return self._clear_restored_acked()
+
+    def _clear_restored_acked(self) -> int:
+        found = [
+            event_id
+            for event_id in self._restored_acked
+            if event_id in self._event_persister
+        ]
+        if found:
+            self._event_persister.clear_many(found)
+        if self._event_persister.reindexing:
+            self._restored_acked.difference_update(found)
+        else:
+            self._restored_acked = set()
+        return len(found)
+
+    def _sent_outside_reupload(self, event_id: str) -> bool:
+        """Events in flight, awaiting an ack or queued in the uplink
+        scheduler were sent as they occurred, so are not part of a
+        reupload."""
+        if event_id in self._in_flight_events:
+            return True
+        upstream_client = self._mqtt_clients.upstream_client
+        if not upstream_client:
+            return False
+        scheduler = self._uplink_schedulers.get(upstream_client)
+        return self._acks.waiting_for(upstream_client, event_id) or bool(
+            scheduler and scheduler.queued(event_id)
+        )
+
+    def _continue_reupload(  # noqa: C901, PLR0912, PLR0915
+        self,
+        event_ids: list[str],
+        retrieved: Optional[tuple[set[str], RetrieveResults]] = None,
+    ) -> None:
+        """Send event_ids, which the reupload has marked as sent. Their
+        content is retrieved first, unless already retrieved. If it must be
+        read in the persister's I/O thread, sending resumes on the event loop
+        once it arrives."""
         self._logger.path("++_continue_reupload  %d", len(event_ids))
         path_dbg = 0
         tried_count_dbg = 0
@@ -389,12 +702,32 @@ class LinkManager:
                 continuation_path_dbg = 0x00000002
                 continuation_count_dbg += 1
                 next_event_ids = []
+                failed_event_ids = []
+                if retrieved is None:
+                    expired_event_ids, retrieving = self._retrieve_unexpired(event_ids)
+                    if not retrieving.done() and self._loop is not None:
+                        path_dbg |= 0x00000800
+                        self._continue_reupload_when_retrieved(
+                            event_ids, expired_event_ids, retrieving
+                        )
+                        break
+                    retrieved = expired_event_ids, retrieving.result()
+                expired_event_ids, contents = retrieved
+                retrieved = None
                 for event_id in event_ids:
                     event_path_dbg = 0x00000004
                     tried_count_dbg += 1
+                    if event_id in expired_event_ids:
+                        event_path_dbg |= 0x00000400
+                        next_event_ids.extend(
+                            self._skip_expired_event(event_id, sent_one=sent_one)
+                        )
+                        self._logger.path("  1 event path:0x%08X", event_path_dbg)
+                        continuation_path_dbg |= event_path_dbg
+                        continue
                     problems = Problems()
 
-                    match ret := self._reupload_event(event_id):
+                    match ret := self._reupload_event(event_id, contents[event_id]):
                         case Ok():
                             event_path_dbg |= 0x00000008
                             if ret.value:
@@ -417,20 +750,28 @@ class LinkManager:
                                 f"Event decoding error - uid:{event_id}"
                             )
                         )
-                        self._event_persister.clear(event_id)
+                        failed_event_ids.append(event_id)
                         if sent_one:
                             event_path_dbg |= 0x00000100
                             self._reuploads.clear_unacked_event(event_id)
                         else:
                             event_path_dbg |= 0x00000200
                             next_event_ids.extend(
-                                self._reuploads.process_ack_for_reupload(event_id)
+                                self._reuploads.process_ack_for_reupload(
+                                    event_id, sent=False
+                                )
                             )
                     self._logger.path("  1 event path:0x%08X", event_path_dbg)
                     continuation_path_dbg |= event_path_dbg
+                self._flush_event_batch()
+                if failed_event_ids:
+                    self._event_persister.clear_many(failed_event_ids)
+                if expired_event_ids:
+                    self._clear_expired_events(list(expired_event_ids))
                 self._logger.path("  1 continuation path:0x%08X", continuation_path_dbg)
                 event_ids = next_event_ids
                 path_dbg |= continuation_path_dbg
+        self._refill_reupload_prefetch()
         self._logger.path(
             "--_continue_reupload  path:0x%08X  sent:%d  tried:%d  continuations:%d",
             path_dbg,
@@ -439,8 +780,81 @@ class LinkManager:
             continuation_count_dbg,
         )
 
-    def _reupload_event(self, event_id: str) -> Result[bool, Problems]:
-        """Load event for event_id from storage, decoded to JSON and send it.
+    def _retrieve_unexpired(
+        self, event_ids: list[str]
+    ) -> tuple[set[str], "Future[RetrieveResults]"]:
+        """Return the expired event_ids and start retrieving the content of
+        the others. Events older than the persister's retention are not worth
+        uploading; they are dropped without being read or decoded."""
+        expired_event_ids = {
+            event_id
+            for event_id in event_ids
+            if self._event_persister.expired(event_id)
+        }
+        unexpired = [
+            event_id for event_id in event_ids if event_id not in expired_event_ids
+        ]
+        if self._reupload_prefetch is not None:
+            return expired_event_ids, self._reupload_prefetch.retrieve_many_later(
+                unexpired
+            )
+        return expired_event_ids, self._event_persister.retrieve_many_later(unexpired)
+
+    def _continue_reupload_when_retrieved(
+        self,
+        event_ids: list[str],
+        expired_event_ids: set[str],
+        retrieving: "Future[RetrieveResults]",
+    ) -> None:
+        """Continue sending event_ids on the event loop once their content,
+        read in another thread, arrives, unless the reupload stopped in the
+        meantime."""
+        loop = self._loop
+        if loop is None:
+            return
+        epoch = self._reupload_epoch
+
+        def resume() -> None:
+            if epoch != self._reupload_epoch or not self._reuploads.reuploading():
+                return
+            try:
+                contents = retrieving.result()
+            except Exception as e:  # noqa: BLE001
+                contents = {
+                    event_id: Err(Problems().add_error(e)) for event_id in event_ids
+                }
+            self._continue_reupload(event_ids, (expired_event_ids, contents))
+
+        retrieving.add_done_callback(lambda _: loop.call_soon_threadsafe(resume))
+
+    def _refill_reupload_prefetch(self) -> None:
+        if self._reupload_prefetch is None:
+            return
+        if not self._reuploads.reuploading():
+            self._reupload_prefetch.clear()
+        elif self._reupload_prefetch.needs_refill:
+            self._reupload_prefetch.refill(
+                self._reuploads.upcoming(self._reupload_prefetch.max_events)
+            )
+
+    def _skip_expired_event(self, event_id: str, *, sent_one: bool) -> list[str]:
+        """Treat an expired event as acked. Return any events to send next."""
+        if sent_one:
+            self._reuploads.clear_unacked_event(event_id)
+            return []
+        return self._reuploads.process_ack_for_reupload(event_id, sent=False)
+
+    def _clear_expired_events(self, event_ids: list[str]) -> None:
+        self._event_persister.clear_many(event_ids)
+        if self._reuploads.stats is not None:
+            self._reuploads.stats.expire_reupload_events(len(event_ids))
+
+    def _reupload_event(
+        self, event_id: str, retrieved: Result[Optional[bytes], Problems]
+    ) -> Result[bool, Problems]:
+        """Decode event for event_id, retrieved from storage, to JSON and send it.
+        An event persisted as a complete upstream message is sent without
+        decoding it.
 
         Return either Ok(True) or Err(Problems(list of decoding errors)).
 
@@ -450,7 +864,7 @@ class LinkManager:
         self._logger.path("++_reupload_event  %s", event_id)
         path_dbg = 0
         problems = Problems()
-        match self._event_persister.retrieve(event_id):
+        match retrieved:
             case Ok(event_bytes):
                 path_dbg |= 0x00000001
                 if event_bytes is None:
@@ -463,6 +877,13 @@ class LinkManager:
                     problems.add_error(
                         FileEmptyWarning("reupload_events", uid=event_id)
                     )
+                elif (
+                    wire_message := self._wire_message(event_id, event_bytes)
+                ) is not None:
+                    path_dbg |= 0x00000200
+                    self._send_reupload_wire(event_id, wire_message, event_bytes)
+                    self._logger.path("--_reupload_event:1  path:0x%08X", path_dbg)
+                    return Ok(value=True)
                 else:
                     path_dbg |= 0x00000008
                     try:
@@ -486,7 +907,7 @@ class LinkManager:
                             )
                         else:
                             path_dbg |= 0x00000080
-                            self.publish_upstream(event, AckRequired=True)
+                            self._send_reupload_decoded(event_id, event_bytes, event)
                             self._logger.path(
                                 "--_reupload_event:1  path:0x%08X", path_dbg
                             )
@@ -501,6 +922,7 @@ class LinkManager:
         self, loop: asyncio.AbstractEventLoop, async_queue: asyncio.Queue[Any]
     ) -> None:
         self._logger.path("++LinkManager.start")
+        self._loop = loop
         if self.upstream_client:
             self._reuploads.stats = self._stats.link(self.upstream_client)
         self._mqtt_clients.start(loop, async_queue)
@@ -550,17 +972,26 @@ class LinkManager:
                         message.Payload.client_name
                     )
                     self._reuploads.clear()
+                    self._reupload_epoch += 1
+                    self._event_batches.clear()
+                    if self._reupload_prefetch is not None:
+                        self._reupload_prefetch.clear()
+                    self._clear_uplink(message.Payload.client_name)
                     self.flush_in_flight_events()
             case _:
                 result = state_result
         return result
 
+    def _clear_uplink(self, link_name: str) -> None:
+        """Drop messages and acks queued for a link that is no longer active.
+        Events among them remain persisted or in flight."""
+        if (scheduler := self._uplink_schedulers.get(link_name)) is not None:
+            scheduler.clear()
+        if (coalescer := self._ack_coalescers.get(link_name)) is not None:
+            coalescer.clear()
+
     def flush_in_flight_events(self) -> None:
-        for event_id, event in self._in_flight_events.items():
-            self._event_persister.persist(
-                event_id, event.model_dump_json().encode(PERSISTER_ENCODING)
-            )
-        self._in_flight_events.clear()
+        self._event_persister.persist_many(self._in_flight_events.take_all())
 
     def process_mqtt_connect_fail(
         self, message: Message[MQTTConnectFailPayload]
@@ -589,6 +1020,9 @@ class LinkManager:
         )
         path_dbg = 0
         self._stats.link(wait_info.link_name).timeouts += 1
+        self._event_batches.pop(wait_info.message_id, None)
+        if wait_info.link_name == self._mqtt_clients.upstream_client:
+            self._reuploads.process_ack_timeout()
         result: Result[LinkManagerTransition, Exception]
         match state_result := self._states.process_ack_timeout(wait_info.link_name):
             case Ok():
@@ -600,6 +1034,11 @@ class LinkManager:
                     path_dbg |= 0x00000002
                     self.flush_in_flight_events()
                     self._reuploads.clear()
+                    self._reupload_epoch += 1
+                    self._event_batches.clear()
+                    if self._reupload_prefetch is not None:
+                        self._reupload_prefetch.clear()
+                    self._clear_uplink(wait_info.link_name)
                     self.generate_event(
                         ResponseTimeoutEvent(PeerName=transition.link_name)
                     )
@@ -630,6 +1069,7 @@ class LinkManager:
             elif message_id in self._event_persister:
                 path_dbg |= 0x00000004
                 self._event_persister.clear(message_id)
+                self._remember_acked([message_id])
                 if self._reuploads.reuploading() and link_name == self.upstream_client:
                     path_dbg |= 0x00000008
                     self._continue_reupload(
@@ -641,15 +1081,152 @@ class LinkManager:
         self._logger.path("--LinkManager.process_ack path:0x%08X", path_dbg)
         return path_dbg
 
+    def process_multi_ack(self, link_name: str, multi_ack: MultiAck) -> int:
+        """Process the ack of every message in multi_ack in one pass,
+        clearing acked persisted events with one clear_many()."""
+        self._logger.path(
+            "++LinkManager.process_multi_ack  <%s>  acks: %d",
+            link_name,
+            len(multi_ack.AckMessageIDs),
+        )
+        path_dbg = 0
+        wait_infos = self._acks.cancel_ack_timers_for(
+            link_name, multi_ack.AckMessageIDs
+        )
+        if wait_infos:
+            path_dbg |= 0x00000001
+            persisted = [
+                wait_info.message_id
+                for wait_info in wait_infos
+                if self._in_flight_events.pop(wait_info.message_id) is None
+                and wait_info.message_id in self._event_persister
+            ]
+            if persisted:
+                path_dbg |= 0x00000002
+                self._event_persister.clear_many(persisted)
+                self._remember_acked(persisted)
+                if self._reuploads.reuploading() and link_name == self.upstream_client:
+                    path_dbg |= 0x00000004
+                    reupload_now = []
+                    for event_id in persisted:
+                        reupload_now.extend(
+                            self._reuploads.process_ack_for_reupload(event_id)
+                        )
+                    self._continue_reupload(reupload_now)
+                    if not self._reuploads.reuploading():
+                        path_dbg |= 0x00000008
+                        self._logger.info("reupload complete.")
+        self._logger.path("--LinkManager.process_multi_ack path:0x%08X", path_dbg)
+        return path_dbg
+
+    def process_batch_ack(self, link_name: str, batch_ack: BatchAck) -> None:
+        """Clear every event of the batch acked by batch_ack. Events in the
+        batch which it does not list stay persisted, and leave the reupload.
+        Listed events that were not in the batch are ignored."""
+        self._logger.path(
+            "++LinkManager.process_batch_ack  <%s>  %s  events: %d",
+            link_name,
+            batch_ack.AckMessageID,
+            len(batch_ack.EventIDs),
+        )
+        path_dbg = 0
+        wait_info = self._acks.cancel_ack_timer(link_name, batch_ack.AckMessageID)
+        batch_event_ids = self._event_batches.pop(batch_ack.AckMessageID, [])
+        if wait_info is not None:
+            path_dbg |= 0x00000001
+            acked = set(batch_ack.EventIDs).intersection(batch_event_ids)
+            persisted = [
+                event_id
+                for event_id in batch_event_ids
+                if event_id in acked and self._in_flight_events.pop(event_id) is None
+            ]
+            self._event_persister.clear_many(persisted)
+            self._remember_acked(persisted)
+            if self._reuploads.reuploading() and link_name == self.upstream_client:
+                path_dbg |= 0x00000002
+                reupload_now = []
+                for event_id in persisted:
+                    reupload_now.extend(
+                        self._reuploads.process_ack_for_reupload(event_id)
+                    )
+                for event_id in batch_event_ids:
+                    if event_id not in acked:
+                        reupload_now.extend(
+                            self._reuploads.process_ack_for_reupload(
+                                event_id, sent=False
+                            )
+                        )
+                self._continue_reupload(reupload_now)
+        self._logger.path("--LinkManager.process_batch_ack path:0x%08X", path_dbg)
+
+    def unpack_event_batch(
+        self, link_name: str, batch_message: Message[EventBatch]
+    ) -> tuple[list[Message[Any]], Problems]:
+        """Decode each event in batch_message as if it had arrived in its own
+        message on link_name. Return the decoded messages and the problems
+        decoding any others."""
+        codec = self._mqtt_codecs[link_name]
+        messages = []
+        problems = Problems()
+        for event in batch_message.Payload.Events:
+            message = {
+                "Header": batch_message.Header.model_copy(
+                    update={
+                        "MessageType": event.get("TypeName", ""),
+                        "MessageId": event.get("MessageId", ""),
+                        "AckRequired": False,
+                    }
+                ).model_dump(),
+                "Payload": event,
+            }
+            try:
+                messages.append(self._decode_batched_event(codec, message))
+            except Exception as e:  # noqa: BLE001
+                problems.add_error(e)
+        return messages, problems
+
+    @classmethod
+    def _decode_batched_event(
+        cls, codec: MQTTCodec, message: dict[str, Any]
+    ) -> Message[Any]:
+        try:
+            return codec.message_model.model_validate(message)
+        except ValidationError as e:
+            if (details := codec.get_unrecognized_payload_error(e)) is None:
+                raise
+            return codec.handle_unrecognized_payload(
+                json.dumps(message).encode(), e, details
+            )
+
+    def send_batch_ack(
+        self, link_name: str, batch_message: Message[EventBatch], event_ids: list[str]
+    ) -> None:
+        self.publish_message(
+            link_name,
+            Message(
+                Src=self.publication_name,
+                Payload=BatchAck(
+                    AckMessageID=batch_message.Header.MessageId, EventIDs=event_ids
+                ),
+            ),
+        )
+
     def send_ack(self, link_name: str, message: Message[Any]) -> None:
         if message.Header.MessageId:
-            self.publish_message(
-                link_name,
-                Message(
-                    Src=self.publication_name,
-                    Payload=Ack(AckMessageID=message.Header.MessageId),
-                ),
-            )
+            if (coalescer := self._ack_coalescers.get(link_name)) is not None:
+                coalescer.add(message.Header.MessageId)
+            else:
+                self._send_acks(link_name, [message.Header.MessageId])
+
+    def _send_acks(self, link_name: str, message_ids: list[str]) -> None:
+        payload: Ack | MultiAck
+        if len(message_ids) == 1:
+            payload = Ack(AckMessageID=message_ids[0])
+        else:
+            payload = MultiAck(AckMessageIDs=message_ids)
+        self.publish_message(
+            link_name, Message(Src=self.publication_name, Payload=payload)
+        )
 
     def start_ping_tasks(self) -> list[asyncio.Task[Any]]:
         return [
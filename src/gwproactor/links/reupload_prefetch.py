@@ -0,0 +1,135 @@
+"""Read reuploaded events before they are needed.
+
+Without prefetch, each ack received during a reupload is followed by
+retrieving the next events from the persister, on the event loop, before
+they can be published. If ProactorSettings.reupload_prefetch_events is
+non-zero, LinkManager instead keeps the content of up to that many of the
+events the reupload will send next in a ReuploadPrefetch. An ack then
+publishes from memory.
+
+The buffer is refilled, once it is at most half full, with one
+PersisterInterface.retrieve_many_later() call. With a ThreadedPersister (or
+a TieredPersister wrapping one) that read, and any decompression, runs in
+the persister's I/O thread; the result is collected by a later retrieve or
+refill, never waited for. Other persisters complete the read at once, which
+still replaces a retrieve per ack with one batched read per half buffer.
+
+Prefetched content is only used for an event that is still pending, so an
+event cleared in the meantime is not sent again. Events persisted as wire
+messages (see gwproactor.links.wire) are already encoded for publishing.
+"""
+
+from concurrent.futures import Future
+from typing import Optional, Sequence
+
+from result import Result
+
+from gwproactor.persister import PersisterInterface
+from gwproactor.problems import Problems
+
+RetrieveResults = dict[str, Result[Optional[bytes], Problems]]
+
+
+class ReuploadPrefetch:
+    max_events: int
+    num_hits: int = 0
+    """Events whose content was taken from the buffer."""
+    num_misses: int = 0
+    """Events which had to be retrieved when needed."""
+    _persister: PersisterInterface
+    _buffer: RetrieveResults
+    _retrieving: Optional["Future[RetrieveResults]"] = None
+
+    def __init__(self, persister: PersisterInterface, max_events: int) -> None:
+        self._persister = persister
+        self.max_events = max_events
+        self._buffer = {}
+
+    @property
+    def num_buffered(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def retrieving(self) -> bool:
+        return self._retrieving is not None
+
+    def retrieve_many(self, uids: Sequence[str]) -> RetrieveResults:
+        """Return what PersisterInterface.retrieve_many(uids) would, taking
+        prefetched content where available."""
+        results, missing = self._take(uids)
+        if missing:
+            results.update(self._persister.retrieve_many(missing))
+        return {uid: results[uid] for uid in uids}
+
+    def retrieve_many_later(self, uids: Sequence[str]) -> "Future[RetrieveResults]":
+        """As retrieve_many(), but events that were not prefetched are read
+        by PersisterInterface.retrieve_many_later()."""
+        uids = list(uids)
+        results, missing = self._take(uids)
+        future: Future[RetrieveResults] = Future()
+        if not missing:
+            future.set_result({uid: results[uid] for uid in uids})
+            return future
+
+        def combine(missing_future: "Future[RetrieveResults]") -> None:
+            try:
+                results.update(missing_future.result())
+            except Exception as e:  # noqa: BLE001
+                future.set_exception(e)
+            else:
+                future.set_result({uid: results[uid] for uid in uids})
+
+        self._persister.retrieve_many_later(missing).add_done_callback(combine)
+        return future
+
+    def _take(self, uids: Sequence[str]) -> tuple[RetrieveResults, list[str]]:
+        """Take the prefetched content of uids from the buffer, returning it
+        and the uids that must be retrieved."""
+        self._collect()
+        results: RetrieveResults = {}
+        missing = []
+        for uid in uids:
+            prefetched = self._buffer.pop(uid, None)
+            if prefetched is not None and uid in self._persister:
+                results[uid] = prefetched
+            else:
+                missing.append(uid)
+        self.num_hits += len(results)
+        self.num_misses += len(missing)
+        return results, missing
+
+    @property
+    def needs_refill(self) -> bool:
+        """True if the buffer is at most half full and no retrieve is
+        outstanding."""
+        self._collect()
+        return self._retrieving is None and len(self._buffer) <= self.max_events // 2
+
+    def refill(self, upcoming: Sequence[str]) -> None:
+        """Drop buffered events that are not in upcoming, the uids the
+        reupload will send next, and start retrieving the rest of them."""
+        self._collect()
+        upcoming = upcoming[: self.max_events]
+        keep = set(upcoming)
+        for uid in [uid for uid in self._buffer if uid not in keep]:
+            self._buffer.pop(uid)
+        if self._retrieving is not None:
+            return
+        needed = [uid for uid in upcoming if uid not in self._buffer]
+        if needed:
+            self._retrieving = self._persister.retrieve_many_later(needed)
+            self._collect()
+
+    def clear(self) -> None:
+        """Drop buffered content and forget any outstanding retrieve."""
+        self._buffer.clear()
+        self._retrieving = None
+
+    def _collect(self) -> None:
+        if self._retrieving is None or not self._retrieving.done():
+            return
+        retrieving = self._retrieving
+        self._retrieving = None
+        # If the retrieve failed, the events are retrieved when needed.
+        if retrieving.exception() is None:
+            self._buffer.update(retrieving.result())
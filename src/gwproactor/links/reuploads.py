@@ -5,14 +5,122 @@ as they occur.
 
 This module provides a class, Reuploads, for tracking which events are part of the reupload.
 
+The number of reuploaded events awaiting acks at once is the ReuploadWindow. By default it is fixed at
+num_initial_event_reuploads, so that each ack releases one more event and throughput is bounded by round-trip time.
+If ProactorSettings.reupload_window_max is larger, the window adapts, AIMD style, as TCP's congestion window does: it
+grows on timely acks and is halved on an ack timeout or when round trips slow down, within
+[reupload_window_min, reupload_window_max].
+
+Event ids are not copied out of the event persister when a reupload starts. Only the ids of events sent but not yet
+acked are held in memory; further ids are pulled from PersisterInterface.iter_pending(), resuming after the last id
+pulled, as acks arrive.
+
 This module only manages events ids; it does not change (add or remove) event storage.
 """
 
-from typing import Optional
+import itertools
+import time
+from typing import Callable, Iterator, Optional
 
 from gwproactor.logger import ProactorLogger
+from gwproactor.persister import PersisterInterface
 from gwproactor.stats import LinkStats
 
+RTT_INCREASE_FACTOR = 2.0
+RTT_INCREASE_SLACK_SECONDS = 0.05
+"""A smoothed ack round trip more than RTT_INCREASE_FACTOR times the shortest
+seen, plus RTT_INCREASE_SLACK_SECONDS, is taken as a sign of congestion. The
+slack keeps scheduling jitter on very fast links from looking like
+congestion."""
+
+RTT_SMOOTHING = 0.125
+"""Weight of each new round trip in the smoothed round trip, as in TCP."""
+
+DECREASE_FACTOR = 0.5
+
+
+class ReuploadWindow:
+    """Number of reuploaded events allowed to await acks at once.
+
+    If max_size is greater than initial_size, each timely ack grows the window
+    by one event, doubling it each round trip, until the first sign of
+    congestion; after that it grows by about one event per round trip. An ack
+    timeout, or a smoothed ack round trip well above the shortest seen,
+    multiplies the window by DECREASE_FACTOR, no lower than min_size. Slow
+    round trips do not reduce the window again until a window's worth of acks
+    has arrived. Otherwise, the window is fixed at initial_size.
+    """
+
+    _size: float
+    _threshold: float
+    """Size above which growth slows from one per ack to one per round trip."""
+    _min_rtt: Optional[float] = None
+    _smoothed_rtt: Optional[float] = None
+    _acks_until_decrease: int = 0
+    num_decreases: int = 0
+
+    def __init__(self, initial_size: int, min_size: int = 1, max_size: int = 0) -> None:
+        self.initial_size = initial_size
+        self.min_size = min(min_size, initial_size)
+        self.max_size = max(max_size, initial_size)
+        self._size = float(initial_size)
+        self._threshold = float(self.max_size)
+
+    @property
+    def adaptive(self) -> bool:
+        return self.max_size > self.initial_size
+
+    @property
+    def size(self) -> int:
+        return int(self._size)
+
+    @property
+    def min_rtt(self) -> Optional[float]:
+        return self._min_rtt
+
+    @property
+    def smoothed_rtt(self) -> Optional[float]:
+        return self._smoothed_rtt
+
+    def process_ack(self, rtt_seconds: float) -> None:
+        if not self.adaptive:
+            return
+        if self._acks_until_decrease:
+            self._acks_until_decrease -= 1
+        if self._min_rtt is None or self._smoothed_rtt is None:
+            self._min_rtt = self._smoothed_rtt = rtt_seconds
+        else:
+            self._min_rtt = min(self._min_rtt, rtt_seconds)
+            self._smoothed_rtt += RTT_SMOOTHING * (rtt_seconds - self._smoothed_rtt)
+        if (
+            self._smoothed_rtt
+            > self._min_rtt * RTT_INCREASE_FACTOR + RTT_INCREASE_SLACK_SECONDS
+        ):
+            if not self._acks_until_decrease:
+                self._decrease()
+            return
+        if self._size < self._threshold:
+            self._size += 1
+        else:
+            self._size += 1 / self._size
+        self._size = min(self._size, self.max_size)
+
+    def process_timeout(self) -> None:
+        if self.adaptive:
+            self._decrease()
+
+    def _decrease(self) -> None:
+        self._size = max(self._size * DECREASE_FACTOR, self.min_size)
+        self._threshold = self._size
+        self._acks_until_decrease = self.size
+        self.num_decreases += 1
+
+    def __str__(self) -> str:
+        s = f"window:{self.size}"
+        if self.adaptive:
+            s += f" [{self.min_size}, {self.max_size}]  decreases:{self.num_decreases}"
+        return s
+
 
 class _ReuploadDiffLogger:  # pragma: no cover
     """Helper class for logging results of an ack without to much logging code bulk in the ack processing routine"""
@@ -70,13 +178,33 @@ class Reuploads:
     NUM_INITIAL_EVENTS: int = 5
     """Default number of events to send when re-upload starts."""
 
-    _reupload_pending: dict[str, None]
-    """'Ordered set' of *unsent* events that are part of this reupload.
-    A dict is used to provide insertion order and fast lookup."""
+    _event_persister: PersisterInterface
+    """Source of the uids of events in the re-upload."""
+
+    _excluded: Callable[[str], bool]
+    """Return True for a pending event that is not part of the re-upload, such
+    as one sent, and awaiting an ack, outside of it."""
 
-    _reuploaded_unacked: dict[str, None]
-    """'Ordered set' of *sent but as-yet unacked*
-    A dict is used to provide insertion order and fast lookup."""
+    _cursor: Optional[str] = None
+    """uid of the event most recently pulled from the persister. Pulling resumes
+    after it."""
+
+    _unsent: Optional[Iterator[str]] = None
+    """Unsent uids after the cursor. Kept from one pull to the next, so each
+    pull continues where the last stopped rather than seeking the cursor in
+    the persister again."""
+
+    _num_reupload_pending: int = 0
+    """Number of *unsent* events that are part of this reupload. Counted when
+    the reupload starts, and estimated from above when it is extended; events
+    acked, cleared or excluded before they are pulled are only discovered
+    when pulling runs out of events."""
+
+    _reuploaded_unacked: dict[str, float]
+    """*sent but as-yet unacked* events, in the order sent, mapped to the
+    time.monotonic() at which they were sent."""
+
+    _window: ReuploadWindow
 
     _num_initial_events: int
     """Number of events to send when re-upload starts."""
@@ -88,38 +216,126 @@ class Reuploads:
 
     _logger: ProactorLogger
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         logger: ProactorLogger,
+        event_persister: PersisterInterface,
         num_initial_events: int = NUM_INITIAL_EVENTS,
+        excluded: Optional[Callable[[str], bool]] = None,
+        *,
+        min_window: int = 1,
+        max_window: int = 0,
     ) -> None:
-        self._reupload_pending = {}
         self._reuploaded_unacked = {}
         self._num_initial_events = num_initial_events
+        self._window = ReuploadWindow(num_initial_events, min_window, max_window)
         self._logger = logger
+        self._event_persister = event_persister
+        self._excluded = excluded if excluded is not None else lambda _: False
 
-    def start_reupload(self, pending_events: list[str]) -> list[str]:
-        """Track all pending_events for reupload. Of the pending_events,
-        record the first _num_initial_events as "unacked" and the rest
-        as "pending". Return the "unacked" group so they can be sent.
+    def start_reupload(self) -> list[str]:
+        """Track all pending events for reupload. Of the pending events,
+        record the first window's worth as "unacked" and count the rest as
+        "pending". Return the "unacked" group so they can be sent.
         """
-        reupload_now = pending_events[: self._num_initial_events]
-        self._reuploaded_unacked = dict.fromkeys(reupload_now)
-        self._reupload_pending = dict.fromkeys(
-            pending_events[self._num_initial_events :]
-        )
+        return self._start(self._event_persister.num_pending)
+
+    def _start(self, num_events: int) -> list[str]:
+        self._reuploaded_unacked = {}
+        self._rewind()
+        self._num_reupload_pending = num_events
+        reupload_now = self._pull(self._window.size)
         if self.reuploading() and self.stats is not None:
             self.stats.start_reupload()
-        self._log_start_reupload(len(pending_events), len(reupload_now))
+        self._log_start_reupload(
+            len(reupload_now) + self._num_reupload_pending, len(reupload_now)
+        )
         return reupload_now
 
+    def extend_reupload(self) -> list[str]:
+        """Add pending events not yet part of the reupload, such as those
+        found by a background reindex of the event persister. These may be
+        older than events already sent, so pulling restarts from the oldest
+        pending event. If no reupload is in progress, start one. Return any
+        events that should be sent now.
+
+        The unsent events are not counted one by one: every pending event not
+        already sent in the reupload is counted, including events excluded
+        from it, which pulling skips.
+        """
+        self._rewind()
+        num_unsent = self._event_persister.num_pending - sum(
+            1
+            for event_id in self._reuploaded_unacked
+            if event_id in self._event_persister
+        )
+        if num_unsent <= 0:
+            return []
+        if not self.reuploading():
+            return self._start(num_unsent)
+        self._num_reupload_pending = num_unsent
+        return []
+
+    def _rewind(self) -> None:
+        """Restart pulling from the oldest pending event."""
+        self._cursor = None
+        self._unsent = None
+
+    def _iter_unsent(self) -> Iterator[str]:
+        """Yield pending uids after the cursor which have been neither sent
+        as part of the reupload nor excluded from it."""
+        for event_id in self._event_persister.iter_pending(self._cursor):
+            if (
+                event_id not in self._reuploaded_unacked
+                and not self._excluded(event_id)
+                and event_id in self._event_persister
+            ):
+                yield event_id
+
+    def upcoming(self, num_events: int) -> list[str]:
+        """Return up to num_events uids that the reupload will send next,
+        without pulling them."""
+        if not self._num_reupload_pending:
+            return []
+        return list(
+            itertools.islice(
+                self._iter_unsent(), min(num_events, self._num_reupload_pending)
+            )
+        )
+
+    def _pull(self, num_events: int) -> list[str]:
+        """Move up to num_events "pending" events to "unacked" and return
+        them."""
+        num_events = min(num_events, self._num_reupload_pending)
+        if num_events <= 0:
+            return []
+        if self._unsent is None:
+            self._unsent = self._iter_unsent()
+        pulled = list(itertools.islice(self._unsent, num_events))
+        if len(pulled) < num_events:
+            # Events counted as pending were acked, cleared or excluded
+            # before they were pulled; there are no more.
+            self._num_reupload_pending = 0
+            self._unsent = None
+        else:
+            self._num_reupload_pending -= len(pulled)
+        if pulled:
+            self._cursor = pulled[-1]
+            self._reuploaded_unacked.update(dict.fromkeys(pulled, time.monotonic()))
+        return pulled
+
     def clear_unacked_event(self, ack_id: str) -> None:
         self._reuploaded_unacked.pop(ack_id)
 
-    def process_ack_for_reupload(self, ack_id: str) -> list[str]:
+    def _num_to_send(self) -> int:
+        return self._window.size - len(self._reuploaded_unacked)
+
+    def process_ack_for_reupload(self, ack_id: str, *, sent: bool = True) -> list[str]:
         """If ack_id is in our "unacked" store, remove it from the unacked store. If any events remain in our "pending"
-        store, move the first pending event from the pending store to the unacked store and return it for sending
-        next."""
+        store, move pending events to the unacked store, until the window is full, and return them for sending
+        next.
+
+        sent is False for an event dropped without being sent, which does not adjust the window."""
 
         path_dbg = 0
         was_reuploading = self.reuploading()
@@ -129,13 +345,12 @@ class Reuploads:
         reupload_now = []
         if ack_id in self._reuploaded_unacked:
             path_dbg |= 0x00000001
-            self._reuploaded_unacked.pop(ack_id)
-            if self._reupload_pending:
+            sent_at = self._reuploaded_unacked.pop(ack_id)
+            if sent:
+                self._window.process_ack(time.monotonic() - sent_at)
+            if self._num_reupload_pending:
                 path_dbg |= 0x00000002
-                reupload_next = next(iter(self._reupload_pending))
-                self._reupload_pending.pop(reupload_next)
-                self._reuploaded_unacked[reupload_next] = None
-                reupload_now = [reupload_next]
+                reupload_now = self._pull(self._num_to_send())
         # This case is likely in testing (which explicitly generates
         # the awaiting_setup state), but unlikely in the real works, since
         # unless we have many subscriptions we will get one suback for all of
@@ -147,9 +362,11 @@ class Reuploads:
         # In theory this could also happen if an ack for an event sent prior to
         # communication loss was somehow preserved in a queue and delivered after comm
         # restore.
-        elif ack_id in self._reupload_pending:
+        # Such an event is still counted as pending. If nothing is unacked, pull
+        # so that the reupload either continues or finds it has no more events.
+        elif not self._reuploaded_unacked and self._num_reupload_pending:
             path_dbg |= 0x00000004
-            self._reupload_pending.pop(ack_id)
+            reupload_now = self._pull(self._num_to_send())
         if was_reuploading and not self.reuploading() and self.stats is not None:
             path_dbg |= 0x00000008
             self.stats.complete_reupload()
@@ -161,9 +378,18 @@ class Reuploads:
             ack_logger.log_ack(path_dbg)
         return reupload_now
 
+    def process_ack_timeout(self) -> None:
+        """Shrink the window after an ack timeout on the upstream link. The
+        window is kept across clear(), so the next reupload starts with it."""
+        self._window.process_timeout()
+
+    @property
+    def window(self) -> ReuploadWindow:
+        return self._window
+
     @property
     def num_reupload_pending(self) -> int:
-        return len(self._reupload_pending)
+        return self._num_reupload_pending
 
     @property
     def num_reuploaded_unacked(self) -> int:
@@ -174,24 +400,24 @@ class Reuploads:
         return self._logger
 
     def reuploading(self) -> bool:
-        return bool(len(self._reuploaded_unacked) + len(self._reupload_pending))
+        return bool(len(self._reuploaded_unacked) + self._num_reupload_pending)
 
     def clear(self) -> None:
-        self._reupload_pending.clear()
         self._reuploaded_unacked.clear()
+        self._num_reupload_pending = 0
+        self._rewind()
 
     def get_str(self, *, verbose: bool = True, num_events: int = 5) -> str:
-        s = f"Reuploads  reuploading:{int(self.reuploading())}  unacked/sent:{len(self._reuploaded_unacked)}  pending/unsent:{len(self._reupload_pending)}"
+        s = f"Reuploads  reuploading:{int(self.reuploading())}  unacked/sent:{len(self._reuploaded_unacked)}  pending/unsent:{self._num_reupload_pending}"
         if verbose:
-            s += f"  num initial:{self._num_initial_events}\n"
+            s += f"  num initial:{self._num_initial_events}  {self._window}\n"
             s += f"  unacked:{len(self._reuploaded_unacked)}\n"
             for message_id in self._reuploaded_unacked:
                 s += f"    {message_id[:8]}...\n"
-            s += f"  pending:{len(self._reupload_pending)}\n"
-            for i, message_id in enumerate(self._reupload_pending):
-                s += f"    {message_id[:8]}...\n"
-                if i == num_events - 1:
-                    break
+            s += f"  pending:{self._num_reupload_pending}\n"
+            if self._num_reupload_pending:
+                for message_id in itertools.islice(self._iter_unsent(), num_events):
+                    s += f"    {message_id[:8]}...\n"
         return s.rstrip()
 
     def __str__(self) -> str:
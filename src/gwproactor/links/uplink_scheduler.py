@@ -0,0 +1,205 @@
+"""Rate limited, prioritized publishing on a link.
+
+By default LinkManager publishes every message the moment it is produced. On
+a thin uplink a reupload of a long backlog then competes, message for
+message, with acks, live events and commands. If
+ProactorSettings.uplink_bytes_per_second or uplink_messages_per_second is
+non-zero, each link instead publishes through an UplinkScheduler.
+
+The scheduler holds a token bucket for bytes and one for messages, each
+refilled at its configured rate and holding at most uplink_burst_seconds
+worth of tokens. A message is published at once if the buckets allow it and
+nothing of the same or higher priority is waiting. Otherwise it is queued
+with others of its UplinkPriority, and queues are drained, highest priority
+first, as the buckets refill. A message larger than a full bucket is sent
+once the bucket is full, leaving the bucket in debt.
+
+Control messages (acks, batch acks and pings) are never delayed, since
+delaying them causes timeouts and resends that cost more than they save.
+They are still charged against the buckets, so the other classes yield to
+them.
+
+A queued message's send callback, which also starts its ack timer, runs when
+the message leaves the queue. Until then LinkManager.publish_message()
+returns MQTTMessageInfo(-1) for it, and queued() reports its message id, so
+that a reupload does not send an event again while it waits here.
+"""
+
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Any, Callable, NamedTuple, Optional
+
+from paho.mqtt.client import MQTTMessageInfo
+
+from gwproactor.links.timer_interface import TimerManagerInterface
+from gwproactor.stats import UplinkCounts
+
+DEFAULT_BURST_SECONDS = 1.0
+
+
+class UplinkPriority(IntEnum):
+    """Outbound message classes, highest priority first."""
+
+    control = 0
+    live = 1
+    reupload = 2
+    bulk = 3
+
+
+class TokenBucket:
+    """Tokens refilled at rate per second, up to capacity. A rate of 0 means
+    unlimited."""
+
+    rate: float
+    capacity: float
+    tokens: float
+    _refilled_at: float
+
+    def __init__(
+        self, rate: float, burst_seconds: float = DEFAULT_BURST_SECONDS
+    ) -> None:
+        self.rate = rate
+        self.capacity = max(rate * burst_seconds, 1.0)
+        self.tokens = self.capacity
+        self._refilled_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._refilled_at) * self.rate
+        )
+        self._refilled_at = now
+
+    def seconds_until(self, cost: float, now: float) -> float:
+        """Return how long until cost can be taken. A cost larger than
+        capacity can be taken once the bucket is full."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        return max(min(cost, self.capacity) - self.tokens, 0.0) / self.rate
+
+    def take(self, cost: float, now: float) -> None:
+        if self.rate:
+            self._refill(now)
+            self.tokens -= cost
+
+
+class _Queued(NamedTuple):
+    num_bytes: int
+    send: Callable[[], MQTTMessageInfo]
+    message_id: str = ""
+
+
+class UplinkScheduler:
+    bytes_bucket: TokenBucket
+    messages_bucket: TokenBucket
+    counts: UplinkCounts
+    _timer_manager: TimerManagerInterface
+    _queues: dict[UplinkPriority, deque[_Queued]]
+    _queued_ids: set[str]
+    _drain_timer: Optional[Any] = None
+
+    def __init__(
+        self,
+        timer_manager: TimerManagerInterface,
+        bytes_per_second: float = 0.0,
+        messages_per_second: float = 0.0,
+        burst_seconds: float = DEFAULT_BURST_SECONDS,
+    ) -> None:
+        self._timer_manager = timer_manager
+        self.bytes_bucket = TokenBucket(bytes_per_second, burst_seconds)
+        self.messages_bucket = TokenBucket(messages_per_second, burst_seconds)
+        self._queues = {priority: deque() for priority in UplinkPriority}
+        self._queued_ids = set()
+        self.counts = UplinkCounts()
+        for priority in UplinkPriority:
+            self.counts.queue_depth[priority.name] = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def queue_depths(self) -> dict[UplinkPriority, int]:
+        return {priority: len(queue) for priority, queue in self._queues.items()}
+
+    def queued(self, message_id: str) -> bool:
+        """Check whether a message published with message_id is waiting in
+        a queue."""
+        return message_id in self._queued_ids
+
+    def publish(
+        self,
+        priority: UplinkPriority,
+        num_bytes: int,
+        send: Callable[[], MQTTMessageInfo],
+        message_id: str = "",
+    ) -> MQTTMessageInfo:
+        """Call send now if priority and the budget allow, otherwise queue
+        it and return MQTTMessageInfo(-1)."""
+        now = time.monotonic()
+        if priority == UplinkPriority.control or (
+            not any(self._queues[p] for p in UplinkPriority if p <= priority)
+            and not self._seconds_until(num_bytes, now)
+        ):
+            return self._send(priority, num_bytes, send, now)
+        self._queues[priority].append(_Queued(num_bytes, send, message_id))
+        if message_id:
+            self._queued_ids.add(message_id)
+        self.counts.num_delayed[priority.name] += 1
+        self.counts.queue_depth[priority.name] += 1
+        self.counts.max_queue_depth = max(self.counts.max_queue_depth, self.queue_depth)
+        self._start_drain_timer(now)
+        return MQTTMessageInfo(-1)
+
+    def drain(self) -> None:
+        """Send queued messages, highest priority first, for as long as the
+        budget allows."""
+        self._drain_timer = None
+        now = time.monotonic()
+        for priority, queue in self._queues.items():
+            while queue and not self._seconds_until(queue[0].num_bytes, now):
+                queued = queue.popleft()
+                self._queued_ids.discard(queued.message_id)
+                self.counts.queue_depth[priority.name] -= 1
+                self._send(priority, queued.num_bytes, queued.send, now)
+            if queue:
+                break
+        self._start_drain_timer(now)
+
+    def clear(self) -> None:
+        """Drop every queued message, as when the link goes down."""
+        for priority, queue in self._queues.items():
+            queue.clear()
+            self.counts.queue_depth[priority.name] = 0
+        self._queued_ids.clear()
+        if self._drain_timer is not None:
+            self._timer_manager.cancel_timer(self._drain_timer)
+            self._drain_timer = None
+
+    def _seconds_until(self, num_bytes: int, now: float) -> float:
+        return max(
+            self.bytes_bucket.seconds_until(num_bytes, now),
+            self.messages_bucket.seconds_until(1, now),
+        )
+
+    def _send(
+        self,
+        priority: UplinkPriority,
+        num_bytes: int,
+        send: Callable[[], MQTTMessageInfo],
+        now: float,
+    ) -> MQTTMessageInfo:
+        self.bytes_bucket.take(num_bytes, now)
+        self.messages_bucket.take(1, now)
+        self.counts.num_sent[priority.name] += 1
+        return send()
+
+    def _start_drain_timer(self, now: float) -> None:
+        if self._drain_timer is not None:
+            return
+        for queue in self._queues.values():
+            if queue:
+                self._drain_timer = self._timer_manager.start_timer(
+                    self._seconds_until(queue[0].num_bytes, now), self.drain
+                )
+                return
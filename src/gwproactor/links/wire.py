@@ -0,0 +1,70 @@
+"""Events persisted in the form in which they are published.
+
+By default an event is persisted as the JSON of the event alone. Reuploading
+it means decoding that JSON to a dict, constructing a Message around it and
+serializing the Message again. If ProactorSettings.persist_wire_messages is
+set, events are instead persisted as the JSON of the complete upstream
+Message:
+
+    {"Header":{...},"Payload":{...},"TypeName":"gw"}
+
+Reupload then only parses the small Header, to find the topic and message
+id, and publishes the stored bytes as they are.
+
+The layout is produced here, by concatenation, rather than by pydantic, so
+that decode_wire_header() can rely on it. Stored bytes that do not match the
+layout are not an error; they are reuploaded by decoding them in full.
+"""
+
+from typing import Optional
+
+from gwproto import Header, Message
+from pydantic import ValidationError
+
+WIRE_PREFIX = b'{"Header":'
+WIRE_PAYLOAD_SEPARATOR = b',"Payload":'
+WIRE_SUFFIX = b',"TypeName":"' + Message.type_name().encode() + b'"}'
+
+
+def encode_wire_message(header: Header, payload_json: bytes) -> bytes:
+    """Return the JSON of a Message with header and the already serialized
+    payload_json."""
+    return b"".join(
+        [
+            WIRE_PREFIX,
+            header.model_dump_json().encode(),
+            WIRE_PAYLOAD_SEPARATOR,
+            payload_json,
+            WIRE_SUFFIX,
+        ]
+    )
+
+
+def split_wire_message(message_bytes: bytes) -> Optional[tuple[Header, bytes]]:
+    """Return the Header and the payload JSON of message_bytes produced by
+    encode_wire_message(), or None if message_bytes do not have that layout.
+    The payload is not parsed."""
+    if not (
+        message_bytes.startswith(WIRE_PREFIX) and message_bytes.endswith(WIRE_SUFFIX)
+    ):
+        return None
+    header_end = message_bytes.find(WIRE_PAYLOAD_SEPARATOR)
+    if header_end < 0:
+        return None
+    try:
+        header = Header.model_validate_json(
+            message_bytes[len(WIRE_PREFIX) : header_end]
+        )
+    except ValidationError:
+        return None
+    return header, message_bytes[
+        header_end + len(WIRE_PAYLOAD_SEPARATOR) : -len(WIRE_SUFFIX)
+    ]
+
+
+def decode_wire_header(message_bytes: bytes) -> Optional[Header]:
+    """Return the Header of message_bytes produced by encode_wire_message(),
+    or None if message_bytes do not have that layout. The payload is not
+    parsed."""
+    split = split_wire_message(message_bytes)
+    return split[0] if split is not None else None
@@ -306,3 +306,30 @@ class DBGEvent(EventBase):
     Count: int = 0
     Msg: str = ""
     TypeName: Literal["gridworks.event.proactor.dbg"] = "gridworks.event.proactor.dbg"
+
+
+class EventBatch(BaseModel):
+    """Events sent in one message, answered by one BatchAck. See
+    gwproactor.links.event_batch."""
+
+    Events: list[dict[str, Any]]
+    TypeName: Literal["gridworks.proactor.event.batch"] = (
+        "gridworks.proactor.event.batch"
+    )
+
+
+class BatchAck(BaseModel):
+    """Ack of the EventBatch with MessageId AckMessageID, listing the
+    MessageId of each event in it that was accepted."""
+
+    AckMessageID: str
+    EventIDs: list[str]
+    TypeName: Literal["gridworks.proactor.batch.ack"] = "gridworks.proactor.batch.ack"
+
+
+class MultiAck(BaseModel):
+    """Ack of each message whose MessageId is in AckMessageIDs. See
+    gwproactor.links.ack_coalescer."""
+
+    AckMessageIDs: list[str]
+    TypeName: Literal["gridworks.proactor.multi.ack"] = "gridworks.proactor.multi.ack"
@@ -1,7 +1,16 @@
+from gwproactor.persister.compression import (
+    Codec,
+    CompressingPersister,
+    CompressionStats,
+    train_zstd_dictionary,
+)
+from gwproactor.persister.durability import Durability, FsyncStats
 from gwproactor.persister.exceptions import (
     ByteDecodingError,
     ContentTooLarge,
+    CorruptRecordWarning,
     DecodingError,
+    DecompressionError,
     FileEmptyWarning,
     FileExistedWarning,
     FileMissing,
@@ -12,36 +21,62 @@ from gwproactor.persister.exceptions import (
     PersisterWarning,
     ReadFailed,
     ReindexError,
+    SizeMismatchWarning,
     TrimFailed,
     UIDExistedWarning,
     UIDMissingWarning,
     WriteFailed,
 )
 from gwproactor.persister.interface import PersisterInterface
+from gwproactor.persister.metrics import (
+    LatencyHistogram,
+    OperationMetrics,
+    PersisterMetrics,
+)
+from gwproactor.persister.segment_log import SegmentLogPersister
 from gwproactor.persister.simple_directory_writer import SimpleDirectoryWriter
+from gwproactor.persister.sqlite import SQLitePersister
 from gwproactor.persister.stub import StubPersister
+from gwproactor.persister.threaded import ThreadedPersister
+from gwproactor.persister.tiered import TieredPersister
 from gwproactor.persister.timed_rolling_file import TimedRollingFilePersister
 
 __all__ = [
     "ByteDecodingError",
+    "Codec",
+    "CompressingPersister",
+    "CompressionStats",
     "ContentTooLarge",
+    "CorruptRecordWarning",
     "DecodingError",
+    "DecompressionError",
+    "Durability",
     "FileEmptyWarning",
     "FileExistedWarning",
     "FileMissing",
     "FileMissingWarning",
+    "FsyncStats",
     "JSONDecodingError",
+    "LatencyHistogram",
+    "OperationMetrics",
     "PersisterError",
     "PersisterException",
     "PersisterInterface",
+    "PersisterMetrics",
     "PersisterWarning",
     "ReadFailed",
     "ReindexError",
+    "SQLitePersister",
+    "SegmentLogPersister",
     "SimpleDirectoryWriter",
+    "SizeMismatchWarning",
     "StubPersister",
+    "ThreadedPersister",
+    "TieredPersister",
     "TimedRollingFilePersister",
     "TrimFailed",
     "UIDExistedWarning",
     "UIDMissingWarning",
     "WriteFailed",
+    "train_zstd_dictionary",
 ]
@@ -0,0 +1,368 @@
+"""Transparent compression of persisted events.
+
+CompressingPersister wraps another PersisterInterface, compressing content in
+persist() and decompressing it in retrieve(). The wrapped persister stores,
+trims and counts the compressed bytes, so the same max_bytes holds more
+events.
+
+Each record starts with a header naming its codec:
+
+    RECORD_MARKER | codec byte | [type name] | [zstd dictionary id, 4 bytes LE] | payload
+
+If the content has a TypeName, the codec byte has TYPE_NAME_FLAG set and the
+type name follows it, as a length byte and the name. The wrapped persister
+reads it with record_type_name(), so TimedRollingFilePersister's priority
+classes and per-type retention work on compressed records.
+
+Content that does not start with RECORD_MARKER, such as events persisted
+before compression was enabled, is returned unchanged. Persisted JSON always
+starts with "{", so it is never mistaken for a compressed record.
+
+zlib is always available. zstd requires the optional zstandard package and is
+most effective with a dictionary trained on sample events; see
+train_zstd_dictionary().
+"""
+
+import enum
+import struct
+import zlib
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Iterator, Optional, Sequence
+
+from result import Err, Ok, Result
+
+from gwproactor.persister.exceptions import DecompressionError, PersisterError
+from gwproactor.persister.interface import (
+    ENCODING,
+    PersisterInterface,
+    event_type_name,
+)
+from gwproactor.persister.metrics import PersisterMetrics
+from gwproactor.problems import Problems
+
+try:
+    import zstandard
+
+    ZSTD_AVAILABLE = True
+except ImportError:  # pragma: no cover
+    ZSTD_AVAILABLE = False
+
+RECORD_MARKER: bytes = b"\xc7"
+DICT_ID = struct.Struct("<I")
+DEFAULT_MIN_COMPRESS_BYTES = 64
+DEFAULT_ZLIB_LEVEL = 6
+DEFAULT_ZSTD_LEVEL = 3
+DEFAULT_ZSTD_DICTIONARY_BYTES = 16 * 1024
+TYPE_NAME_FLAG = 0x80
+MAX_TYPE_NAME_BYTES = 255
+
+
+class Codec(enum.IntEnum):
+    none = 0
+    zlib = 1
+    zstd = 2
+    zstd_dict = 3
+
+
+@dataclass
+class CompressionStats:
+    num_compressed: int = 0
+    num_uncompressed: int = 0
+    content_bytes: int = 0
+    """Bytes passed to persist()."""
+    stored_bytes: int = 0
+    """Bytes passed to the wrapped persister, including record headers."""
+
+    @property
+    def ratio(self) -> float:
+        if self.stored_bytes:
+            return self.content_bytes / self.stored_bytes
+        return 1.0
+
+    def __str__(self) -> str:
+        return (
+            f"CompressionStats  compressed: {self.num_compressed}  "
+            f"uncompressed: {self.num_uncompressed}  "
+            f"content bytes: {self.content_bytes}  stored bytes: {self.stored_bytes}  "
+            f"ratio: {self.ratio:.2f}"
+        )
+
+
+def record_type_name(record: bytes) -> Optional[str]:
+    """Return the type name in the header of a record written by
+    CompressingPersister, "" if it has none, or None if record is not such a
+    record."""
+    if not record.startswith(RECORD_MARKER) or len(record) < 2:  # noqa: PLR2004
+        return None
+    if not record[1] & TYPE_NAME_FLAG:
+        return ""
+    return record[3 : 3 + record[2]].decode(ENCODING, errors="replace")
+
+
+def train_zstd_dictionary(
+    samples: Sequence[bytes], dict_size: int = DEFAULT_ZSTD_DICTIONARY_BYTES
+) -> bytes:
+    """Train a zstd dictionary from sample events, for example the contents
+    of events already on disk. Requires the zstandard package."""
+    if not ZSTD_AVAILABLE:
+        raise ValueError("ERROR. zstd dictionary training requires zstandard.")
+    return bytes(zstandard.train_dictionary(dict_size, list(samples)).as_bytes())
+
+
+class CompressingPersister(PersisterInterface):
+    _persister: PersisterInterface
+    _codec: Codec
+    _min_compress_bytes: int
+    _zlib_level: int
+    _stats: CompressionStats
+    _zstd_compressor: Any = None
+    _zstd_decompressors: dict[int, Any]
+    _zstd_dict_id: int = 0
+
+    def __init__(  # noqa: PLR0913
+        self,
+        persister: PersisterInterface,
+        codec: Optional[Codec] = None,
+        *,
+        zstd_dictionaries: Sequence[bytes] = (),
+        min_compress_bytes: int = DEFAULT_MIN_COMPRESS_BYTES,
+        zlib_level: int = DEFAULT_ZLIB_LEVEL,
+        zstd_level: int = DEFAULT_ZSTD_LEVEL,
+    ) -> None:
+        """If codec is None, zstd with the last of zstd_dictionaries is used
+        when zstandard is installed and a dictionary is provided, otherwise
+        zlib. All zstd_dictionaries remain available for decompression, so
+        a newly trained dictionary can be appended without losing access to
+        events compressed with older ones.
+        """
+        self._persister = persister
+        self._min_compress_bytes = min_compress_bytes
+        self._zlib_level = zlib_level
+        self._stats = CompressionStats()
+        self._zstd_decompressors = {}
+        if codec is None:
+            codec = (
+                Codec.zstd_dict if ZSTD_AVAILABLE and zstd_dictionaries else Codec.zlib
+            )
+        if codec in {Codec.zstd, Codec.zstd_dict} and not ZSTD_AVAILABLE:
+            raise ValueError(f"ERROR. Codec {codec.name} requires zstandard.")
+        if codec == Codec.zstd_dict and not zstd_dictionaries:
+            raise ValueError("ERROR. Codec zstd_dict requires zstd_dictionaries.")
+        self._codec = codec
+        if ZSTD_AVAILABLE:
+            self._zstd_decompressors[0] = zstandard.ZstdDecompressor()
+            dictionary = None
+            for dictionary_bytes in zstd_dictionaries:
+                dictionary = zstandard.ZstdCompressionDict(dictionary_bytes)
+                self._zstd_decompressors[dictionary.dict_id()] = (
+                    zstandard.ZstdDecompressor(dict_data=dictionary)
+                )
+            if codec == Codec.zstd_dict and dictionary is not None:
+                self._zstd_dict_id = dictionary.dict_id()
+                self._zstd_compressor = zstandard.ZstdCompressor(
+                    level=zstd_level, dict_data=dictionary
+                )
+            elif codec == Codec.zstd:
+                self._zstd_compressor = zstandard.ZstdCompressor(level=zstd_level)
+
+    @property
+    def persister(self) -> PersisterInterface:
+        return self._persister
+
+    @property
+    def codec(self) -> Codec:
+        return self._codec
+
+    @property
+    def compression_stats(self) -> CompressionStats:
+        return self._stats
+
+    def compress(self, content: bytes) -> bytes:
+        """Return content as a record with a codec header, which carries the
+        TypeName of content, if it has one."""
+        payload = content
+        type_name = event_type_name(content).encode(ENCODING)[:MAX_TYPE_NAME_BYTES]
+        type_flag = TYPE_NAME_FLAG if type_name else 0
+        type_field = bytes([len(type_name)]) + type_name if type_name else b""
+        header = RECORD_MARKER + bytes([Codec.none | type_flag]) + type_field
+        if self._codec != Codec.none and len(content) >= self._min_compress_bytes:
+            if self._codec == Codec.zlib:
+                compressed = zlib.compress(content, self._zlib_level)
+                compressed_header = (
+                    RECORD_MARKER + bytes([Codec.zlib | type_flag]) + type_field
+                )
+            else:
+                compressed = self._zstd_compressor.compress(content)
+                compressed_header = (
+                    RECORD_MARKER + bytes([self._codec | type_flag]) + type_field
+                )
+                if self._codec == Codec.zstd_dict:
+                    compressed_header += DICT_ID.pack(self._zstd_dict_id)
+            if len(compressed) + len(compressed_header) < len(content) + len(header):
+                payload = compressed
+                header = compressed_header
+        if payload is content:
+            self._stats.num_uncompressed += 1
+        else:
+            self._stats.num_compressed += 1
+        self._stats.content_bytes += len(content)
+        self._stats.stored_bytes += len(header) + len(payload)
+        return header + payload
+
+    def decompress(self, record: bytes) -> bytes:
+        """Return the content stored in record. Raise ValueError if the
+        record cannot be decompressed."""
+        if not record.startswith(RECORD_MARKER):
+            return record
+        codec = Codec(record[1] & ~TYPE_NAME_FLAG)
+        payload = record[2:]
+        if record[1] & TYPE_NAME_FLAG:
+            payload = payload[1 + payload[0] :]
+        if codec == Codec.none:
+            return payload
+        if codec == Codec.zlib:
+            return zlib.decompress(payload)
+        dict_id = 0
+        if codec == Codec.zstd_dict:
+            (dict_id,) = DICT_ID.unpack_from(payload)
+            payload = payload[DICT_ID.size :]
+        decompressor = self._zstd_decompressors.get(dict_id, None)
+        if decompressor is None:
+            raise ValueError(f"No zstd decompressor for dictionary id {dict_id}")
+        return bytes(decompressor.decompress(payload))
+
+    def persist(self, uid: str, content: bytes) -> Result[bool, Problems]:
+        try:
+            record = self.compress(content)
+        except Exception as e:  # noqa: BLE001
+            return Err(
+                Problems()
+                .add_error(e)
+                .add_error(PersisterError("Compression failed", uid=uid))
+            )
+        return self._persister.persist(uid, record)
+
+    def persist_many(
+        self, events: Sequence[tuple[str, bytes]]
+    ) -> Result[bool, Problems]:
+        problems = Problems()
+        records = []
+        for uid, content in events:
+            try:
+                records.append((uid, self.compress(content)))
+            except Exception as e:  # noqa: BLE001, PERF203
+                problems.add_error(e).add_error(
+                    PersisterError("Compression failed", uid=uid)
+                )
+        match self._persister.persist_many(records):
+            case Err(persist_problems):
+                problems.add_problems(persist_problems)
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _decompressed(
+        self, uid: str, result: Result[Optional[bytes], Problems]
+    ) -> Result[Optional[bytes], Problems]:
+        match result:
+            case Ok(record) if record:
+                try:
+                    return Ok(self.decompress(record))
+                except Exception as e:  # noqa: BLE001
+                    return Err(
+                        Problems().add_error(e).add_error(DecompressionError(uid=uid))
+                    )
+        return result
+
+    def retrieve(self, uid: str) -> Result[Optional[bytes], Problems]:
+        return self._decompressed(uid, self._persister.retrieve(uid))
+
+    def retrieve_many(
+        self, uids: Sequence[str]
+    ) -> dict[str, Result[Optional[bytes], Problems]]:
+        return {
+            uid: self._decompressed(uid, result)
+            for uid, result in self._persister.retrieve_many(uids).items()
+        }
+
+    def retrieve_many_later(
+        self, uids: Sequence[str]
+    ) -> "Future[dict[str, Result[Optional[bytes], Problems]]]":
+        """Content is retrieved by the wrapped persister's
+        retrieve_many_later() and decompressed when it completes."""
+        future: Future[dict[str, Result[Optional[bytes], Problems]]] = Future()
+
+        def decompress(
+            stored_future: "Future[dict[str, Result[Optional[bytes], Problems]]]",
+        ) -> None:
+            try:
+                future.set_result(
+                    {
+                        uid: self._decompressed(uid, result)
+                        for uid, result in stored_future.result().items()
+                    }
+                )
+            except Exception as e:  # noqa: BLE001
+                future.set_exception(e)
+
+        self._persister.retrieve_many_later(uids).add_done_callback(decompress)
+        return future
+
+    def clear(self, uid: str) -> Result[bool, Problems]:
+        return self._persister.clear(uid)
+
+    def clear_many(self, uids: Sequence[str]) -> Result[bool, Problems]:
+        return self._persister.clear_many(uids)
+
+    def pending_ids(self) -> list[str]:
+        return self._persister.pending_ids()
+
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:
+        return self._persister.iter_pending(after_uid)
+
+    @property
+    def num_pending(self) -> int:
+        return self._persister.num_pending
+
+    @property
+    def curr_bytes(self) -> int:
+        return self._persister.curr_bytes
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._persister
+
+    def expired(self, uid: str) -> bool:
+        return self._persister.expired(uid)
+
+    def reindex(self) -> Result[Optional[bool], Problems]:
+        return self._persister.reindex()
+
+    def flush(self) -> Result[bool, Problems]:
+        return self._persister.flush()
+
+    @property
+    def reindexing(self) -> bool:
+        return self._persister.reindexing
+
+    def take_reindex_problems(self) -> Optional[Problems]:
+        return self._persister.take_reindex_problems()
+
+    def take_dropped(self) -> Optional[list[str]]:
+        return self._persister.take_dropped()
+
+    @property
+    def num_persists(self) -> int:
+        return self._persister.num_persists
+
+    @property
+    def num_retrieves(self) -> int:
+        return self._persister.num_retrieves
+
+    @property
+    def num_clears(self) -> int:
+        return self._persister.num_clears
+
+    @property
+    def metrics(self) -> PersisterMetrics:
+        return self._persister.metrics
@@ -0,0 +1,215 @@
+"""Flushing of persisted files to stable storage.
+
+A Durability mode selects what persist() does before it returns:
+
+* none: Nothing. Durability depends on the filesystem.
+* fsync: Each written file and its directory are fsynced before persist()
+  returns.
+* group_commit: As for fsync, persist() returns only once its files and
+  their directories are fsynced, but writes made while a commit is running
+  share the next commit, which fsyncs each file once and each containing
+  directory once. One writer is never delayed; concurrent writers share
+  fsyncs. If other writers are already waiting when a commit starts, it
+  waits up to group_commit_seconds for more writes to join it.
+
+A single writer, such as a persister called only from the event loop, never
+overlaps its own commits, so its events share a commit only when written by
+one persist_many(). ThreadedPersister does this: persists queued while its
+I/O thread is busy are written by one persist_many().
+
+Deletes (clear()) are not synced. A lost delete means an event is uploaded
+twice, which acks already handle.
+"""
+
+import contextlib
+import enum
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+DEFAULT_GROUP_COMMIT_SECONDS = 0.05
+
+
+class Durability(enum.Enum):
+    none = "none"
+    fsync = "fsync"
+    group_commit = "group_commit"
+
+
+@dataclass
+class FsyncStats:
+    num_commits: int = 0
+    """Number of times written files were flushed to stable storage."""
+    num_writes: int = 0
+    """Number of written files flushed by those commits."""
+    num_fsyncs: int = 0
+    """Number of fsync() calls, including directory fsyncs."""
+    num_errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    last_seconds: float = 0.0
+
+    def record(self, seconds: float, num_writes: int, num_fsyncs: int) -> None:
+        self.num_commits += 1
+        self.num_writes += num_writes
+        self.num_fsyncs += num_fsyncs
+        self.total_seconds += seconds
+        self.last_seconds = seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    @property
+    def mean_seconds(self) -> float:
+        if self.num_commits:
+            return self.total_seconds / self.num_commits
+        return 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"FsyncStats  commits: {self.num_commits}  writes: {self.num_writes}  "
+            f"fsyncs: {self.num_fsyncs}  errors: {self.num_errors}  "
+            f"mean: {self.mean_seconds * 1000:.3f} ms  "
+            f"max: {self.max_seconds * 1000:.3f} ms"
+        )
+
+
+def fsync_path(path: Path) -> None:
+    """fsync a file or directory by path."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _Commit:
+    """Writes synced together by one group commit."""
+
+    paths: dict[Path, None]
+    num_writers: int = 0
+    done: bool = False
+    error: Optional[Exception] = None
+
+    def __init__(self) -> None:
+        self.paths = {}
+
+
+class FileSyncer:
+    """Flush files written by a persister to stable storage according to a
+    Durability mode, recording fsync latency in stats."""
+
+    _durability: Durability
+    _group_commit_seconds: float
+    _stats: FsyncStats
+    _condition: threading.Condition
+    _open: _Commit
+    """The commit that new writes join."""
+    _committing: bool = False
+
+    def __init__(
+        self,
+        durability: Durability = Durability.none,
+        group_commit_seconds: float = DEFAULT_GROUP_COMMIT_SECONDS,
+    ) -> None:
+        self._durability = durability
+        self._group_commit_seconds = group_commit_seconds
+        self._stats = FsyncStats()
+        self._condition = threading.Condition()
+        self._open = _Commit()
+
+    @property
+    def durability(self) -> Durability:
+        return self._durability
+
+    @property
+    def group_commit_seconds(self) -> float:
+        return self._group_commit_seconds
+
+    @property
+    def stats(self) -> FsyncStats:
+        return self._stats
+
+    def written(
+        self, path: Path, fd: Optional[int] = None, *, new_file: bool = True
+    ) -> None:
+        """Record that path was written. fd, if provided, is an open file
+        descriptor for path, used to avoid reopening it for Durability.fsync.
+        The directory is fsynced for Durability.fsync only if new_file is True.
+        Exceptions from fsync propagate."""
+        if self._durability == Durability.fsync:
+            start = time.perf_counter()
+            if fd is None:
+                fsync_path(path)
+            else:
+                os.fsync(fd)
+            if new_file:
+                fsync_path(path.parent)
+            self._stats.record(time.perf_counter() - start, 1, 1 + int(new_file))
+        elif self._durability == Durability.group_commit:
+            self._group_commit([path])
+
+    def written_many(self, paths: Sequence[Path]) -> None:
+        """Record that each of paths was written as a new file. For
+        Durability.fsync, each file is fsynced and then each containing
+        directory is fsynced once, as one commit. Exceptions from fsync
+        propagate."""
+        if not paths:
+            return
+        if self._durability == Durability.fsync:
+            start = time.perf_counter()
+            directories = dict.fromkeys(path.parent for path in paths)
+            for sync_path in [*paths, *directories]:
+                fsync_path(sync_path)
+            self._stats.record(
+                time.perf_counter() - start, len(paths), len(paths) + len(directories)
+            )
+        elif self._durability == Durability.group_commit:
+            self._group_commit(paths)
+
+    def _group_commit(self, paths: Sequence[Path]) -> None:
+        """Add paths to the open commit and return once it is done. If no
+        commit is running, this writer runs the open commit itself; otherwise
+        the open commit runs once the running one is done."""
+        with self._condition:
+            commit = self._open
+            commit.paths.update(dict.fromkeys(paths))
+            commit.num_writers += 1
+            while not commit.done and (self._committing or commit is not self._open):
+                self._condition.wait()
+            lead = not commit.done
+            if lead:
+                self._committing = True
+                if commit.num_writers > 1:
+                    # Writers are arriving concurrently; let more join.
+                    deadline = time.monotonic() + self._group_commit_seconds
+                    while (remaining := deadline - time.monotonic()) > 0:
+                        self._condition.wait(remaining)
+                self._open = _Commit()
+        if lead:
+            try:
+                self._commit(commit)
+            finally:
+                with self._condition:
+                    commit.done = True
+                    self._committing = False
+                    self._condition.notify_all()
+        if commit.error is not None:
+            raise commit.error
+
+    def _commit(self, commit: _Commit) -> None:
+        start = time.perf_counter()
+        paths = list(commit.paths)
+        num_fsyncs = 0
+        for sync_path in [*paths, *dict.fromkeys(path.parent for path in paths)]:
+            try:
+                # The file (or its directory) may be cleared before the commit.
+                with contextlib.suppress(FileNotFoundError):
+                    fsync_path(sync_path)
+                    num_fsyncs += 1
+            except Exception as e:  # noqa: BLE001, PERF203
+                self._stats.num_errors += 1
+                if commit.error is None:
+                    commit.error = e
+        self._stats.record(time.perf_counter() - start, len(paths), num_fsyncs)
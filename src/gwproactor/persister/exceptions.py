@@ -58,6 +58,9 @@ class JSONDecodingError(DecodingError): ...
 class EventDecodingError(DecodingError): ...
 
 
+class DecompressionError(DecodingError): ...
+
+
 class UIDExistedWarning(PersisterWarning): ...
 
 
@@ -71,3 +74,9 @@ class UIDMissingWarning(PersisterWarning): ...
 
 
 class FileEmptyWarning(PersisterWarning): ...
+
+
+class CorruptRecordWarning(PersisterWarning): ...
+
+
+class SizeMismatchWarning(PersisterWarning): ...
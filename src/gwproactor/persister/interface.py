@@ -1,27 +1,128 @@
 import abc
+import contextlib
+import itertools
+import operator
+import re
 from abc import abstractmethod
-from typing import Optional
+from concurrent.futures import Future
+from contextlib import AbstractContextManager
+from typing import Any, Iterator, Mapping, Optional, Sequence
 
-from result import Result
+from result import Err, Ok, Result
 
+from gwproactor.persister.metrics import PersisterMetrics
 from gwproactor.problems import Problems
 
 ENCODING: str = "utf-8"
+PENDING_PAGE_SIZE: int = 256
+TYPE_NAME_RGX: re.Pattern[bytes] = re.compile(rb'"TypeName":\s*"([\w.\-]+)"')
+WIRE_TYPE_NAME_RGX: re.Pattern[bytes] = re.compile(
+    rb'\{"Header":\{[^{}]*"MessageType":\s*"([\w.\-]+)"'
+)
+
+
+def event_type_name(content: bytes) -> str:
+    """Return the TypeName of JSON event content, or "" if not found.
+
+    Content persisted as a complete upstream message (see
+    gwproactor.links.wire) starts with its Header, whose MessageType is the
+    event's TypeName. For other content the first TypeName is used; it is the
+    event's own, since gwproto events serialize TypeName ahead of their
+    nested content."""
+    match = WIRE_TYPE_NAME_RGX.match(content) or TYPE_NAME_RGX.search(content)
+    return match.group(1).decode(ENCODING) if match else ""
+
+
+def iter_pending_pages(
+    pending: Mapping[str, Any],
+    after_uid: Optional[str] = None,
+    lock: Optional[AbstractContextManager[Any]] = None,
+    page_size: int = PENDING_PAGE_SIZE,
+) -> Iterator[str]:
+    """Yield the keys of pending which follow after_uid, or all keys if
+    after_uid is None or not in pending.
+
+    Keys are copied page_size at a time, each page while holding lock if it is
+    provided, so pending may change between pages. Each page resumes after
+    the last key of the previous page; if that key has since been removed,
+    the next page starts again from the first key. Finding that key scans the
+    keys before it, in C by operator.indexOf(), once per page; a caller
+    taking a few keys at a time should keep one iterator rather than call
+    again with each new after_uid.
+    """
+    if lock is None:
+        lock = contextlib.nullcontext()
+    while True:
+        with lock:
+            uids = iter(pending)
+            if after_uid is not None and after_uid in pending:
+                # Consumes uids up to and including after_uid.
+                operator.indexOf(uids, after_uid)
+            page = list(itertools.islice(uids, page_size))
+        yield from page
+        if len(page) < page_size:
+            return
+        after_uid = page[-1]
 
 
 class PersisterInterface(abc.ABC):
+    _metrics: Optional[PersisterMetrics] = None
+
     @abstractmethod
     def persist(self, uid: str, content: bytes) -> Result[bool, Problems]:
         """Persist content, indexed by uid"""
 
+    def persist_many(
+        self, events: Sequence[tuple[str, bytes]]
+    ) -> Result[bool, Problems]:
+        """Persist each (uid, content) pair, in order. Equivalent to calling
+        persist() for each pair, but an implementation may share writes,
+        syncs and trimming across the batch."""
+        problems = Problems()
+        for uid, content in events:
+            match self.persist(uid, content):
+                case Err(persist_problems):
+                    problems.add_problems(persist_problems)
+        if problems:
+            return Err(problems)
+        return Ok()
+
     @abstractmethod
     def clear(self, uid: str) -> Result[bool, Problems]:
         """Delete content persisted for uid. It is error to clear a uid which is not currently persisted."""
 
+    def clear_many(self, uids: Sequence[str]) -> Result[bool, Problems]:
+        """Delete content persisted for each uid. Equivalent to calling
+        clear() for each uid."""
+        problems = Problems()
+        for uid in uids:
+            match self.clear(uid):
+                case Err(clear_problems):
+                    problems.add_problems(clear_problems)
+        if problems:
+            return Err(problems)
+        return Ok()
+
     @abstractmethod
     def pending_ids(self) -> list[str]:
         """Get list of pending (persisted and not cleared) uids"""
 
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:
+        """Yield pending uids in the order of pending_ids(), starting after
+        after_uid, or from the oldest if after_uid is None or not pending.
+
+        Unlike pending_ids(), the whole index need not be copied. The
+        iterator should be used up or dropped before the persister is next
+        modified; to resume later, call iter_pending() again with the last
+        uid seen. By default this copies pending_ids().
+        """
+        pending_ids = self.pending_ids()
+        start = 0
+        if after_uid is not None:
+            with contextlib.suppress(ValueError):
+                start = pending_ids.index(after_uid) + 1
+        yield from pending_ids[start:]
+
     @property
     @abstractmethod
     def num_pending(self) -> int:
@@ -36,14 +137,64 @@ class PersisterInterface(abc.ABC):
     def __contains__(self, uid: str) -> bool:
         """Check whether a uid is pending"""
 
+    def expired(self, uid: str) -> bool:  # noqa: ARG002
+        """Check whether a pending uid is older than the persister's
+        retention policy, and so need not be uploaded."""
+        return False
+
     @abstractmethod
     def retrieve(self, uid: str) -> Result[Optional[bytes], Problems]:
         """Load and return persisted content for uid"""
 
+    def retrieve_many(
+        self, uids: Sequence[str]
+    ) -> dict[str, Result[Optional[bytes], Problems]]:
+        """Load persisted content for each uid, returning the result of
+        retrieve() for each uid, in the order of uids."""
+        return {uid: self.retrieve(uid) for uid in uids}
+
+    def retrieve_many_later(
+        self, uids: Sequence[str]
+    ) -> "Future[dict[str, Result[Optional[bytes], Problems]]]":
+        """Start retrieve_many(uids) and return a Future of its result.
+
+        By default the retrieve runs before returning. A persister with its
+        own I/O thread runs it there instead, so the caller does not wait on
+        storage; the Future then completes in that thread.
+        """
+        future: Future[dict[str, Result[Optional[bytes], Problems]]] = Future()
+        future.set_result(self.retrieve_many(uids))
+        return future
+
     @abstractmethod
     def reindex(self) -> Result[Optional[bool], Problems]:
         """Re-created pending index from persisted storage"""
 
+    def flush(self) -> Result[bool, Problems]:
+        """Flush persisted content which is not yet on stable storage."""
+        return Ok()
+
+    @property
+    def reindexing(self) -> bool:
+        """True while a reindex started by reindex() continues in the
+        background. While reindexing, pending_ids() may be incomplete."""
+        return False
+
+    def take_reindex_problems(self) -> Optional[Problems]:
+        """Return and forget any problems found by a background reindex."""
+        return None
+
+    def take_dropped(self) -> Optional[list[str]]:
+        """Return and forget the uids the persister removed by itself, by
+        trimming, expiry or verification rather than clear(), since the
+        previous call.
+
+        Recording starts with the first call, so a persister whose drops
+        nobody takes does not accumulate them. Returns None if the persister
+        does not record its drops; callers must then re-read pending_ids().
+        """
+        return None
+
     @property
     @abstractmethod
     def num_persists(self) -> int:
@@ -58,3 +209,12 @@ class PersisterInterface(abc.ABC):
     @abstractmethod
     def num_clears(self) -> int:
         """Total number of calls to clear() since construction."""
+
+    @property
+    def metrics(self) -> PersisterMetrics:
+        """Latency histograms and byte counts of storage operations. A
+        persister wrapping another returns the metrics of the wrapped
+        persister."""
+        if self._metrics is None:
+            self._metrics = PersisterMetrics()
+        return self._metrics
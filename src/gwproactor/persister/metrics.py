@@ -0,0 +1,126 @@
+"""Latency histograms and byte counts for persister operations.
+
+Each persister records, for persist, retrieve, clear, trim and reindex, the
+latency of every call in a LatencyHistogram and the number of bytes and
+events involved. Histogram buckets are powers of two of microseconds, so
+memory is fixed regardless of the number of calls, and percentiles are
+accurate to within a factor of two. That is enough to see storage latency
+creeping up by orders of magnitude, as failing flash does, long before it
+causes watchdog timeouts.
+
+Operations are timed with time.perf_counter():
+
+    start = time.perf_counter()
+    ...
+    self.metrics.persist.record(start, num_bytes, num_events)
+"""
+
+import time
+from dataclasses import dataclass, field
+
+NUM_BUCKETS = 32
+"""Bucket i counts latencies in [2**(i-1), 2**i) microseconds; the last
+bucket also counts anything longer, about 36 minutes and up."""
+
+
+@dataclass
+class LatencyHistogram:
+    buckets: list[int] = field(default_factory=lambda: [0] * NUM_BUCKETS)
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @classmethod
+    def bucket_index(cls, seconds: float) -> int:
+        return min(int(seconds * 1_000_000).bit_length(), NUM_BUCKETS - 1)
+
+    @classmethod
+    def bucket_limit(cls, index: int) -> float:
+        """Upper limit of bucket index, in seconds."""
+        return (1 << index) / 1_000_000
+
+    def add(self, seconds: float) -> None:
+        self.buckets[self.bucket_index(seconds)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.count if self.count else 0.0
+
+    def percentile(self, pct: float) -> float:
+        """Return an upper bound, in seconds, of the pct percentile."""
+        if not self.count:
+            return 0.0
+        rank = max(pct * self.count / 100, 1)
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.bucket_limit(index), self.max_seconds)
+        return self.max_seconds  # pragma: no cover
+
+    def clear(self) -> None:
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+
+@dataclass
+class OperationMetrics:
+    name: str
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+    num_bytes: int = 0
+    num_items: int = 0
+
+    def record(self, start: float, num_bytes: int = 0, num_items: int = 1) -> None:
+        """Record a call which started at time.perf_counter() start."""
+        self.latency.add(time.perf_counter() - start)
+        self.num_bytes += num_bytes
+        self.num_items += num_items
+
+    def clear(self) -> None:
+        self.latency.clear()
+        self.num_bytes = 0
+        self.num_items = 0
+
+    def __str__(self) -> str:
+        latency = self.latency
+        return (
+            f"{self.name:8s}  calls: {latency.count:7d}  items: {self.num_items:7d}  "
+            f"bytes: {self.num_bytes:11d}  "
+            f"mean: {latency.mean_seconds * 1000:9.3f}  "
+            f"p50: {latency.percentile(50) * 1000:9.3f}  "
+            f"p99: {latency.percentile(99) * 1000:9.3f}  "
+            f"max: {latency.max_seconds * 1000:9.3f} ms"
+        )
+
+
+@dataclass
+class PersisterMetrics:
+    persist: OperationMetrics = field(
+        default_factory=lambda: OperationMetrics("persist")
+    )
+    retrieve: OperationMetrics = field(
+        default_factory=lambda: OperationMetrics("retrieve")
+    )
+    clear: OperationMetrics = field(default_factory=lambda: OperationMetrics("clear"))
+    trim: OperationMetrics = field(default_factory=lambda: OperationMetrics("trim"))
+    reindex: OperationMetrics = field(
+        default_factory=lambda: OperationMetrics("reindex")
+    )
+
+    def operations(self) -> list[OperationMetrics]:
+        return [self.persist, self.retrieve, self.clear, self.trim, self.reindex]
+
+    def reset(self) -> None:
+        for operation in self.operations():
+            operation.clear()
+
+    def __str__(self) -> str:
+        s = "Persister operations:"
+        for operation in self.operations():
+            s += f"\n    {operation}"
+        return s
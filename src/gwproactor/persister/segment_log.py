@@ -0,0 +1,655 @@
+"""An append-only, segment-file based event persister.
+
+Records are appended to rolling segment files instead of being written one file
+per event. An in-memory index maps each uid to the location of its content.
+Clearing a uid appends a small tombstone record. A segment file is deleted once
+every record in it has been cleared and all older segments have been deleted.
+
+Each record on disk is:
+
+    header (struct RECORD_HEADER) | uid bytes | content bytes
+
+The header contains a marker byte, the record kind (data or tombstone), the
+uid length, the content length and a crc32 of uid and content, which allows
+reindex() to detect records torn by a crash.
+
+If retention_seconds is provided, a segment last written more than
+retention_seconds ago is expired, along with every record in it. Expired
+segments at the front of the log are deleted whenever the current segment
+rolls over.
+"""
+
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Sequence
+
+from result import Err, Ok, Result
+
+from gwproactor.persister.durability import (
+    DEFAULT_GROUP_COMMIT_SECONDS,
+    Durability,
+    FileSyncer,
+    FsyncStats,
+)
+from gwproactor.persister.exceptions import (
+    ContentTooLarge,
+    CorruptRecordWarning,
+    PersisterError,
+    ReadFailed,
+    ReindexError,
+    TrimFailed,
+    UIDExistedWarning,
+    UIDMissingWarning,
+    WriteFailed,
+)
+from gwproactor.persister.interface import (
+    ENCODING,
+    PersisterInterface,
+    iter_pending_pages,
+)
+from gwproactor.problems import Problems
+
+RECORD_MARKER: int = 0xA5
+RECORD_DATA: int = 1
+RECORD_TOMBSTONE: int = 2
+RECORD_HEADER = struct.Struct("<BBHII")
+
+
+class _SegmentRecord(NamedTuple):
+    segment_id: int
+    content_offset: int
+    content_length: int
+
+
+class _Segment:
+    segment_id: int
+    path: Path
+    num_bytes: int = 0
+    live: dict[str, None]
+    """Uids whose current record is in this segment, so that deleting the
+    segment drops them from the index without scanning it."""
+    last_written: float = 0.0
+
+    def __init__(self, segment_id: int, path: Path, num_bytes: int = 0) -> None:
+        self.segment_id = segment_id
+        self.path = path
+        self.num_bytes = num_bytes
+        self.live = {}
+        self.last_written = time.time()
+
+    @property
+    def num_live(self) -> int:
+        return len(self.live)
+
+
+class SegmentLogPersister(PersisterInterface):
+    DEFAULT_MAX_BYTES: int = 500 * 1024 * 1024
+    DEFAULT_SEGMENT_BYTES: int = 4 * 1024 * 1024
+    SEGMENT_SUFFIX: str = ".seg"
+
+    _base_dir: Path
+    _max_bytes: int = DEFAULT_MAX_BYTES
+    _segment_bytes: int = DEFAULT_SEGMENT_BYTES
+    _pending: dict[str, _SegmentRecord]
+    _segments: dict[int, _Segment]
+    _curr_bytes: int
+    _writer: Optional[BinaryIO] = None
+    _writer_segment: Optional[_Segment] = None
+    _unsynced_new_file: Optional[bool] = None
+    _reader: Optional[BinaryIO] = None
+    _reader_segment_id: int = -1
+    _next_segment_id: int = 0
+    _syncer: FileSyncer
+    _num_persists: int = 0
+    _num_retrieves: int = 0
+    _num_clears: int = 0
+    _retention_seconds: Optional[float] = None
+    _num_expired: int = 0
+    _dropped: Optional[dict[str, None]] = None
+
+    def __init__(  # noqa: PLR0913
+        self,
+        base_dir: Path | str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+        durability: Durability = Durability.none,
+        group_commit_seconds: float = DEFAULT_GROUP_COMMIT_SECONDS,
+        retention_seconds: Optional[float] = None,
+    ) -> None:
+        self._base_dir = Path(base_dir).resolve()
+        self._retention_seconds = retention_seconds
+        self._max_bytes = max_bytes
+        self._segment_bytes = segment_bytes
+        self._syncer = FileSyncer(durability, group_commit_seconds)
+        self._pending = {}
+        self._segments = {}
+        self._curr_bytes = 0
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def segment_bytes(self) -> int:
+        return self._segment_bytes
+
+    @property
+    def curr_bytes(self) -> int:
+        return self._curr_bytes
+
+    @property
+    def base_dir(self) -> Path:
+        return self._base_dir
+
+    @property
+    def num_segments(self) -> int:
+        return len(self._segments)
+
+    @property
+    def retention_seconds(self) -> Optional[float]:
+        return self._retention_seconds
+
+    @property
+    def num_expired(self) -> int:
+        """Number of expired records dropped."""
+        return self._num_expired
+
+    @property
+    def durability(self) -> Durability:
+        return self._syncer.durability
+
+    @property
+    def fsync_stats(self) -> FsyncStats:
+        return self._syncer.stats
+
+    @classmethod
+    def record_size(cls, uid: str, content_length: int = 0) -> int:
+        return RECORD_HEADER.size + len(uid.encode(ENCODING)) + content_length
+
+    def segment_paths(self) -> list[Path]:
+        return [segment.path for segment in self._segments.values()]
+
+    def persist(self, uid: str, content: bytes) -> Result[bool, Problems]:
+        start = time.perf_counter()
+        self._num_persists += 1
+        problems = Problems()
+        self._persist(uid, content, problems)
+        self._sync_writer(problems)
+        self.metrics.persist.record(start, len(content))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def persist_many(
+        self, events: Sequence[tuple[str, bytes]]
+    ) -> Result[bool, Problems]:
+        """Append all records before flushing and syncing the segment once."""
+        start = time.perf_counter()
+        self._num_persists += len(events)
+        problems = Problems()
+        for uid, content in events:
+            self._persist(uid, content, problems)
+        self._sync_writer(problems)
+        self.metrics.persist.record(
+            start, sum(len(content) for _, content in events), len(events)
+        )
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _persist(self, uid: str, content: bytes, problems: Problems) -> None:
+        """Append a data record for uid, without syncing the current segment."""
+        try:
+            record_size = self.record_size(uid, len(content))
+            if record_size > self._max_bytes:
+                problems.add_error(
+                    ContentTooLarge(
+                        f"record bytes ({record_size}) > max bytes ({self._max_bytes})",
+                        uid=uid,
+                    )
+                )
+                return
+            existing = self._pending.pop(uid, None)
+            if existing is not None:
+                problems.add_warning(
+                    UIDExistedWarning(
+                        uid=uid, path=self._segments[existing.segment_id].path
+                    )
+                )
+                self._segments[existing.segment_id].live.pop(uid, None)
+            if record_size + self._curr_bytes > self._max_bytes:
+                match self._trim_old_storage(record_size):
+                    case Err(trim_problems):
+                        problems.add_problems(trim_problems)
+                        if problems.errors:
+                            problems.add_error(TrimFailed(uid=uid))
+                            return
+            try:
+                segment, content_offset = self._append(RECORD_DATA, uid, content)
+            except Exception as e:  # pragma: no cover  # noqa: BLE001
+                problems.add_error(e).add_error(
+                    WriteFailed("Open or write failed", uid=uid)
+                )
+                return
+            segment.live[uid] = None
+            self._pending[uid] = _SegmentRecord(
+                segment.segment_id, content_offset, len(content)
+            )
+            if existing is not None:
+                self._delete_cleared_segments()
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(PersisterError("Unexpected error", uid=uid))
+
+    def _trim_old_storage(self, needed_bytes: int) -> Result[bool, Problems]:
+        """Delete whole segments, oldest first, until needed_bytes fit."""
+        start = time.perf_counter()
+        curr_bytes = self._curr_bytes
+        num_pending = len(self._pending)
+        problems = Problems()
+        while self._segments and self._curr_bytes + needed_bytes > self._max_bytes:
+            segment = next(iter(self._segments.values()))
+            try:
+                for uid in segment.live:
+                    self._pending.pop(uid)
+                if self._dropped is not None:
+                    self._dropped.update(segment.live)
+                segment.live.clear()
+                self._delete_segment(segment)
+            except Exception as e:  # noqa: BLE001
+                problems.add_error(e).add_error(
+                    PersisterError("Unexpected error", path=segment.path)
+                )
+                break
+        self.metrics.trim.record(
+            start, curr_bytes - self._curr_bytes, num_pending - len(self._pending)
+        )
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def clear(self, uid: str) -> Result[bool, Problems]:
+        start = time.perf_counter()
+        curr_bytes = self._curr_bytes
+        self._num_clears += 1
+        problems = Problems()
+        self._clear(uid, problems)
+        self._delete_cleared_segments()
+        self._sync_writer(problems)
+        self.metrics.clear.record(start, curr_bytes - self._curr_bytes)
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def clear_many(self, uids: Sequence[str]) -> Result[bool, Problems]:
+        """Append all tombstones before deleting cleared segments and syncing
+        the current segment once."""
+        start = time.perf_counter()
+        curr_bytes = self._curr_bytes
+        self._num_clears += len(uids)
+        problems = Problems()
+        for uid in uids:
+            self._clear(uid, problems)
+        self._delete_cleared_segments()
+        self._sync_writer(problems)
+        self.metrics.clear.record(start, curr_bytes - self._curr_bytes, len(uids))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _clear(self, uid: str, problems: Problems) -> None:
+        record = self._pending.pop(uid, None)
+        if record is not None:
+            try:
+                self._segments[record.segment_id].live.pop(uid, None)
+                self._append(RECORD_TOMBSTONE, uid)
+            except Exception as e:  # noqa: BLE001
+                problems.add_error(e).add_error(
+                    WriteFailed("Tombstone write failed", uid=uid)
+                )
+        else:
+            problems.add_warning(UIDMissingWarning(uid=uid))
+
+    def pending_ids(self) -> list[str]:
+        return list(self._pending.keys())
+
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:
+        return iter_pending_pages(self._pending, after_uid)
+
+    @property
+    def num_pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def num_persists(self) -> int:
+        return self._num_persists
+
+    @property
+    def num_retrieves(self) -> int:
+        return self._num_retrieves
+
+    @property
+    def num_clears(self) -> int:
+        return self._num_clears
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._pending
+
+    def expired(self, uid: str) -> bool:
+        record = self._pending.get(uid, None)
+        return record is not None and self._segment_expired(
+            self._segments[record.segment_id], time.time()
+        )
+
+    def _segment_expired(self, segment: _Segment, now: float) -> bool:
+        return (
+            self._retention_seconds is not None
+            and segment.last_written < now - self._retention_seconds
+        )
+
+    def drop_expired(self) -> Result[bool, Problems]:
+        """Delete expired segments, oldest first, other than the current
+        one. Segments are only deleted from the front of the log, as by
+        trimming."""
+        problems = Problems()
+        try:
+            self._drop_expired()
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(PersisterError("Drop expired failed"))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _drop_expired(self) -> None:
+        now = time.time()
+        while self._segments:
+            segment = next(iter(self._segments.values()))
+            if segment is self._writer_segment or not self._segment_expired(
+                segment, now
+            ):
+                break
+            for uid in segment.live:
+                self._pending.pop(uid)
+            if self._dropped is not None:
+                self._dropped.update(segment.live)
+            self._num_expired += segment.num_live
+            segment.live.clear()
+            self._delete_segment(segment)
+
+    def get_path(self, uid: str) -> Optional[Path]:
+        record = self._pending.get(uid, None)
+        if record is None:
+            return None
+        return self._segments[record.segment_id].path
+
+    def retrieve(self, uid: str) -> Result[Optional[bytes], Problems]:
+        start = time.perf_counter()
+        self._num_retrieves += 1
+        result = self._read(uid)
+        self.metrics.retrieve.record(start, self._content_length(result))
+        return result
+
+    def retrieve_many(
+        self, uids: Sequence[str]
+    ) -> dict[str, Result[Optional[bytes], Problems]]:
+        """Read records in segment and offset order, so that each segment is
+        opened once and read front to back."""
+        start = time.perf_counter()
+        self._num_retrieves += len(uids)
+        results = {
+            uid: self._read(uid)
+            for uid in sorted(
+                uids, key=lambda uid: self._pending.get(uid, _SegmentRecord(-1, 0, 0))
+            )
+        }
+        self.metrics.retrieve.record(
+            start,
+            sum(self._content_length(result) for result in results.values()),
+            len(uids),
+        )
+        return {uid: results[uid] for uid in uids}
+
+    @classmethod
+    def _content_length(cls, result: Result[Optional[bytes], Problems]) -> int:
+        match result:
+            case Ok(content) if content is not None:
+                return len(content)
+        return 0
+
+    def _read(self, uid: str) -> Result[Optional[bytes], Problems]:
+        problems = Problems()
+        content: Optional[bytes] = None
+        record = self._pending.get(uid, None)
+        if record is not None:
+            path = self._segments[record.segment_id].path
+            try:
+                reader = self._get_reader(record.segment_id)
+                reader.seek(record.content_offset)
+                content = reader.read(record.content_length)
+                if len(content) != record.content_length:
+                    content = None
+                    problems.add_error(ReadFailed("Short read", uid=uid, path=path))
+            except Exception as e:  # noqa: BLE001
+                problems.add_error(e).add_error(
+                    ReadFailed("Open or read failed", uid=uid, path=path)
+                )
+        if problems:
+            return Err(problems)
+        return Ok(content)
+
+    def reindex(self) -> Result[Optional[bool], Problems]:
+        start = time.perf_counter()
+        problems = Problems()
+        self._close_files()
+        self._pending = {}
+        self._segments = {}
+        self._curr_bytes = 0
+        self._next_segment_id = 0
+        if self._base_dir.exists():
+            segment_paths = [
+                (int(path.stem), path)
+                for path in self._base_dir.iterdir()
+                if path.suffix == self.SEGMENT_SUFFIX and path.stem.isdigit()
+            ]
+            for segment_id, path in sorted(segment_paths):
+                try:
+                    self._reindex_segment(segment_id, path, problems)
+                except Exception as e:  # noqa: BLE001, PERF203
+                    problems.add_error(e).add_error(ReindexError(path=path))
+                self._next_segment_id = segment_id + 1
+            self._delete_cleared_segments(include_writer=True)
+        self.metrics.reindex.record(start, self._curr_bytes, len(self._pending))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def flush(self) -> Result[bool, Problems]:
+        problems = Problems()
+        try:
+            if self._writer is not None:
+                self._writer.flush()
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(PersisterError("Flush failed"))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    @property
+    def reindexing(self) -> bool:
+        return False
+
+    def take_reindex_problems(self) -> Optional[Problems]:
+        return None
+
+    def take_dropped(self) -> Optional[list[str]]:
+        dropped = list(self._dropped or ())
+        self._dropped = {}
+        return dropped
+
+    def _reindex_segment(self, segment_id: int, path: Path, problems: Problems) -> None:
+        with path.open("rb") as f:
+            data = f.read()
+        segment = _Segment(segment_id, path)
+        segment.last_written = path.stat().st_mtime
+        self._segments[segment_id] = segment
+        offset = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            marker, kind, uid_length, content_length, crc = RECORD_HEADER.unpack_from(
+                data, offset
+            )
+            uid_offset = offset + RECORD_HEADER.size
+            content_offset = uid_offset + uid_length
+            end = content_offset + content_length
+            if (
+                marker != RECORD_MARKER
+                or kind not in {RECORD_DATA, RECORD_TOMBSTONE}
+                or end > len(data)
+                or zlib.crc32(data[uid_offset:end]) != crc
+            ):
+                break
+            uid = data[uid_offset:content_offset].decode(ENCODING)
+            existing = self._pending.pop(uid, None)
+            if existing is not None:
+                self._segments[existing.segment_id].live.pop(uid, None)
+            if kind == RECORD_DATA:
+                self._pending[uid] = _SegmentRecord(
+                    segment_id, content_offset, content_length
+                )
+                segment.live[uid] = None
+            offset = end
+        if offset != len(data):
+            problems.add_warning(
+                CorruptRecordWarning(
+                    f"{len(data) - offset} bytes ignored at offset {offset}",
+                    path=path,
+                )
+            )
+        segment.num_bytes = offset
+        self._curr_bytes += offset
+
+    def _segment_path(self, segment_id: int) -> Path:
+        return self._base_dir / f"{segment_id:016d}{self.SEGMENT_SUFFIX}"
+
+    def _get_reader(self, segment_id: int) -> BinaryIO:
+        if (
+            self._writer is not None
+            and self._writer_segment is not None
+            and self._writer_segment.segment_id == segment_id
+        ):
+            self._writer.flush()
+        if self._reader is None or self._reader_segment_id != segment_id:
+            self._close_reader()
+            self._reader = self._segments[segment_id].path.open("rb")
+            self._reader_segment_id = segment_id
+        return self._reader
+
+    def _open_writer(self) -> tuple[BinaryIO, _Segment]:
+        if self._writer is None or self._writer_segment is None:
+            self._base_dir.mkdir(parents=True, exist_ok=True)
+            segment_id = self._next_segment_id
+            self._next_segment_id += 1
+            segment = _Segment(segment_id, self._segment_path(segment_id))
+            # Never append to a segment found at reindex; it may have a torn tail.
+            self._writer = segment.path.open("xb")
+            self._writer_segment = segment
+            self._segments[segment_id] = segment
+        return self._writer, self._writer_segment
+
+    def _append(
+        self, kind: int, uid: str, content: bytes = b""
+    ) -> tuple[_Segment, int]:
+        """Append one record to the current segment, rolling it first if full.
+        Return the segment and the offset of the content within it. The record
+        is buffered until _sync_writer() is called."""
+        if (
+            self._writer_segment is not None
+            and self._writer_segment.num_bytes >= self._segment_bytes
+        ):
+            self._sync_writer()
+            self._close_writer()
+            self._drop_expired()
+        writer, segment = self._open_writer()
+        uid_bytes = uid.encode(ENCODING)
+        writer.write(
+            RECORD_HEADER.pack(
+                RECORD_MARKER,
+                kind,
+                len(uid_bytes),
+                len(content),
+                zlib.crc32(content, zlib.crc32(uid_bytes)),
+            )
+        )
+        writer.write(uid_bytes)
+        writer.write(content)
+        if self._unsynced_new_file is None:
+            self._unsynced_new_file = not segment.num_bytes
+        content_offset = segment.num_bytes + RECORD_HEADER.size + len(uid_bytes)
+        record_size = RECORD_HEADER.size + len(uid_bytes) + len(content)
+        segment.num_bytes += record_size
+        segment.last_written = time.time()
+        self._curr_bytes += record_size
+        return segment, content_offset
+
+    def _sync_writer(self, problems: Optional[Problems] = None) -> None:
+        """Flush records appended to the current segment and pass them to the
+        syncer. Exceptions are added to problems if it is provided."""
+        try:
+            if self._writer is not None and self._writer_segment is not None:
+                self._writer.flush()
+                if self._unsynced_new_file is not None:
+                    self._syncer.written(
+                        self._writer_segment.path,
+                        self._writer.fileno(),
+                        new_file=self._unsynced_new_file,
+                    )
+        except Exception as e:
+            if problems is None:
+                raise
+            problems.add_error(e).add_error(WriteFailed("Flush or sync failed"))
+        finally:
+            self._unsynced_new_file = None
+
+    def _delete_cleared_segments(self, *, include_writer: bool = False) -> None:
+        """Delete fully cleared segments, oldest first.
+
+        Segments are only deleted from the front so that tombstones are never
+        deleted while the records they clear still exist in an older segment.
+        """
+        while self._segments:
+            segment = next(iter(self._segments.values()))
+            if segment.num_live > 0:
+                break
+            if segment is self._writer_segment and not include_writer:
+                if len(self._segments) == 1 and segment.num_bytes:
+                    # The writer segment is the only segment left and
+                    # everything in it is cleared; start fresh.
+                    self._delete_segment(segment)
+                break
+            self._delete_segment(segment)
+
+    def _delete_segment(self, segment: _Segment) -> None:
+        if segment is self._writer_segment:
+            self._close_writer()
+        if self._reader_segment_id == segment.segment_id:
+            self._close_reader()
+        self._segments.pop(segment.segment_id, None)
+        self._curr_bytes -= segment.num_bytes
+        segment.path.unlink(missing_ok=True)
+
+    def _close_writer(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+        self._writer_segment = None
+        self._unsynced_new_file = None
+
+    def _close_reader(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = None
+        self._reader_segment_id = -1
+
+    def _close_files(self) -> None:
+        self._close_writer()
+        self._close_reader()
@@ -0,0 +1,582 @@
+"""An event persister backed by a single SQLite database in WAL mode.
+
+Events are rows of one table, ordered by an insertion sequence number:
+
+    events(seq INTEGER PRIMARY KEY AUTOINCREMENT, uid TEXT UNIQUE, content BLOB, size INTEGER)
+
+persist() and clear() are each atomic. Each runs in a savepoint of the open
+transaction, so an operation that fails undoes only its own changes, never
+those of earlier operations awaiting a group commit. reindex() only opens the
+database and reads the row count and total size. Trimming deletes the oldest
+events with one ranged DELETE.
+
+Durability maps to SQLite settings:
+
+* none: synchronous=NORMAL, one transaction per operation. A committed event
+  survives a process crash; a power loss may lose the most recent commits.
+* fsync: synchronous=FULL, one transaction per operation.
+* group_commit: synchronous=FULL. As with the file persisters' group commit,
+  persist() and clear() return only once committed, but concurrent writers
+  share commits. A writer that completes an operation while other writers
+  are active waits, with the lock released, for their operations to join its
+  transaction, until they all have, batch_size operations are pending or
+  group_commit_seconds have passed, then commits them all. A lone writer
+  commits at once, so grouping a single writer's events takes
+  persist_many().
+"""
+
+import contextlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
+
+from result import Err, Ok, Result
+
+from gwproactor.persister.durability import (
+    DEFAULT_GROUP_COMMIT_SECONDS,
+    Durability,
+    FsyncStats,
+)
+from gwproactor.persister.exceptions import (
+    ContentTooLarge,
+    PersisterError,
+    ReadFailed,
+    ReindexError,
+    TrimFailed,
+    UIDExistedWarning,
+    UIDMissingWarning,
+    WriteFailed,
+)
+from gwproactor.persister.interface import PENDING_PAGE_SIZE, PersisterInterface
+from gwproactor.problems import Problems
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT NOT NULL UNIQUE,
+    content BLOB NOT NULL,
+    size INTEGER NOT NULL
+)
+"""
+
+# The highest seq such that deleting every event up to and including it frees
+# at least the requested number of bytes, with the count and bytes freed.
+TRIM_BOUNDARY_QUERY = """
+SELECT seq, num_events, num_bytes FROM (
+    SELECT
+        seq,
+        ROW_NUMBER() OVER w AS num_events,
+        SUM(size) OVER w AS num_bytes
+    FROM events
+    WINDOW w AS (ORDER BY seq)
+)
+WHERE num_bytes >= ?
+LIMIT 1
+"""
+
+
+class SQLitePersister(PersisterInterface):
+    DEFAULT_MAX_BYTES: int = 500 * 1024 * 1024
+    DEFAULT_BATCH_SIZE: int = 100
+    DB_NAME: str = "events.sqlite"
+    MAX_PARAMETERS: int = 500
+
+    _db_path: Path
+    _max_bytes: int = DEFAULT_MAX_BYTES
+    _durability: Durability
+    _group_commit_seconds: float
+    _batch_size: int
+    _connection: Optional[sqlite3.Connection] = None
+    _lock: threading.RLock
+    _num_pending: int = 0
+    _curr_bytes: int = 0
+    _num_uncommitted: int = 0
+    _commit_condition: threading.Condition
+    _commit_deadline: Optional[float] = None
+    """When the open group commit is due, if a writer is waiting for one."""
+    _commit_generation: int = 0
+    """Number of commits attempted. Writers wait for it to change."""
+    _failed_generation: int = -1
+    """The _commit_generation of the last commit that failed."""
+    _writers_lock: threading.Lock
+    _num_writers: int = 0
+    """Writers in persist_many() or clear_many(), including any waiting for
+    the lock."""
+    _num_waiting: int = 0
+    """Writers waiting in _operation_complete() for a group commit."""
+    _fsync_stats: FsyncStats
+    _num_persists: int = 0
+    _num_retrieves: int = 0
+    _num_clears: int = 0
+    _dropped: Optional[dict[str, None]] = None
+
+    def __init__(
+        self,
+        db_path: Path | str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        durability: Durability = Durability.none,
+        group_commit_seconds: float = DEFAULT_GROUP_COMMIT_SECONDS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> None:
+        """db_path may be a directory, in which case the database is
+        db_path/DB_NAME."""
+        db_path = Path(db_path).resolve()
+        if db_path.is_dir():
+            db_path /= self.DB_NAME
+        self._db_path = db_path
+        self._max_bytes = max_bytes
+        self._durability = durability
+        self._group_commit_seconds = group_commit_seconds
+        self._batch_size = batch_size
+        self._lock = threading.RLock()
+        self._commit_condition = threading.Condition(self._lock)
+        self._writers_lock = threading.Lock()
+        self._fsync_stats = FsyncStats()
+
+    @property
+    def db_path(self) -> Path:
+        return self._db_path
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @property
+    def curr_bytes(self) -> int:
+        return self._curr_bytes
+
+    @property
+    def num_pending(self) -> int:
+        return self._num_pending
+
+    @property
+    def durability(self) -> Durability:
+        return self._durability
+
+    @property
+    def fsync_stats(self) -> FsyncStats:
+        return self._fsync_stats
+
+    @property
+    def num_uncommitted(self) -> int:
+        return self._num_uncommitted
+
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(
+                self._db_path, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "PRAGMA synchronous="
+                + ("NORMAL" if self._durability == Durability.none else "FULL")
+            )
+            connection.execute(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _begin(self) -> sqlite3.Connection:
+        db = self._db()
+        if not db.in_transaction:
+            db.execute("BEGIN IMMEDIATE")
+        return db
+
+    @contextlib.contextmanager
+    def _operation(self) -> Iterator[sqlite3.Connection]:
+        """Run one operation in a savepoint of the open transaction. If it
+        raises, undo only its own changes and counts."""
+        db = self._begin()
+        num_pending, curr_bytes = self._num_pending, self._curr_bytes
+        db.execute("SAVEPOINT operation")
+        try:
+            yield db
+        except Exception:
+            try:
+                db.execute("ROLLBACK TO operation")
+                db.execute("RELEASE operation")
+            except Exception:
+                self._rollback()
+                raise
+            if not self._num_uncommitted:
+                db.rollback()
+            self._num_pending, self._curr_bytes = num_pending, curr_bytes
+            raise
+        db.execute("RELEASE operation")
+
+    @contextlib.contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Hold the lock for a write, counting the writer from before it
+        waits for the lock until it releases the lock."""
+        with self._writers_lock:
+            self._num_writers += 1
+        with self._lock:
+            try:
+                yield
+            finally:
+                with self._writers_lock:
+                    self._num_writers -= 1
+                if self._commit_deadline is not None:
+                    self._commit_condition.notify_all()
+
+    def _operation_complete(self, num_operations: int = 1) -> None:
+        """Return once the operation is committed, raising if the commit
+        failed. For group commit, join the commit another writer is waiting
+        for, or, if other writers are active, wait for them to join this
+        one."""
+        self._num_uncommitted += num_operations
+        if self._durability != Durability.group_commit:
+            self._commit()
+            return
+        generation = self._commit_generation
+        self._num_waiting += 1
+        try:
+            if self._commit_deadline is not None:
+                self._commit_condition.notify_all()
+                while self._commit_generation == generation:
+                    self._commit_condition.wait()
+            elif self._num_writers > self._num_waiting:
+                # Writers are arriving concurrently; let them join.
+                self._commit_deadline = time.monotonic() + self._group_commit_seconds
+                while (
+                    self._commit_generation == generation
+                    and self._num_writers > self._num_waiting
+                    and self._num_uncommitted < self._batch_size
+                    and (remaining := self._commit_deadline - time.monotonic()) > 0
+                ):
+                    self._commit_condition.wait(remaining)
+        finally:
+            self._num_waiting -= 1
+        if self._commit_generation == generation:
+            self._commit()
+        elif self._failed_generation == generation:
+            raise WriteFailed("Group commit failed", path=self._db_path)
+
+    def _commit(self) -> None:
+        with self._lock:
+            self._commit_deadline = None
+            try:
+                if self._connection is not None and self._connection.in_transaction:
+                    start = time.perf_counter()
+                    self._connection.commit()
+                    self._fsync_stats.record(
+                        time.perf_counter() - start,
+                        self._num_uncommitted,
+                        int(self._durability != Durability.none),
+                    )
+                self._num_uncommitted = 0
+            except Exception:
+                self._fsync_stats.num_errors += 1
+                self._failed_generation = self._commit_generation
+                self._rollback()
+                raise
+            finally:
+                self._commit_generation += 1
+                self._commit_condition.notify_all()
+
+    def _rollback(self) -> None:
+        """Discard the current transaction and reload counts to match."""
+        if self._connection is not None and self._connection.in_transaction:
+            self._connection.rollback()
+        self._num_uncommitted = 0
+        self._load_counts()
+
+    def _load_counts(self) -> None:
+        self._num_pending, self._curr_bytes = (
+            self._db()
+            .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM events")
+            .fetchone()
+        )
+
+    def persist(self, uid: str, content: bytes) -> Result[bool, Problems]:
+        return self.persist_many([(uid, content)])
+
+    def persist_many(
+        self, events: Sequence[tuple[str, bytes]]
+    ) -> Result[bool, Problems]:
+        """Persist events in one transaction."""
+        start = time.perf_counter()
+        with self._writing():
+            self._num_persists += len(events)
+            problems = Problems()
+            try:
+                with self._operation() as db:
+                    for uid, content in events:
+                        self._persist(db, uid, content, problems)
+                self._operation_complete(len(events))
+            except Exception as e:  # noqa: BLE001
+                problems.add_error(e).add_error(
+                    WriteFailed("Insert failed", path=self._db_path)
+                )
+            self.metrics.persist.record(
+                start, sum(len(content) for _, content in events), len(events)
+            )
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _persist(
+        self, db: sqlite3.Connection, uid: str, content: bytes, problems: Problems
+    ) -> None:
+        if len(content) > self._max_bytes:
+            problems.add_error(
+                ContentTooLarge(
+                    f"content bytes ({len(content)}) > max bytes ({self._max_bytes})",
+                    uid=uid,
+                    path=self._db_path,
+                )
+            )
+            return
+        existing = db.execute(
+            "SELECT size FROM events WHERE uid = ?", (uid,)
+        ).fetchone()
+        if existing is not None:
+            problems.add_warning(UIDExistedWarning(uid=uid, path=self._db_path))
+            db.execute("DELETE FROM events WHERE uid = ?", (uid,))
+            self._num_pending -= 1
+            self._curr_bytes -= existing[0]
+        if len(content) + self._curr_bytes > self._max_bytes:
+            match self._trim_old_storage(len(content)):
+                case Err(trim_problems):
+                    problems.add_problems(trim_problems)
+                    problems.add_error(TrimFailed(uid=uid))
+                    return
+        db.execute(
+            "INSERT INTO events (uid, content, size) VALUES (?, ?, ?)",
+            (uid, content, len(content)),
+        )
+        self._num_pending += 1
+        self._curr_bytes += len(content)
+
+    def _trim_old_storage(self, needed_bytes: int) -> Result[bool, Problems]:
+        """Delete the oldest events, in one statement, so that needed_bytes
+        fit within max_bytes."""
+        start = time.perf_counter()
+        curr_bytes = self._curr_bytes
+        num_pending = self._num_pending
+        problems = Problems()
+        try:
+            db = self._db()
+            boundary = db.execute(
+                TRIM_BOUNDARY_QUERY,
+                (self._curr_bytes + needed_bytes - self._max_bytes,),
+            ).fetchone()
+            if boundary is None:
+                self._note_dropped(db.execute("SELECT uid FROM events"))
+                db.execute("DELETE FROM events")
+                self._num_pending = 0
+                self._curr_bytes = 0
+            else:
+                seq, num_events, num_bytes = boundary
+                self._note_dropped(
+                    db.execute("SELECT uid FROM events WHERE seq <= ?", (seq,))
+                )
+                db.execute("DELETE FROM events WHERE seq <= ?", (seq,))
+                self._num_pending -= num_events
+                self._curr_bytes -= num_bytes
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(
+                PersisterError("Unexpected error", path=self._db_path)
+            )
+        self.metrics.trim.record(
+            start, curr_bytes - self._curr_bytes, num_pending - self._num_pending
+        )
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def clear(self, uid: str) -> Result[bool, Problems]:
+        return self.clear_many([uid])
+
+    def clear_many(self, uids: Sequence[str]) -> Result[bool, Problems]:
+        """Clear uids in one transaction, with one DELETE per MAX_PARAMETERS
+        uids."""
+        start = time.perf_counter()
+        with self._writing():
+            curr_bytes = self._curr_bytes
+            self._num_clears += len(uids)
+            problems = Problems()
+            try:
+                with self._operation() as db:
+                    self._clear_many(db, uids, problems)
+                self._operation_complete(len(uids))
+            except Exception as e:  # noqa: BLE001
+                problems.add_error(e).add_error(
+                    WriteFailed("Delete failed", path=self._db_path)
+                )
+            self.metrics.clear.record(start, curr_bytes - self._curr_bytes, len(uids))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _clear_many(
+        self, db: sqlite3.Connection, uids: Sequence[str], problems: Problems
+    ) -> None:
+        for chunk in self._chunks(uids):
+            placeholders = ", ".join("?" * len(chunk))
+            sizes = dict(
+                db.execute(
+                    f"SELECT uid, size FROM events WHERE uid IN ({placeholders})",  # noqa: S608
+                    chunk,
+                ).fetchall()
+            )
+            db.execute(
+                f"DELETE FROM events WHERE uid IN ({placeholders})",  # noqa: S608
+                chunk,
+            )
+            self._num_pending -= len(sizes)
+            self._curr_bytes -= sum(sizes.values())
+            for uid in chunk:
+                if uid not in sizes:
+                    problems.add_warning(UIDMissingWarning(uid=uid, path=self._db_path))
+                sizes.pop(uid, None)
+
+    @classmethod
+    def _chunks(cls, uids: Sequence[str]) -> list[Sequence[str]]:
+        return [
+            uids[i : i + cls.MAX_PARAMETERS]
+            for i in range(0, len(uids), cls.MAX_PARAMETERS)
+        ]
+
+    def pending_ids(self) -> list[str]:
+        with self._lock:
+            return [
+                row[0]
+                for row in self._db().execute("SELECT uid FROM events ORDER BY seq")
+            ]
+
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:
+        """Select PENDING_PAGE_SIZE uids at a time, each page resuming after
+        the seq of the last, so pages are unaffected by concurrent clears."""
+        with self._lock:
+            row = (
+                self._db()
+                .execute("SELECT seq FROM events WHERE uid = ?", (after_uid,))
+                .fetchone()
+            )
+        after_seq = 0 if row is None else row[0]
+        while True:
+            with self._lock:
+                rows = (
+                    self._db()
+                    .execute(
+                        "SELECT seq, uid FROM events WHERE seq > ? ORDER BY seq LIMIT ?",
+                        (after_seq, PENDING_PAGE_SIZE),
+                    )
+                    .fetchall()
+                )
+            for _, uid in rows:
+                yield uid
+            if len(rows) < PENDING_PAGE_SIZE:
+                return
+            after_seq = rows[-1][0]
+
+    @property
+    def num_persists(self) -> int:
+        return self._num_persists
+
+    @property
+    def num_retrieves(self) -> int:
+        return self._num_retrieves
+
+    @property
+    def num_clears(self) -> int:
+        return self._num_clears
+
+    def __contains__(self, uid: str) -> bool:
+        with self._lock:
+            return (
+                self._db()
+                .execute("SELECT 1 FROM events WHERE uid = ?", (uid,))
+                .fetchone()
+                is not None
+            )
+
+    def retrieve(self, uid: str) -> Result[Optional[bytes], Problems]:
+        return self.retrieve_many([uid])[uid]
+
+    def retrieve_many(
+        self, uids: Sequence[str]
+    ) -> dict[str, Result[Optional[bytes], Problems]]:
+        """Retrieve uids with one SELECT per MAX_PARAMETERS uids."""
+        start = time.perf_counter()
+        num_bytes = 0
+        with self._lock:
+            self._num_retrieves += len(uids)
+            results: dict[str, Result[Optional[bytes], Problems]] = {}
+            for chunk in self._chunks(uids):
+                try:
+                    placeholders = ", ".join("?" * len(chunk))
+                    contents = {
+                        uid: bytes(content)
+                        for uid, content in self._db().execute(
+                            f"SELECT uid, content FROM events WHERE uid IN ({placeholders})",  # noqa: S608
+                            chunk,
+                        )
+                    }
+                    num_bytes += sum(len(content) for content in contents.values())
+                    for uid in chunk:
+                        results[uid] = Ok(contents.get(uid))
+                except Exception as e:  # noqa: BLE001, PERF203
+                    for uid in chunk:
+                        results[uid] = Err(
+                            Problems()
+                            .add_error(e)
+                            .add_error(
+                                ReadFailed("Select failed", uid=uid, path=self._db_path)
+                            )
+                        )
+            self.metrics.retrieve.record(start, num_bytes, len(uids))
+        return results
+
+    def reindex(self) -> Result[Optional[bool], Problems]:
+        start = time.perf_counter()
+        with self._lock:
+            problems = Problems()
+            try:
+                self._commit()
+                self._load_counts()
+            except Exception as e:  # noqa: BLE001
+                problems.add_error(e).add_error(ReindexError(path=self._db_path))
+            self.metrics.reindex.record(start, self._curr_bytes, self._num_pending)
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def flush(self) -> Result[bool, Problems]:
+        problems = Problems()
+        try:
+            self._commit()
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(
+                PersisterError("Commit failed", path=self._db_path)
+            )
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def close(self) -> None:
+        with self._lock:
+            self._commit()
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    @property
+    def reindexing(self) -> bool:
+        return False
+
+    def take_reindex_problems(self) -> Optional[Problems]:
+        return None
+
+    def take_dropped(self) -> Optional[list[str]]:
+        with self._lock:
+            dropped = list(self._dropped or ())
+            self._dropped = {}
+        return dropped
+
+    def _note_dropped(self, rows: Iterable[tuple[str]]) -> None:
+        if self._dropped is not None:
+            self._dropped.update((uid, None) for (uid,) in rows)
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Iterator, Optional
 
 from result import Ok, Result
 
@@ -22,6 +22,9 @@ class StubPersister(PersisterInterface):
     def pending_ids(self) -> list[str]:
         return []
 
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:  # noqa: ARG002
+        yield from ()
+
     @property
     def num_pending(self) -> int:
         return 0
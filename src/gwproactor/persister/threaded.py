@@ -0,0 +1,383 @@
+"""Run a persister's disk I/O in a dedicated thread.
+
+ThreadedPersister wraps another PersisterInterface. persist() and clear()
+(and their bulk versions) queue the operation for an I/O thread and return
+immediately, so the caller, typically the proactor's event loop, never waits
+on the disk to write or delete an event. Queued operations run in the order
+they were made. Persists queued one after another, behind a running
+operation, are merged and written by one persist_many() of the wrapped
+persister, so they share its syncs.
+
+The wrapper keeps an in-memory view of pending uids, updated when an
+operation is queued, so pending_ids(), num_pending and __contains__ answer
+without waiting for the I/O thread. Content that is queued but not yet
+written is retrieved from memory. Other retrieves, reindex() and flush() run
+in the I/O thread after every operation queued before them. retrieve_many()
+waits for that; retrieve_many_later() does not, so callers on the event loop,
+such as a reupload, use it instead.
+
+Events the wrapped persister drops by itself, when trimming or expiring
+them, leave the view after each write, as reported by its take_dropped(). If
+the wrapped persister does not report its drops, the whole view is rebuilt
+from its pending_ids() after any write which lost events.
+
+While the wrapped persister reindexes in the background, the I/O thread
+refreshes the pending view from it every REINDEX_REFRESH_SECONDS, between
+queued operations. reindexing only reports the state seen by the last
+refresh.
+
+Because persist() and clear() return before the operation runs, their
+results only report problems found when queuing. Errors found by the I/O
+thread are collected and returned by take_problems().
+"""
+
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterator, Optional, Sequence, TypeVar
+
+from result import Err, Ok, Result
+
+from gwproactor.persister.exceptions import PersisterError, UIDMissingWarning
+from gwproactor.persister.interface import PersisterInterface, iter_pending_pages
+from gwproactor.persister.metrics import PersisterMetrics
+from gwproactor.problems import Problems
+
+T = TypeVar("T")
+
+
+class ThreadedPersister(PersisterInterface):
+    REINDEX_REFRESH_SECONDS: float = 0.5
+    _persister: PersisterInterface
+    _lock: threading.RLock
+    _queue: "queue.SimpleQueue[tuple[Callable[[], Any], Optional[Future[Any]]]]"
+    _thread: Optional[threading.Thread] = None
+    _pending: dict[str, None]
+    _unwritten: dict[str, bytes]
+    _clearing: dict[str, int]
+    _open_write: Optional[list[tuple[str, bytes]]] = None
+    """Events of the last queued operation, if it is a write not yet
+    started, which later persists join."""
+    _queued_bytes: int = 0
+    _num_queued: int = 0
+    _problems: Optional[Problems] = None
+    _reindexing: bool = False
+    _tracks_drops: bool = False
+    _next_refresh: float = 0.0
+    _num_persists: int = 0
+    _num_retrieves: int = 0
+    _num_clears: int = 0
+
+    def __init__(self, persister: PersisterInterface) -> None:
+        self._persister = persister
+        self._lock = threading.RLock()
+        self._queue = queue.SimpleQueue()
+        self._pending = {}
+        self._unwritten = {}
+        self._clearing = {}
+        self._tracks_drops = persister.take_dropped() is not None
+
+    @property
+    def persister(self) -> PersisterInterface:
+        return self._persister
+
+    @property
+    def num_queued(self) -> int:
+        """Number of operations queued for, or running in, the I/O thread."""
+        return self._num_queued
+
+    def take_problems(self) -> Optional[Problems]:
+        """Return and forget errors found by queued operations."""
+        with self._lock:
+            problems = self._problems
+            self._problems = None
+        return problems
+
+    def persist(self, uid: str, content: bytes) -> Result[bool, Problems]:
+        return self.persist_many([(uid, content)])
+
+    def persist_many(
+        self, events: Sequence[tuple[str, bytes]]
+    ) -> Result[bool, Problems]:
+        events = list(events)
+        with self._lock:
+            self._num_persists += len(events)
+            for uid, content in events:
+                self._pending.pop(uid, None)
+                self._pending[uid] = None
+                self._unwritten[uid] = content
+                self._queued_bytes += len(content)
+            if self._open_write is not None:
+                self._open_write.extend(events)
+            else:
+                self._submit(lambda: self._write(events))
+                self._open_write = events
+        return Ok()
+
+    def clear(self, uid: str) -> Result[bool, Problems]:
+        return self.clear_many([uid])
+
+    def clear_many(self, uids: Sequence[str]) -> Result[bool, Problems]:
+        problems = Problems()
+        cleared = []
+        with self._lock:
+            self._num_clears += len(uids)
+            for uid in uids:
+                if uid in self._pending:
+                    self._pending.pop(uid)
+                    self._unwritten.pop(uid, None)
+                    self._clearing[uid] = self._clearing.get(uid, 0) + 1
+                    cleared.append(uid)
+                else:
+                    problems.add_warning(UIDMissingWarning(uid=uid))
+        if cleared:
+            self._submit(lambda: self._clear(cleared))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def pending_ids(self) -> list[str]:
+        with self._lock:
+            return list(self._pending)
+
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:
+        return iter_pending_pages(self._pending, after_uid, self._lock)
+
+    @property
+    def num_pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def curr_bytes(self) -> int:
+        return self._persister.curr_bytes + self._queued_bytes
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._pending
+
+    def expired(self, uid: str) -> bool:
+        return self._persister.expired(uid)
+
+    def retrieve(self, uid: str) -> Result[Optional[bytes], Problems]:
+        return self.retrieve_many([uid])[uid]
+
+    def retrieve_many(
+        self, uids: Sequence[str]
+    ) -> dict[str, Result[Optional[bytes], Problems]]:
+        return self.retrieve_many_later(uids).result()
+
+    def retrieve_many_later(
+        self, uids: Sequence[str]
+    ) -> "Future[dict[str, Result[Optional[bytes], Problems]]]":
+        """Queue a retrieve of uids for the I/O thread, after every
+        operation queued before it, without waiting for it."""
+        uids = list(uids)
+        results, stored = self._retrieve_unstored(uids)
+
+        future: Future[dict[str, Result[Optional[bytes], Problems]]] = Future()
+        if not stored:
+            future.set_result({uid: results[uid] for uid in uids})
+            return future
+
+        def retrieve() -> dict[str, Result[Optional[bytes], Problems]]:
+            try:
+                results.update(self._persister.retrieve_many(stored))
+            except Exception as e:  # noqa: BLE001
+                for uid in stored:
+                    results[uid] = Err(
+                        Problems()
+                        .add_error(e)
+                        .add_error(PersisterError("Retrieve failed", uid=uid))
+                    )
+            return {uid: results[uid] for uid in uids}
+
+        self._queue_operation(retrieve, future)
+        return future
+
+    def _retrieve_unstored(
+        self, uids: Sequence[str]
+    ) -> tuple[dict[str, Result[Optional[bytes], Problems]], list[str]]:
+        """Return the results for uids that need no I/O, because they are not
+        pending or not yet written, and the uids that must be read."""
+        results: dict[str, Result[Optional[bytes], Problems]] = {}
+        with self._lock:
+            self._num_retrieves += len(uids)
+            for uid in uids:
+                if uid not in self._pending:
+                    results[uid] = Ok(None)
+                elif uid in self._unwritten:
+                    results[uid] = Ok(self._unwritten[uid])
+        return results, [uid for uid in uids if uid not in results]
+
+    def reindex(self) -> Result[Optional[bool], Problems]:
+        try:
+            return self._call(self._reindex)
+        except Exception as e:  # noqa: BLE001
+            return Err(
+                Problems().add_error(e).add_error(PersisterError("Reindex failed"))
+            )
+
+    def flush(self) -> Result[bool, Problems]:
+        """Wait for all queued operations and flush the wrapped persister."""
+        try:
+            return self._call(self._persister.flush)
+        except Exception as e:  # noqa: BLE001
+            return Err(
+                Problems().add_error(e).add_error(PersisterError("Flush failed"))
+            )
+
+    @property
+    def reindexing(self) -> bool:
+        return self._reindexing
+
+    def take_reindex_problems(self) -> Optional[Problems]:
+        return self._persister.take_reindex_problems()
+
+    @property
+    def num_persists(self) -> int:
+        return self._num_persists
+
+    @property
+    def num_retrieves(self) -> int:
+        return self._num_retrieves
+
+    @property
+    def num_clears(self) -> int:
+        return self._num_clears
+
+    @property
+    def metrics(self) -> PersisterMetrics:
+        return self._persister.metrics
+
+    def _submit(self, operation: Callable[[], Any]) -> None:
+        self._queue_operation(operation, None)
+
+    def _call(self, operation: Callable[[], T]) -> T:
+        """Run operation in the I/O thread, after every queued operation,
+        and wait for its result."""
+        future: Future[T] = Future()
+        self._queue_operation(operation, future)
+        return future.result()
+
+    def _queue_operation(
+        self, operation: Callable[[], Any], future: Optional["Future[Any]"]
+    ) -> None:
+        with self._lock:
+            self._num_queued += 1
+            self._open_write = None
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="persister_io", daemon=True
+                )
+                self._thread.start()
+            self._queue.put((operation, future))
+
+    def _run(self) -> None:
+        while True:
+            try:
+                operation, future = self._queue.get(
+                    timeout=self.REINDEX_REFRESH_SECONDS if self._reindexing else None
+                )
+            except queue.Empty:
+                self._refresh_reindexing()
+                continue
+            if self._reindexing and time.monotonic() >= self._next_refresh:
+                self._refresh_reindexing()
+            try:
+                result = operation()
+            except Exception as e:  # noqa: BLE001
+                if future is None:
+                    self._add_problems(
+                        Problems().add_error(e).add_error(PersisterError("I/O failed"))
+                    )
+                else:
+                    future.set_exception(e)
+            else:
+                if future is not None:
+                    future.set_result(result)
+            with self._lock:
+                self._num_queued -= 1
+
+    def _add_problems(self, problems: Problems) -> None:
+        with self._lock:
+            if self._problems is None:
+                self._problems = Problems()
+            self._problems.add_problems(problems)
+
+    def _write(self, events: list[tuple[str, bytes]]) -> None:
+        with self._lock:
+            if self._open_write is events:
+                self._open_write = None
+        if not self._tracks_drops:
+            num_new = len({uid for uid, _ in events if uid not in self._persister})
+            num_pending = self._persister.num_pending
+        result = self._persister.persist_many(events)
+        with self._lock:
+            for uid, content in events:
+                if self._unwritten.get(uid, None) is content:
+                    self._unwritten.pop(uid)
+                self._queued_bytes -= len(content)
+        if self._tracks_drops:
+            self._forget_dropped([uid for uid, _ in events])
+        elif self._persister.num_pending < num_pending + num_new:
+            # Events were trimmed or failed to persist.
+            self._refresh_pending()
+        match result:
+            case Err(problems) if problems.errors:
+                self._add_problems(problems)
+
+    def _forget_dropped(self, written: list[str]) -> None:
+        """Remove from the pending view the uids the wrapped persister
+        dropped, and those of written which it failed to persist, unless
+        they are queued to be written again. Runs in the I/O thread."""
+        dropped = self._persister.take_dropped() or []
+        gone = [
+            uid
+            for uid in itertools.chain(dropped, written)
+            if uid not in self._persister
+        ]
+        if gone:
+            with self._lock:
+                for uid in gone:
+                    if uid not in self._unwritten:
+                        self._pending.pop(uid, None)
+
+    def _clear(self, uids: list[str]) -> None:
+        result = self._persister.clear_many(uids)
+        if self._tracks_drops:
+            self._forget_dropped([])
+        with self._lock:
+            for uid in uids:
+                self._clearing[uid] -= 1
+                if not self._clearing[uid]:
+                    self._clearing.pop(uid)
+        match result:
+            case Err(problems) if problems.errors:
+                self._add_problems(problems)
+
+    def _reindex(self) -> Result[Optional[bool], Problems]:
+        result = self._persister.reindex()
+        self._refresh_reindexing()
+        return result
+
+    def _refresh_reindexing(self) -> None:
+        """Take the wrapped persister's reindexing state, then the pending
+        view, so the refresh that sees the end of a background reindex
+        also sees everything it found. Runs in the I/O thread."""
+        reindexing = self._persister.reindexing
+        self._refresh_pending()
+        self._reindexing = reindexing
+        self._next_refresh = time.monotonic() + self.REINDEX_REFRESH_SECONDS
+
+    def _refresh_pending(self) -> None:
+        """Rebuild the pending view from the wrapped persister and the
+        operations still queued."""
+        stored = self._persister.pending_ids()
+        with self._lock:
+            self._pending = dict.fromkeys(
+                uid
+                for uid in stored
+                if uid not in self._clearing and uid not in self._unwritten
+            )
+            self._pending.update(dict.fromkeys(self._unwritten))
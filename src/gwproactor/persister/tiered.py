@@ -0,0 +1,279 @@
+"""Keep the newest events in memory, spilling to disk only when needed.
+
+TieredPersister wraps a disk PersisterInterface. persist() places events in
+an in-memory buffer of at most buffer_bytes. Events leave the buffer for the
+wrapped persister, oldest first, when:
+
+- the buffer is full,
+- they have been buffered for max_age_seconds, checked by persist() and
+  spill_expired(), or
+- flush() is called, as by Proactor.stop().
+
+Events cleared while still buffered never touch the disk, so an outage of a
+few seconds costs no disk writes at all. Buffered events are always newer
+than spilled ones, so pending_ids() is the wrapped persister's pending ids
+followed by the buffered ids.
+
+Buffered events are lost if the process dies without flush(). Storage is
+bounded by buffer_bytes plus the wrapped persister's own limit.
+"""
+
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Iterator, NamedTuple, Optional, Sequence
+
+from result import Err, Ok, Result
+
+from gwproactor.persister.exceptions import UIDExistedWarning
+from gwproactor.persister.interface import PersisterInterface, iter_pending_pages
+from gwproactor.persister.metrics import PersisterMetrics
+from gwproactor.problems import Problems
+
+DEFAULT_BUFFER_BYTES = 4 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 60.0
+
+
+class _Buffered(NamedTuple):
+    content: bytes
+    buffered_at: float
+
+
+class TieredPersister(PersisterInterface):
+    _persister: PersisterInterface
+    _buffer: OrderedDict[str, _Buffered]
+    _buffer_bytes: int = DEFAULT_BUFFER_BYTES
+    _max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS
+    _buffered_bytes: int = 0
+    _num_spilled: int = 0
+    _num_persists: int = 0
+    _num_retrieves: int = 0
+    _num_clears: int = 0
+
+    def __init__(
+        self,
+        persister: PersisterInterface,
+        buffer_bytes: int = DEFAULT_BUFFER_BYTES,
+        max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+    ) -> None:
+        """If max_age_seconds is 0, events are only spilled when the buffer
+        is full or on flush()."""
+        self._persister = persister
+        self._buffer = OrderedDict()
+        self._buffer_bytes = buffer_bytes
+        self._max_age_seconds = max_age_seconds
+
+    @property
+    def persister(self) -> PersisterInterface:
+        return self._persister
+
+    @property
+    def buffer_bytes(self) -> int:
+        return self._buffer_bytes
+
+    @property
+    def max_age_seconds(self) -> float:
+        return self._max_age_seconds
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._buffered_bytes
+
+    @property
+    def num_buffered(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def num_spilled(self) -> int:
+        """Number of events written to the wrapped persister."""
+        return self._num_spilled
+
+    def persist(self, uid: str, content: bytes) -> Result[bool, Problems]:
+        return self.persist_many([(uid, content)])
+
+    def persist_many(
+        self, events: Sequence[tuple[str, bytes]]
+    ) -> Result[bool, Problems]:
+        problems = Problems()
+        self._num_persists += len(events)
+        now = time.monotonic()
+        for uid, content in events:
+            if (existing := self._buffer.pop(uid, None)) is not None:
+                self._buffered_bytes -= len(existing.content)
+                problems.add_warning(UIDExistedWarning(uid=uid))
+            elif uid in self._persister:
+                problems.add_warning(UIDExistedWarning(uid=uid))
+                match self._persister.clear(uid):
+                    case Err(clear_problems):
+                        problems.add_problems(clear_problems)
+            if len(content) > self._buffer_bytes:
+                # Too large to buffer. Spill everything older first, to
+                # keep the wrapped persister in order.
+                self._spill(len(self._buffer), problems)
+                self._num_spilled += 1
+                match self._persister.persist(uid, content):
+                    case Err(persist_problems):
+                        problems.add_problems(persist_problems)
+                continue
+            self._buffer[uid] = _Buffered(content, now)
+            self._buffered_bytes += len(content)
+        self._spill(self._num_to_spill(now), problems)
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def spill_expired(self) -> Result[bool, Problems]:
+        """Spill events buffered for at least max_age_seconds."""
+        problems = Problems()
+        self._spill(self._num_to_spill(time.monotonic()), problems)
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _num_to_spill(self, now: float) -> int:
+        """Return how many of the oldest buffered events must be spilled to
+        fit the buffer and to expire events older than max_age_seconds."""
+        num = 0
+        excess_bytes = self._buffered_bytes - self._buffer_bytes
+        expired_before = now - self._max_age_seconds
+        for buffered in self._buffer.values():
+            if excess_bytes <= 0 and (
+                not self._max_age_seconds or buffered.buffered_at > expired_before
+            ):
+                break
+            num += 1
+            excess_bytes -= len(buffered.content)
+        return num
+
+    def _spill(self, num: int, problems: Problems) -> None:
+        if not num:
+            return
+        events = []
+        for _ in range(num):
+            uid, buffered = self._buffer.popitem(last=False)
+            self._buffered_bytes -= len(buffered.content)
+            events.append((uid, buffered.content))
+        self._num_spilled += len(events)
+        match self._persister.persist_many(events):
+            case Err(persist_problems):
+                problems.add_problems(persist_problems)
+
+    def clear(self, uid: str) -> Result[bool, Problems]:
+        return self.clear_many([uid])
+
+    def clear_many(self, uids: Sequence[str]) -> Result[bool, Problems]:
+        self._num_clears += len(uids)
+        stored = []
+        for uid in uids:
+            if (buffered := self._buffer.pop(uid, None)) is not None:
+                self._buffered_bytes -= len(buffered.content)
+            else:
+                stored.append(uid)
+        if stored:
+            return self._persister.clear_many(stored)
+        return Ok()
+
+    def pending_ids(self) -> list[str]:
+        return self._persister.pending_ids() + list(self._buffer)
+
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:
+        if after_uid is not None and after_uid in self._buffer:
+            yield from iter_pending_pages(self._buffer, after_uid)
+        else:
+            yield from self._persister.iter_pending(after_uid)
+            yield from iter_pending_pages(self._buffer)
+
+    @property
+    def num_pending(self) -> int:
+        return self._persister.num_pending + len(self._buffer)
+
+    @property
+    def curr_bytes(self) -> int:
+        return self._persister.curr_bytes + self._buffered_bytes
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._buffer or uid in self._persister
+
+    def expired(self, uid: str) -> bool:
+        return uid not in self._buffer and self._persister.expired(uid)
+
+    def retrieve(self, uid: str) -> Result[Optional[bytes], Problems]:
+        return self.retrieve_many([uid])[uid]
+
+    def retrieve_many(
+        self, uids: Sequence[str]
+    ) -> dict[str, Result[Optional[bytes], Problems]]:
+        self._num_retrieves += len(uids)
+        results: dict[str, Result[Optional[bytes], Problems]] = {
+            uid: Ok(self._buffer[uid].content) for uid in uids if uid in self._buffer
+        }
+        stored = [uid for uid in uids if uid not in results]
+        if stored:
+            results.update(self._persister.retrieve_many(stored))
+        return {uid: results[uid] for uid in uids}
+
+    def retrieve_many_later(
+        self, uids: Sequence[str]
+    ) -> "Future[dict[str, Result[Optional[bytes], Problems]]]":
+        """Buffered content is taken now; the rest is retrieved by the
+        wrapped persister's retrieve_many_later()."""
+        self._num_retrieves += len(uids)
+        uids = list(uids)
+        results: dict[str, Result[Optional[bytes], Problems]] = {
+            uid: Ok(self._buffer[uid].content) for uid in uids if uid in self._buffer
+        }
+        future: Future[dict[str, Result[Optional[bytes], Problems]]] = Future()
+        stored = [uid for uid in uids if uid not in results]
+        if not stored:
+            future.set_result(results)
+            return future
+
+        def combine(
+            stored_future: "Future[dict[str, Result[Optional[bytes], Problems]]]",
+        ) -> None:
+            try:
+                results.update(stored_future.result())
+            except Exception as e:  # noqa: BLE001
+                future.set_exception(e)
+            else:
+                future.set_result({uid: results[uid] for uid in uids})
+
+        self._persister.retrieve_many_later(stored).add_done_callback(combine)
+        return future
+
+    def reindex(self) -> Result[Optional[bool], Problems]:
+        return self._persister.reindex()
+
+    def flush(self) -> Result[bool, Problems]:
+        """Spill every buffered event and flush the wrapped persister."""
+        problems = Problems()
+        self._spill(len(self._buffer), problems)
+        match self._persister.flush():
+            case Err(flush_problems):
+                problems.add_problems(flush_problems)
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    @property
+    def reindexing(self) -> bool:
+        return self._persister.reindexing
+
+    def take_reindex_problems(self) -> Optional[Problems]:
+        return self._persister.take_reindex_problems()
+
+    @property
+    def num_persists(self) -> int:
+        return self._num_persists
+
+    @property
+    def num_retrieves(self) -> int:
+        return self._num_retrieves
+
+    @property
+    def num_clears(self) -> int:
+        return self._num_clears
+
+    @property
+    def metrics(self) -> PersisterMetrics:
+        return self._persister.metrics
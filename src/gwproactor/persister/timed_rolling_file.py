@@ -1,14 +1,25 @@
 import contextlib
 import datetime
+import os
 import re
 import shutil
 import subprocess
+import threading
 import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import NamedTuple, Optional
+from typing import Iterable, Iterator, Mapping, NamedTuple, Optional, Sequence, TextIO
 
 from result import Err, Ok, Result
 
+from gwproactor.persister.compression import record_type_name
+from gwproactor.persister.durability import (
+    DEFAULT_GROUP_COMMIT_SECONDS,
+    Durability,
+    FileSyncer,
+    FsyncStats,
+)
 from gwproactor.persister.exceptions import (
     ContentTooLarge,
     FileExistedWarning,
@@ -17,28 +28,62 @@ from gwproactor.persister.exceptions import (
     PersisterError,
     ReadFailed,
     ReindexError,
+    SizeMismatchWarning,
     TrimFailed,
     UIDExistedWarning,
     UIDMissingWarning,
     WriteFailed,
 )
-from gwproactor.persister.interface import PersisterInterface
+from gwproactor.persister.interface import (
+    ENCODING,
+    PersisterInterface,
+    event_type_name,
+    iter_pending_pages,
+)
 from gwproactor.problems import Problems
 
 
 class _PersistedItem(NamedTuple):
     uid: str
     path: Path
+    size: Optional[int] = None
+    """Content size encoded in the file name, if any."""
+    type_name: str = ""
+    """Event TypeName encoded in the file name, if any."""
+
+
+class _ManifestInvalid(Exception): ...
 
 
 class TimedRollingFilePersister(PersisterInterface):
     DEFAULT_MAX_BYTES: int = 500 * 1024 * 1024
-    FILENAME_RGX: re.Pattern[str] = re.compile(r"(?P<dt>.*)\.uid\[(?P<uid>.*)].json$")
+    FILENAME_RGX: re.Pattern[str] = re.compile(
+        r"(?P<dt>.*)\.uid\[(?P<uid>.*?)](\.size\[(?P<size>\d+)])?"
+        r"(\.type\[(?P<type>[\w.\-]+)])?\.json$"
+    )
+    ISO_UTC_RGX: re.Pattern[str] = re.compile(
+        r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d{6})?\+00:00$"
+    )
+    DEFAULT_SCAN_WORKERS: int = min(8, os.cpu_count() or 1)
+    DEFAULT_PRIORITY: int = 0
     REINDEX_PAT_SECONDS = 1.0
+    MANIFEST_NAME: str = "manifest.txt"
+    MANIFEST_HEADER: str = "gwproactor-manifest 1"
+    MANIFEST_COMPACT_MIN_LINES: int = 1000
+    DEFAULT_HIGH_WATERMARK: float = 0.9
+    DEFAULT_LOW_WATERMARK: float = 0.8
+    TRASH_PREFIX: str = ".trash-"
+    EXPIRE_CHECK_SECONDS: float = 60.0
+    DAY_SECONDS: float = 24 * 60 * 60
 
     _base_dir: Path
     _max_bytes: int = DEFAULT_MAX_BYTES
     _pending: dict[str, Path]
+    _sizes: dict[str, int]
+    _day_bytes: dict[Path, int]
+    _day_uids: dict[Path, dict[str, None]]
+    """Pending uids in each day directory, so a day is dropped without
+    scanning the whole index."""
     _curr_dir: Path
     _curr_bytes: int
     _pat_watchdog_args: Optional[list[str]] = None
@@ -46,21 +91,155 @@ class TimedRollingFilePersister(PersisterInterface):
     _num_persists: int = 0
     _num_retrieves: int = 0
     _num_clears: int = 0
+    _use_manifest: bool = False
+    _manifest_file: Optional[TextIO] = None
+    _manifest_lines: int = 0
+    _manifest_loaded: bool = False
+    _background_reindex: bool = False
+    _reindexing: bool = False
+    _reindex_thread: Optional[threading.Thread] = None
+    _reindex_problems: Optional[Problems] = None
+    _persisted_while_reindexing: dict[str, None]
+    _cleared_while_reindexing: set[str]
+    _last_pat: float = 0.0
+    _pat_lock: threading.Lock
+    _lock: threading.RLock
+    _syncer: FileSyncer
+    _background_trim: bool = False
+    _high_watermark: float = DEFAULT_HIGH_WATERMARK
+    _low_watermark: float = DEFAULT_LOW_WATERMARK
+    _maintenance_wanted: threading.Event
+    _maintenance_thread: Optional[threading.Thread] = None
+    _background_problems: Optional[Problems] = None
+    _num_day_drops: int = 0
+    _trim_requested: bool = False
+    _verify_requested: bool = False
+    _verify_seconds: float = 0.0
+    _next_verify: float = 0.0
+    _num_verifies: int = 0
+    _priority_classes: Optional[dict[str, int]] = None
+    _default_priority: int = DEFAULT_PRIORITY
+    _priorities: dict[str, int]
+    _by_priority: dict[int, dict[str, None]]
+    _scan_workers: int = DEFAULT_SCAN_WORKERS
+    _retention_seconds: Optional[float] = None
+    _retention_seconds_by_type: dict[str, float]
+    _expire_requested: bool = False
+    _next_expire: float = 0.0
+    _num_expired: int = 0
+    _dropped: Optional[dict[str, None]] = None
+    _metadata_names: bool = False
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         base_dir: Path | str,
         max_bytes: int = DEFAULT_MAX_BYTES,
         pat_watchdog_args: Optional[list[str]] = None,
         reindex_pat_seconds: float = REINDEX_PAT_SECONDS,
+        *,
+        use_manifest: bool = False,
+        background_reindex: bool = False,
+        durability: Durability = Durability.none,
+        group_commit_seconds: float = DEFAULT_GROUP_COMMIT_SECONDS,
+        background_trim: bool = False,
+        high_watermark: float = DEFAULT_HIGH_WATERMARK,
+        low_watermark: float = DEFAULT_LOW_WATERMARK,
+        verify_seconds: float = 0.0,
+        priority_classes: Optional[Mapping[str, int]] = None,
+        default_priority: int = DEFAULT_PRIORITY,
+        scan_workers: int = DEFAULT_SCAN_WORKERS,
+        retention_seconds: Optional[float] = None,
+        retention_seconds_by_type: Optional[Mapping[str, float]] = None,
+        metadata_names: bool = False,
     ) -> None:
+        """If use_manifest is True, a journal of persisted and cleared events
+        is kept in base_dir/MANIFEST_NAME. reindex() then loads the manifest
+        instead of scanning every day directory, falling back to a full scan
+        if the manifest is missing or fails validation.
+
+        If background_reindex is True, reindex() scans the day directories in
+        a worker thread and returns immediately. While reindexing is True,
+        pending_ids() grows as day directories are scanned, oldest first.
+
+        durability selects whether persist() fsyncs nothing, each event, or
+        groups of events written concurrently. See
+        gwproactor.persister.durability.
+
+        If background_trim is True, persist() does not trim inline unless
+        max_bytes would be exceeded. Instead, once curr_bytes passes
+        high_watermark * max_bytes, a worker thread trims to
+        low_watermark * max_bytes, dropping whole day directories where it
+        can.
+
+        Sizes are tracked in the index. If verify_seconds is non-zero, a
+        persist() at least verify_seconds after the last verification starts
+        verify_sizes() in a worker thread.
+
+        If metadata_names is True, each file name also encodes the size and
+        TypeName of its event, as "<dt>.uid[<uid>].size[<n>].type[<T>].json",
+        so reindex() need not stat each file and can recover TypeNames.
+        Names in either format are always read. metadata_names defaults to
+        False because the new names are not downgrade-safe: releases before
+        they were added match uid[...] greedily up to ".json", so they read
+        the uid of "<dt>.uid[x].size[12].json" as "x].size[12".
+        priority_classes and retention_seconds_by_type need TypeNames after
+        a reindex, so metadata_names is on while either is non-empty.
+
+        The TypeName of each event is read from its content. If
+        priority_classes, a mapping from TypeName to priority class, is
+        provided, trimming clears events of the lowest class first, oldest
+        first within a class. Events of other types, or whose content has no
+        readable TypeName, get default_priority.
+
+        A reindex() that scans, rather than loading the manifest in the
+        foreground, scans up to scan_workers day directories concurrently.
+        A background reindex scans one day directory at a time, oldest first.
+
+        If retention_seconds is provided, events persisted more than
+        retention_seconds ago are expired. retention_seconds_by_type maps
+        TypeName to a retention for events of that type, overriding
+        retention_seconds. Expired events are dropped by trim() and by
+        drop_expired(), which persist() requests in a worker thread at most
+        every EXPIRE_CHECK_SECONDS. Until dropped, expired() reports them, so
+        uploaders can skip them without reading them.
+        """
         self._base_dir = Path(base_dir).resolve()
         self._max_bytes = max_bytes
         self._curr_dir = self._today_dir()
         self._curr_bytes = 0
         self._pat_watchdog_args = pat_watchdog_args
         self._reindex_pat_seconds = reindex_pat_seconds
+        self._use_manifest = use_manifest
+        self._background_reindex = background_reindex
         self._pending = {}
+        self._sizes = {}
+        self._day_bytes = {}
+        self._day_uids = {}
+        self._persisted_while_reindexing = {}
+        self._cleared_while_reindexing = set()
+        self._lock = threading.RLock()
+        self._pat_lock = threading.Lock()
+        self._syncer = FileSyncer(durability, group_commit_seconds)
+        if not 0 < low_watermark <= high_watermark <= 1:
+            raise ValueError(
+                "ERROR. Watermarks must satisfy "
+                f"0 < low ({low_watermark}) <= high ({high_watermark}) <= 1"
+            )
+        self._background_trim = background_trim
+        self._high_watermark = high_watermark
+        self._low_watermark = low_watermark
+        self._maintenance_wanted = threading.Event()
+        self._verify_seconds = verify_seconds
+        self._next_verify = time.monotonic() + verify_seconds
+        if priority_classes is not None:
+            self._priority_classes = dict(priority_classes)
+        self._default_priority = default_priority
+        self._scan_workers = scan_workers
+        self._priorities = {}
+        self._by_priority = {}
+        self._retention_seconds = retention_seconds
+        self._retention_seconds_by_type = dict(retention_seconds_by_type or {})
+        self._metadata_names = metadata_names
 
     @property
     def max_bytes(self) -> int:
@@ -78,124 +257,363 @@ class TimedRollingFilePersister(PersisterInterface):
     def curr_dir(self) -> Path:
         return self._curr_dir
 
+    @property
+    def manifest_path(self) -> Path:
+        return self._base_dir / self.MANIFEST_NAME
+
+    @property
+    def use_manifest(self) -> bool:
+        return self._use_manifest
+
+    @property
+    def manifest_loaded(self) -> bool:
+        """True if the last reindex() was satisfied by loading the manifest."""
+        return self._manifest_loaded
+
+    @property
+    def durability(self) -> Durability:
+        return self._syncer.durability
+
+    @property
+    def background_trim(self) -> bool:
+        return self._background_trim
+
+    @property
+    def high_watermark_bytes(self) -> int:
+        return int(self._max_bytes * self._high_watermark)
+
+    @property
+    def low_watermark_bytes(self) -> int:
+        return int(self._max_bytes * self._low_watermark)
+
+    @property
+    def metadata_names(self) -> bool:
+        return (
+            self._metadata_names
+            or self._priority_classes is not None
+            or bool(self._retention_seconds_by_type)
+        )
+
+    @property
+    def priority_classes(self) -> Optional[dict[str, int]]:
+        return self._priority_classes
+
+    def num_pending_by_priority(self) -> dict[int, int]:
+        """Return the number of pending events in each priority class, lowest
+        class first. Empty unless priority_classes was provided."""
+        with self._lock:
+            return {
+                priority: len(self._by_priority[priority])
+                for priority in sorted(self._by_priority)
+            }
+
+    @property
+    def retention_seconds(self) -> Optional[float]:
+        return self._retention_seconds
+
+    @property
+    def retention_seconds_by_type(self) -> dict[str, float]:
+        return self._retention_seconds_by_type
+
+    @property
+    def num_expired(self) -> int:
+        """Number of expired events dropped."""
+        return self._num_expired
+
+    @property
+    def num_verifies(self) -> int:
+        """Number of completed verify_sizes() calls."""
+        return self._num_verifies
+
+    @property
+    def num_day_drops(self) -> int:
+        """Number of day directories dropped whole by trim()."""
+        return self._num_day_drops
+
+    def day_bytes(self) -> dict[Path, int]:
+        """Bytes of pending events in each day directory."""
+        with self._lock:
+            return dict(self._day_bytes)
+
+    @property
+    def fsync_stats(self) -> FsyncStats:
+        return self._syncer.stats
+
+    def flush(self) -> Result[bool, Problems]:
+        problems = Problems()
+        try:
+            if self._manifest_file is not None:
+                self._manifest_file.flush()
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(PersisterError("Flush failed"))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    @property
+    def reindexing(self) -> bool:
+        return self._reindexing
+
+    def take_reindex_problems(self) -> Optional[Problems]:
+        with self._lock:
+            problems = self._reindex_problems
+            self._reindex_problems = None
+        return problems
+
+    def take_dropped(self) -> Optional[list[str]]:
+        with self._lock:
+            dropped = list(self._dropped or ())
+            self._dropped = {}
+        return dropped
+
+    def _note_dropped(self, uids: Iterable[str]) -> None:
+        if self._dropped is not None:
+            self._dropped.update(dict.fromkeys(uids))
+
+    def join_reindex(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a background reindex to complete. Return True if no
+        reindex is running."""
+        if self._reindex_thread is not None:
+            self._reindex_thread.join(timeout)
+            if not self._reindex_thread.is_alive():
+                self._reindex_thread = None
+        return self._reindex_thread is None
+
     def persist(self, uid: str, content: bytes) -> Result[bool, Problems]:
+        start = time.perf_counter()
         self._num_persists += 1
-        problems = Problems()
+        with self._lock:
+            problems = Problems()
+            path = self._persist(uid, content, problems)
+            if path is not None:
+                try:
+                    self._syncer.written(path)
+                except Exception as e:  # noqa: BLE001
+                    problems.add_error(e).add_error(
+                        WriteFailed("Sync failed", uid=uid, path=path)
+                    )
+            self.metrics.persist.record(start, len(content))
+            if problems:
+                return Err(problems)
+            return Ok()
+
+    def persist_many(
+        self, events: Sequence[tuple[str, bytes]]
+    ) -> Result[bool, Problems]:
+        """Persist events with one trim for the whole batch and one sync,
+        which fsyncs each day directory once."""
+        start = time.perf_counter()
+        self._num_persists += len(events)
+        with self._lock:
+            problems = Problems()
+            needed_bytes = sum(
+                len(content) for _, content in events if len(content) <= self._max_bytes
+            )
+            if needed_bytes + self._curr_bytes > self._max_bytes:
+                match self._trim_old_storage(min(needed_bytes, self._max_bytes)):
+                    case Err(trim_problems):
+                        problems.add_problems(trim_problems)
+            paths = []
+            for uid, content in events:
+                if (path := self._persist(uid, content, problems)) is not None:
+                    paths.append(path)
+            try:
+                self._syncer.written_many(paths)
+            except Exception as e:  # noqa: BLE001
+                problems.add_error(e).add_error(
+                    WriteFailed("Sync failed", path=self._curr_dir)
+                )
+            self.metrics.persist.record(
+                start, sum(len(content) for _, content in events), len(events)
+            )
+            if problems:
+                return Err(problems)
+            return Ok()
+
+    def _persist(self, uid: str, content: bytes, problems: Problems) -> Optional[Path]:
+        """Write content for uid without syncing it. Return the path written,
+        or None if an error was added to problems."""
         try:
             if len(content) > self._max_bytes:
-                return Err(
-                    problems.add_error(
-                        ContentTooLarge(
-                            f"content bytes ({len(content)} > max bytes {self._max_bytes}",
-                            uid=uid,
-                        )
+                problems.add_error(
+                    ContentTooLarge(
+                        f"content bytes ({len(content)} > max bytes {self._max_bytes}",
+                        uid=uid,
                     )
                 )
+                return None
             if len(content) + self._curr_bytes > self._max_bytes:
                 trimmed = self._trim_old_storage(len(content))
                 match trimmed:
                     case Err(trim_problems):
                         problems.add_problems(trim_problems)
                         if problems.errors:
-                            return Err(problems.add_error(TrimFailed(uid=uid)))
+                            problems.add_error(TrimFailed(uid=uid))
+                            return None
             existing_path = self._pending.pop(uid, None)
             if existing_path is not None:
+                self._curr_bytes -= self._unindex(uid, existing_path)
                 problems.add_warning(UIDExistedWarning(uid=uid, path=existing_path))
-                if existing_path.exists():
-                    self._curr_bytes -= existing_path.stat().st_size
+                try:
+                    existing_path.unlink()
                     problems.add_warning(
                         FileExistedWarning(uid=uid, path=existing_path)
                     )
-                else:
+                except FileNotFoundError:
                     problems.add_warning(
                         FileMissingWarning(uid=uid, path=existing_path)
                     )
             self._roll_curr_dir()
-            self._pending[uid] = self._curr_dir / self._make_name(
-                datetime.datetime.now(tz=datetime.timezone.utc), uid
+            type_name = self._type_name_of(content)
+            metadata_names = self.metadata_names
+            path = self._curr_dir / self._make_name(
+                datetime.datetime.now(tz=datetime.timezone.utc),
+                uid,
+                len(content) if metadata_names else None,
+                type_name if metadata_names else "",
             )
             try:
-                with self._pending[uid].open("wb") as f:
+                with path.open("wb") as f:
                     f.write(content)
-                self._curr_bytes += len(content)
-            except Exception as e:  # pragma: no cover  # noqa: BLE001
-                return Err(
-                    problems.add_error(e).add_error(
-                        WriteFailed("Open or write failed", uid=uid, path=existing_path)
-                    )
-                )
-        except Exception as e:  # noqa: BLE001
-            return Err(
+            except Exception as e:  # noqa: BLE001
+                with contextlib.suppress(OSError):
+                    path.unlink()
                 problems.add_error(e).add_error(
-                    PersisterError("Unexpected error", uid=uid)
+                    WriteFailed("Open or write failed", uid=uid, path=path)
                 )
+                return None
+            self._pending[uid] = path
+            self._curr_bytes += len(content)
+            self._index_persisted(uid, len(content), type_name)
+            self._schedule_maintenance()
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(PersisterError("Unexpected error", uid=uid))
+            return None
+        return path
+
+    def _index_persisted(self, uid: str, size: int, type_name: str) -> None:
+        self._sizes[uid] = size
+        self._index_priority(uid, type_name)
+        self._index_day(uid, self._pending[uid].parent, size)
+        if self._reindexing:
+            self._persisted_while_reindexing[uid] = None
+        elif self._use_manifest:
+            self._manifest_append(
+                "+", uid, self._relative_path(self._pending[uid]), size
             )
-        if problems:
-            return Err(problems)
-        return Ok()
 
     def _trim_old_storage(self, needed_bytes: int) -> Result[bool, Problems]:
+        """Trim as trim() does, until needed_bytes fit, deleting dropped day
+        directories while holding the lock."""
+        start = time.perf_counter()
+        curr_bytes = self._curr_bytes
+        num_pending = len(self._pending)
         problems = Problems()
-        last_day_dir: Optional[Path] = None
-        items = list(self._pending.items())
-        for uid, path in items:
-            try:
-                match self.clear(uid):
-                    case Err(other):
-                        problems.add_problems(other)
-                day_dir = path.parent
-                if last_day_dir is not None and last_day_dir != day_dir:
-                    shutil.rmtree(last_day_dir, ignore_errors=True)
-                last_day_dir = day_dir
-            except Exception as e:  # noqa: BLE001
-                problems.add_error(e)
-                problems.add_error(
-                    PersisterError("Unexpected error", uid=uid, path=path)
-                )
-            if self._curr_bytes <= self._max_bytes - needed_bytes:
-                break
+        self._drop_expired_inline(problems)
+        trash: list[Path] = []
         try:
-            if last_day_dir is not None and (
-                not self._pending
-                or next(iter(self._pending.values())).parent != last_day_dir
-            ):
-                shutil.rmtree(last_day_dir, ignore_errors=True)
-        except Exception as e:  # pragma: no cover  # noqa: BLE001
-            problems.add_error(e)
-            problems.add_error(PersisterError("Unexpected error"))
+            self._trim_to(self._max_bytes - needed_bytes, trash, problems)
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(PersisterError("Trim failed"))
+        for path in trash:
+            shutil.rmtree(path, ignore_errors=True)
+        self.metrics.trim.record(
+            start, curr_bytes - self._curr_bytes, num_pending - len(self._pending)
+        )
         if problems:
             return Err(problems)
         return Ok()
 
     def clear(self, uid: str) -> Result[bool, Problems]:
+        start = time.perf_counter()
         self._num_clears += 1
-        problems = Problems()
-        path = self._pending.pop(uid, None)
-        if path:
-            if path.exists():
-                self._curr_bytes -= path.stat().st_size
-                path.unlink()
-                path_dir = path.parent
+        with self._lock:
+            curr_bytes = self._curr_bytes
+            problems = Problems()
+            path = self._clear(uid, problems)
+            if path is not None:
                 # Remove directory if empty.
                 # This is much faster than using iterdir.
                 with contextlib.suppress(OSError):
-                    path_dir.rmdir()
-            else:
+                    path.parent.rmdir()
+            self.metrics.clear.record(start, curr_bytes - self._curr_bytes)
+            if problems:
+                return Err(problems)
+            return Ok()
+
+    def clear_many(self, uids: Sequence[str]) -> Result[bool, Problems]:
+        """Clear uids, attempting to remove each emptied day directory once."""
+        start = time.perf_counter()
+        with self._lock:
+            curr_bytes = self._curr_bytes
+            problems = Problems()
+            self._clear_many(uids, problems)
+            self.metrics.clear.record(start, curr_bytes - self._curr_bytes, len(uids))
+            if problems:
+                return Err(problems)
+            return Ok()
+
+    def _clear_many(self, uids: Sequence[str], problems: Problems) -> None:
+        """clear_many() without recording clear metrics, for trimming and
+        expiry, which record their own."""
+        self._num_clears += len(uids)
+        day_dirs: dict[Path, None] = {}
+        for uid in uids:
+            try:
+                path = self._clear(uid, problems)
+                if path is not None:
+                    day_dirs[path.parent] = None
+            except Exception as e:  # noqa: BLE001, PERF203
+                problems.add_error(e).add_error(
+                    PersisterError("Unexpected error", uid=uid)
+                )
+        for day_dir in day_dirs:
+            with contextlib.suppress(OSError):
+                day_dir.rmdir()
+
+    def _clear(self, uid: str, problems: Problems) -> Optional[Path]:
+        """Remove uid from the index and delete its file. Return the path of
+        the deleted file, if any."""
+        path = self._pending.pop(uid, None)
+        deleted = None
+        if path:
+            self._curr_bytes -= self._unindex(uid, path)
+            # Journal the clear first: a crash before the unlink leaves an
+            # unlisted file, which manifest validation detects.
+            if self._use_manifest and not self._reindexing:
+                try:
+                    self._manifest_append("-", uid)
+                except Exception as e:  # pragma: no cover  # noqa: BLE001
+                    problems.add_error(e).add_error(
+                        WriteFailed("Manifest write failed", uid=uid, path=path)
+                    )
+            try:
+                path.unlink()
+                deleted = path
+            except FileNotFoundError:
                 problems.add_warning(FileMissingWarning(uid=uid, path=path))
         else:
             problems.add_warning(UIDMissingWarning(uid=uid, path=path))
-        if problems:
-            return Err(problems)
-        return Ok()
+        if self._reindexing:
+            self._cleared_while_reindexing.add(uid)
+        return deleted
 
     def pending_ids(self) -> list[str]:
-        return list(self._pending.keys())
+        with self._lock:
+            return list(self._pending.keys())
+
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:
+        """Pages of uids are copied under the lock, so background reindexing
+        and trimming may continue while iterating."""
+        return iter_pending_pages(self._pending, after_uid, self._lock)
 
     def pending_paths(self) -> list[Path]:
-        return list(self._pending.values())
+        with self._lock:
+            return list(self._pending.values())
 
     def pending_dict(self) -> dict[str, Path]:
-        return dict(self._pending)
+        with self._lock:
+            return dict(self._pending)
 
     @property
     def num_pending(self) -> int:
@@ -216,10 +634,34 @@ class TimedRollingFilePersister(PersisterInterface):
     def __contains__(self, uid: str) -> bool:
         return uid in self._pending
 
+    def expired(self, uid: str) -> bool:
+        """Check the persisted time and TypeName encoded in the file name of
+        uid against the retention policy; the file is not read."""
+        path = self._pending.get(uid)
+        return path is not None and self._expired_at(path, time.time())
+
+    def _retention_of(self, type_name: str) -> Optional[float]:
+        return self._retention_seconds_by_type.get(type_name, self._retention_seconds)
+
+    def _expired_at(self, path: Path, now: float) -> bool:
+        match = self.FILENAME_RGX.match(path.name)
+        if match is None:
+            return False
+        retention = self._retention_of(match.group("type") or "")
+        return (
+            retention is not None
+            and self._timestamp(match.group("dt")) < now - retention
+        )
+
+    @classmethod
+    def _timestamp(cls, iso: str) -> float:
+        return datetime.datetime.fromisoformat(iso).timestamp()
+
     def get_path(self, uid: str) -> Optional[Path]:
         return self._pending.get(uid, None)
 
     def retrieve(self, uid: str) -> Result[Optional[bytes], Problems]:
+        start = time.perf_counter()
         self._num_retrieves += 1
         problems = Problems()
         content: Optional[bytes] = None
@@ -235,44 +677,702 @@ class TimedRollingFilePersister(PersisterInterface):
                     )
             else:
                 problems.add_error(FileMissing(uid=uid, path=path))
+        self.metrics.retrieve.record(start, len(content) if content else 0)
         if problems:
             return Err(problems)
         return Ok(content)
 
+    def retrieve_many(
+        self, uids: Sequence[str]
+    ) -> dict[str, Result[Optional[bytes], Problems]]:
+        """Retrieve uids, opening each file directly instead of first
+        checking that it exists."""
+        start = time.perf_counter()
+        self._num_retrieves += len(uids)
+        num_bytes = 0
+        results: dict[str, Result[Optional[bytes], Problems]] = {}
+        for uid in uids:
+            path = self._pending.get(uid, None)
+            if path is None:
+                results[uid] = Ok(None)
+                continue
+            try:
+                with path.open("rb") as f:
+                    content = f.read()
+                num_bytes += len(content)
+                results[uid] = Ok(content)
+            except FileNotFoundError:
+                results[uid] = Err(
+                    Problems().add_error(FileMissing(uid=uid, path=path))
+                )
+            except Exception as e:  # pragma: no cover  # noqa: BLE001
+                results[uid] = Err(
+                    Problems()
+                    .add_error(e)
+                    .add_error(ReadFailed("Open or read failed", uid=uid, path=path))
+                )
+        self.metrics.retrieve.record(start, num_bytes, len(uids))
+        return results
+
     def reindex(self) -> Result[bool, Problems]:
-        problems = Problems()
+        self.join_reindex()
+        start = time.perf_counter()
+        with self._lock:
+            problems = Problems()
+            self._manifest_loaded = False
+            if self._use_manifest:
+                self._close_manifest()
+                try:
+                    self._load_manifest()
+                    self._manifest_loaded = True
+                except Exception:  # noqa: BLE001, S110
+                    # Missing or invalid manifest; fall back to a full scan.
+                    pass
+            if not self._manifest_loaded:
+                if self._background_reindex:
+                    self._start_background_reindex()
+                    return Ok()
+                self._scan(problems)
+            if self._use_manifest:
+                self._write_reindexed_manifest(problems)
+            self.metrics.reindex.record(start, self._curr_bytes, len(self._pending))
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _write_reindexed_manifest(self, problems: Problems) -> None:
+        try:
+            if (
+                not self._manifest_loaded
+                or self._manifest_lines > self._manifest_compact_threshold()
+            ):
+                self._compact_manifest()
+            else:
+                self._open_manifest()
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(
+                ReindexError("Manifest write failed", path=self.manifest_path)
+            )
+
+    def _scan(self, problems: Problems) -> None:
+        """Rebuild the index by scanning every day directory."""
         self._curr_bytes = 0
-        paths: list[_PersistedItem] = []
-        last_pat = time.time()
-        for base_dir_entry in self._base_dir.iterdir():  # noqa: PLR1702
-            try:
-                if base_dir_entry.is_dir() and self._is_iso_parseable(base_dir_entry):
-                    for day_dir_entry in base_dir_entry.iterdir():
-                        if self._pat_watchdog_args:
-                            now = time.time()
-                            if now > last_pat + self._reindex_pat_seconds:
-                                last_pat = now
-                                subprocess.run(self._pat_watchdog_args, check=True)  # noqa: S603
-                        try:
-                            if persisted_item := self._persisted_item_from_file_path(
-                                day_dir_entry
-                            ):
-                                self._curr_bytes += persisted_item.path.stat().st_size
-                                paths.append(persisted_item)
-                        except Exception as e:  # noqa: BLE001
-                            problems.add_error(e).add_error(
-                                ReindexError(path=day_dir_entry)
+        self._sizes = {}
+        self._pending = {}
+        self._last_pat = time.time()
+        for items in self._scan_day_dirs(self._day_dirs(problems), problems):
+            for persisted_item, size in items:
+                self._curr_bytes += size
+                self._sizes[persisted_item.uid] = size
+                self._pending[persisted_item.uid] = persisted_item.path
+        self._rebuild_indexes()
+
+    def _day_dirs(self, problems: Problems) -> list[Path]:
+        """Return day directories, oldest first."""
+        day_dirs = []
+        with os.scandir(self._base_dir) as base_dir_entries:
+            for base_dir_entry in base_dir_entries:
+                try:
+                    if base_dir_entry.is_dir() and self._is_iso_parseable(
+                        base_dir_entry.name
+                    ):
+                        day_dirs.append(base_dir_entry.name)
+                except Exception as e:  # noqa: BLE001, PERF203
+                    problems.add_error(e).add_error(ReindexError())
+        return [self._base_dir / day_dir for day_dir in sorted(day_dirs)]
+
+    def _scan_day_dirs(
+        self, day_dirs: list[Path], problems: Problems
+    ) -> Iterator[list[tuple[_PersistedItem, int]]]:
+        """Yield the scanned items of each day directory, in order, scanning
+        up to scan_workers directories concurrently. Each day's items are
+        already sorted, so they are concatenated without sorting."""
+        if self._scan_workers <= 1 or len(day_dirs) <= 1:
+            for day_dir in day_dirs:
+                yield self._scan_day_dir(day_dir, problems)
+            return
+        day_problems = [Problems() for _ in day_dirs]
+        with ThreadPoolExecutor(
+            max_workers=min(self._scan_workers, len(day_dirs)),
+            thread_name_prefix=f"scan<{self._base_dir.name}>",
+        ) as executor:
+            for items, day_problem in zip(
+                executor.map(self._scan_day_dir, day_dirs, day_problems),
+                day_problems,
+            ):
+                problems.add_problems(day_problem)
+                yield items
+
+    def _scan_day_dir(
+        self, day_dir: Path, problems: Problems
+    ) -> list[tuple[_PersistedItem, int]]:
+        """Return persisted items and their sizes from one day directory,
+        sorted by path."""
+        items: list[tuple[_PersistedItem, int]] = []
+        try:
+            with os.scandir(day_dir) as day_dir_entries:
+                for day_dir_entry in day_dir_entries:
+                    if self._pat_watchdog_args:
+                        self._pat_watchdog(self._pat_watchdog_args)
+                    path = day_dir / day_dir_entry.name
+                    try:
+                        if persisted_item := self._persisted_item_from_file_path(path):
+                            items.append(
+                                (
+                                    persisted_item,
+                                    persisted_item.size
+                                    if persisted_item.size is not None
+                                    else day_dir_entry.stat().st_size,
+                                )
                             )
-            except Exception as e:  # noqa: BLE001, PERF203
-                problems.add_error(e).add_error(ReindexError())
-        # The next line is correct, though PyCharm gives a false-positive warning.
-        # paths is a list of tuples, which the dict constructor will treat
-        # as a list of key-values pairs, which is the intended behavior.
-        self._pending = dict(sorted(paths, key=lambda item: item.path))  # type: ignore[attr-defined]
+                    except Exception as e:  # noqa: BLE001
+                        problems.add_error(e).add_error(ReindexError(path=path))
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(ReindexError())
+        return sorted(items, key=lambda item: item[0].path.name)
+
+    def _pat_watchdog(self, pat_watchdog_args: list[str]) -> None:
+        """Pat the watchdog if reindex_pat_seconds have passed since the last
+        pat. Called by concurrent scan workers: the first to find a pat due
+        pats, while the others skip it rather than wait."""
+        if time.time() <= self._last_pat + self._reindex_pat_seconds:
+            return
+        if not self._pat_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.time()
+            if now > self._last_pat + self._reindex_pat_seconds:
+                self._last_pat = now
+                subprocess.run(pat_watchdog_args, check=True)  # noqa: S603
+        finally:
+            self._pat_lock.release()
+
+    def _start_background_reindex(self) -> None:
+        self._pending = {}
+        self._sizes = {}
+        self._day_bytes = {}
+        self._day_uids = {}
+        self._priorities = {}
+        self._by_priority = {}
+        self._curr_bytes = 0
+        self._reindex_problems = None
+        self._persisted_while_reindexing = {}
+        self._cleared_while_reindexing = set()
+        self._reindexing = True
+        self._reindex_thread = threading.Thread(
+            target=self._run_background_reindex,
+            name=f"reindex<{self._base_dir.name}>",
+            daemon=True,
+        )
+        self._reindex_thread.start()
+
+    def _run_background_reindex(self) -> None:
+        start = time.perf_counter()
+        problems = Problems()
+        self._last_pat = time.time()
+        try:
+            for day_dir in self._day_dirs(problems):
+                items = self._scan_day_dir(day_dir, problems)
+                with self._lock:
+                    self._merge_reindexed_day(items)
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(ReindexError())
+        with self._lock:
+            self._reindexing = False
+            self._persisted_while_reindexing = {}
+            self._cleared_while_reindexing = set()
+            if self._use_manifest:
+                self._write_reindexed_manifest(problems)
+            self.metrics.reindex.record(start, self._curr_bytes, len(self._pending))
+            if problems:
+                self._reindex_problems = problems
+            if self._background_trim and self._curr_bytes > self.high_watermark_bytes:
+                self._request_trim()
+
+    def _merge_reindexed_day(self, items: list[tuple[_PersistedItem, int]]) -> None:
+        """Add one scanned day to the index. Events persisted since the
+        reindex started are newer than anything on disk, so they stay at the
+        end of the index."""
+        persisted_while_reindexing = [
+            (uid, self._pending.pop(uid))
+            for uid in self._persisted_while_reindexing
+            if uid in self._pending
+        ]
+        for persisted_item, size in items:
+            uid = persisted_item.uid
+            if uid in self._cleared_while_reindexing:
+                with contextlib.suppress(OSError):
+                    persisted_item.path.unlink()
+            elif uid not in self._pending and (
+                uid not in self._persisted_while_reindexing
+            ):
+                self._pending[uid] = persisted_item.path
+                self._sizes[uid] = size
+                self._index_priority(uid, persisted_item.type_name)
+                self._index_day(uid, persisted_item.path.parent, size)
+                self._curr_bytes += size
+        self._pending.update(persisted_while_reindexing)
+        for uid, _ in persisted_while_reindexing:
+            if (priority := self._priorities.get(uid)) is not None:
+                members = self._by_priority[priority]
+                members[uid] = members.pop(uid)
+
+    def _add_day_bytes(self, day_dir: Path, size: int) -> None:
+        day_bytes = self._day_bytes.get(day_dir, 0) + size
+        if day_bytes > 0:
+            self._day_bytes[day_dir] = day_bytes
+        else:
+            self._day_bytes.pop(day_dir, None)
+
+    def _index_day(self, uid: str, day_dir: Path, size: int) -> None:
+        self._add_day_bytes(day_dir, size)
+        self._day_uids.setdefault(day_dir, {})[uid] = None
+
+    def _unindex_day(self, uid: str, day_dir: Path, size: int) -> None:
+        self._add_day_bytes(day_dir, -size)
+        uids = self._day_uids.get(day_dir)
+        if uids is not None:
+            uids.pop(uid, None)
+            if not uids:
+                self._day_uids.pop(day_dir)
+
+    def _unindex(self, uid: str, path: Optional[Path]) -> int:
+        """Remove uid from the size, day and priority indexes and return its
+        size."""
+        size = self._sizes.pop(uid, 0)
+        if path is not None:
+            self._unindex_day(uid, path.parent, size)
+        self._unindex_priority(uid)
+        return size
+
+    def _rebuild_indexes(self) -> None:
+        """Rebuild the day and priority indexes from pending and sizes."""
+        self._day_bytes = {}
+        self._day_uids = {}
+        self._priorities = {}
+        self._by_priority = {}
+        for uid, path in self._pending.items():
+            self._index_day(uid, path.parent, self._sizes.get(uid, 0))
+            if self._priority_classes is not None:
+                match = self.FILENAME_RGX.match(path.name)
+                self._index_priority(uid, (match and match.group("type")) or "")
+
+    def _index_priority(self, uid: str, type_name: str) -> None:
+        if self._priority_classes is not None:
+            priority = self._priority_classes.get(type_name, self._default_priority)
+            self._priorities[uid] = priority
+            self._by_priority.setdefault(priority, {})[uid] = None
+
+    def _unindex_priority(self, uid: str) -> None:
+        priority = self._priorities.pop(uid, None)
+        if priority is not None:
+            members = self._by_priority[priority]
+            members.pop(uid, None)
+            if not members:
+                self._by_priority.pop(priority)
+
+    def _eviction_order(self) -> Iterator[str]:
+        """Yield pending uids in the order trimming clears them."""
+        if self._priority_classes is None:
+            yield from self._pending
+        else:
+            for priority in sorted(self._by_priority):
+                yield from self._by_priority[priority]
+
+    def take_background_problems(self) -> Optional[Problems]:
+        """Return and forget any problems found by background trimming or
+        size verification."""
+        with self._lock:
+            problems = self._background_problems
+            self._background_problems = None
+        return problems
+
+    def _schedule_maintenance(self) -> None:
+        if self._background_trim and self._curr_bytes > self.high_watermark_bytes:
+            self._request_trim()
+        if self._verify_seconds and time.monotonic() >= self._next_verify:
+            self._request_verify()
+        if self._has_retention() and time.monotonic() >= self._next_expire:
+            self._request_expire()
+
+    def _request_expire(self) -> None:
+        self._next_expire = time.monotonic() + self.EXPIRE_CHECK_SECONDS
+        self._expire_requested = True
+        self._request_maintenance()
+
+    def _request_trim(self) -> None:
+        self._trim_requested = True
+        self._request_maintenance()
+
+    def _request_verify(self) -> None:
+        self._next_verify = time.monotonic() + self._verify_seconds
+        self._verify_requested = True
+        self._request_maintenance()
+
+    def _request_maintenance(self) -> None:
+        if self._maintenance_thread is None:
+            self._maintenance_thread = threading.Thread(
+                target=self._run_maintenance,
+                name=f"maintenance<{self._base_dir.name}>",
+                daemon=True,
+            )
+            self._maintenance_thread.start()
+        self._maintenance_wanted.set()
+
+    def _run_maintenance(self) -> None:
+        while True:
+            self._maintenance_wanted.wait()
+            self._maintenance_wanted.clear()
+            results = []
+            if self._expire_requested:
+                self._expire_requested = False
+                results.append(self.drop_expired())
+            if self._trim_requested:
+                self._trim_requested = False
+                results.append(self.trim())
+            if self._verify_requested:
+                self._verify_requested = False
+                results.append(self.verify_sizes())
+            for result in results:
+                match result:
+                    case Err(problems):
+                        with self._lock:
+                            if self._background_problems is None:
+                                self._background_problems = Problems()
+                            self._background_problems.add_problems(problems)
+
+    def verify_sizes(self) -> Result[bool, Problems]:
+        """Reconcile the tracked size of each pending event with its file.
+
+        Files are stat'ed without holding the lock. Events whose file is
+        missing are removed from the index; mismatched sizes are corrected.
+        Events persisted or cleared during verification are left alone.
+        """
+        problems = Problems()
+        with self._lock:
+            if self._reindexing:
+                return Ok()
+            snapshot = [
+                (uid, path, self._sizes.get(uid, 0))
+                for uid, path in self._pending.items()
+            ]
+        mismatches = self._find_size_mismatches(snapshot, problems)
+        with self._lock:
+            for uid, path, size, disk_size in mismatches:
+                if self._pending.get(uid) != path or self._sizes.get(uid) != size:
+                    continue
+                if disk_size is None:
+                    self._curr_bytes -= self._unindex(uid, path)
+                    self._pending.pop(uid)
+                    self._note_dropped([uid])
+                    problems.add_warning(FileMissingWarning(uid=uid, path=path))
+                    if self._use_manifest:
+                        self._manifest_append("-", uid)
+                else:
+                    self._sizes[uid] = disk_size
+                    self._add_day_bytes(path.parent, disk_size - size)
+                    self._curr_bytes += disk_size - size
+                    problems.add_warning(
+                        SizeMismatchWarning(
+                            f"tracked {size} bytes, found {disk_size}",
+                            uid=uid,
+                            path=path,
+                        )
+                    )
+            self._num_verifies += 1
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def trim(self, target_bytes: Optional[int] = None) -> Result[bool, Problems]:
+        """Trim the oldest events until curr_bytes <= target_bytes, which
+        defaults to the low watermark.
+
+        A day directory, other than the current one, whose events all need
+        to go is dropped whole: its events are removed from the index and the
+        directory is renamed aside under the lock, then deleted outside it.
+        Otherwise the oldest events are cleared individually.
+        """
+        if target_bytes is None:
+            target_bytes = self.low_watermark_bytes
+        start = time.perf_counter()
+        problems = Problems()
+        trash: list[Path] = []
+        with self._lock:
+            curr_bytes = self._curr_bytes
+            num_pending = len(self._pending)
+            if not self._reindexing:
+                try:
+                    self._drop_expired(trash, problems)
+                    self._trim_to(target_bytes, trash, problems)
+                except Exception as e:  # noqa: BLE001
+                    problems.add_error(e).add_error(PersisterError("Trim failed"))
+            trimmed_bytes = curr_bytes - self._curr_bytes
+            num_trimmed = num_pending - len(self._pending)
+        self._empty_trash(trash)
+        self.metrics.trim.record(start, trimmed_bytes, num_trimmed)
+        if problems:
+            return Err(problems)
+        return Ok()
+
+    def _empty_trash(self, trash: list[Path]) -> None:
+        """Delete the directories in trash, and any left behind by an
+        earlier, interrupted, trim."""
+        with contextlib.suppress(OSError):
+            trash.extend(
+                path
+                for path in self._base_dir.iterdir()
+                if path.name.startswith(self.TRASH_PREFIX) and path not in trash
+            )
+        for path in trash:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def drop_expired(self) -> Result[bool, Problems]:
+        """Drop events older than their retention.
+
+        A day directory, other than the current one, which ended before the
+        longest retention is dropped whole, as by trim(). Expired events in
+        other days are cleared individually; since events are indexed oldest
+        first, only events older than the shortest retention are examined.
+        """
+        problems = Problems()
+        trash: list[Path] = []
+        with self._lock:
+            if not self._reindexing:
+                try:
+                    self._drop_expired(trash, problems)
+                except Exception as e:  # noqa: BLE001
+                    problems.add_error(e).add_error(
+                        PersisterError("Drop expired failed")
+                    )
+        self._empty_trash(trash)
         if problems:
             return Err(problems)
         return Ok()
 
+    def _has_retention(self) -> bool:
+        return self._retention_seconds is not None or bool(
+            self._retention_seconds_by_type
+        )
+
+    def _drop_expired(self, trash: list[Path], problems: Problems) -> None:
+        if not self._has_retention():
+            return
+        now = time.time()
+        num_pending = len(self._pending)
+        retentions = list(self._retention_seconds_by_type.values())
+        if self._retention_seconds is not None:
+            # Events of types without their own retention use this one.
+            retentions.append(self._retention_seconds)
+            self._drop_expired_days(now - max(retentions), trash)
+        expired_before = now - min(retentions)
+        uids = []
+        for uid, path in self._pending.items():
+            match = self.FILENAME_RGX.match(path.name)
+            if match is None:
+                continue
+            if self._timestamp(match.group("dt")) >= expired_before:
+                break
+            if self._expired_at(path, now):
+                uids.append(uid)
+        self._clear_many(uids, problems)
+        self._note_dropped(uids)
+        self._num_expired += num_pending - len(self._pending)
+
+    def _drop_expired_days(self, expired_before: float, trash: list[Path]) -> None:
+        """Drop whole day directories, other than the current one, which
+        ended before expired_before."""
+        for day_dir in sorted(self._day_uids):
+            if (
+                day_dir == self._curr_dir
+                or self._timestamp(day_dir.name) + self.DAY_SECONDS > expired_before
+            ):
+                break
+            trash.append(self._drop_day(day_dir))
+
+    def _drop_expired_inline(self, problems: Problems) -> None:
+        """Drop expired events, deleting dropped day directories while
+        holding the lock, as persist() trimming does."""
+        if not self._has_retention() or self._reindexing:
+            return
+        trash: list[Path] = []
+        try:
+            self._drop_expired(trash, problems)
+        except Exception as e:  # noqa: BLE001
+            problems.add_error(e).add_error(PersisterError("Drop expired failed"))
+        for path in trash:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _trim_to(
+        self, target_bytes: int, trash: list[Path], problems: Problems
+    ) -> None:
+        if self._priority_classes is not None:
+            self._trim_to_by_priority(target_bytes, problems)
+            return
+        while self._pending and self._curr_bytes > target_bytes:
+            excess_bytes = self._curr_bytes - target_bytes
+            day_dir = next(iter(self._pending.values())).parent
+            if (
+                day_dir != self._curr_dir
+                and not self._reindexing
+                and self._day_bytes.get(day_dir, 0) <= excess_bytes
+            ):
+                trash.append(self._drop_day(day_dir))
+                continue
+            uids = []
+            for uid, path in self._pending.items():
+                if path.parent != day_dir or excess_bytes <= 0:
+                    break
+                uids.append(uid)
+                excess_bytes -= self._sizes.get(uid, 0)
+            self._clear_many(uids, problems)
+            self._note_dropped(uids)
+            if problems.errors:
+                return
+
+    def _trim_to_by_priority(self, target_bytes: int, problems: Problems) -> None:
+        """Day directories mix priority classes, so are not dropped whole;
+        events are cleared in eviction order instead."""
+        uids = []
+        excess_bytes = self._curr_bytes - target_bytes
+        for uid in self._eviction_order():
+            if excess_bytes <= 0:
+                break
+            uids.append(uid)
+            excess_bytes -= self._sizes.get(uid, 0)
+        self._clear_many(uids, problems)
+        self._note_dropped(uids)
+
+    def _drop_day(self, day_dir: Path) -> Path:
+        """Remove every event in day_dir from the index and rename day_dir
+        aside for deletion. Return the renamed path."""
+        trash_path = day_dir.with_name(self.TRASH_PREFIX + day_dir.name)
+        day_dir.rename(trash_path)
+        day_uids = self._day_uids.pop(day_dir, {})
+        self._note_dropped(day_uids)
+        for uid in day_uids:
+            self._pending.pop(uid)
+            self._sizes.pop(uid, None)
+            self._unindex_priority(uid)
+            if self._use_manifest:
+                self._manifest_append("-", uid)
+        self._curr_bytes -= self._day_bytes.pop(day_dir, 0)
+        self._num_day_drops += 1
+        return trash_path
+
+    def _relative_path(self, path: Path) -> str:
+        return f"{path.parent.name}/{path.name}"
+
+    @classmethod
+    def _manifest_line(cls, *fields: str) -> str:
+        body = "\t".join(fields)
+        return f"{body}\t{zlib.crc32(body.encode(ENCODING)):08x}\n"
+
+    def _manifest_compact_threshold(self) -> int:
+        return max(self.MANIFEST_COMPACT_MIN_LINES, 2 * len(self._pending))
+
+    def _manifest_append(
+        self, op: str, uid: str, relative_path: str = "", size: int = 0
+    ) -> None:
+        if (
+            self._manifest_file is None
+            or self._manifest_lines >= self._manifest_compact_threshold()
+        ):
+            # Compaction writes the current index, which already includes
+            # this operation.
+            self._compact_manifest()
+        elif op == "+":
+            self._manifest_file.write(
+                self._manifest_line(op, uid, relative_path, str(size))
+            )
+            self._manifest_file.flush()
+            self._manifest_lines += 1
+        else:
+            self._manifest_file.write(self._manifest_line(op, uid))
+            self._manifest_file.flush()
+            self._manifest_lines += 1
+
+    def _open_manifest(self) -> None:
+        self._manifest_file = self.manifest_path.open("a", encoding=ENCODING)
+
+    def _close_manifest(self) -> None:
+        if self._manifest_file is not None:
+            self._manifest_file.close()
+            self._manifest_file = None
+
+    def _compact_manifest(self) -> None:
+        """Atomically replace the manifest with one entry per pending event."""
+        self._close_manifest()
+        self._base_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding=ENCODING) as f:
+            f.write(self.MANIFEST_HEADER + "\n")
+            for uid, path in self._pending.items():
+                f.write(
+                    self._manifest_line(
+                        "+", uid, self._relative_path(path), str(self._sizes[uid])
+                    )
+                )
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(self.manifest_path)
+        self._manifest_lines = len(self._pending)
+        self._open_manifest()
+
+    def _load_manifest(self) -> None:
+        """Load the index from the manifest, raising _ManifestInvalid if the
+        manifest is torn, corrupt or does not match the day directories on disk.
+        """
+        with self.manifest_path.open("r", encoding=ENCODING) as f:
+            lines = f.read().split("\n")
+        if lines[0] != self.MANIFEST_HEADER or lines[-1]:
+            raise _ManifestInvalid
+        pending: dict[str, Path] = {}
+        sizes: dict[str, int] = {}
+        for line in lines[1:-1]:
+            fields = line.split("\t")
+            if self._manifest_line(*fields[:-1]) != line + "\n":
+                raise _ManifestInvalid
+            pending.pop(fields[1], None)
+            sizes.pop(fields[1], None)
+            if fields[0] == "+":
+                day, name = fields[2].split("/")
+                pending[fields[1]] = self._base_dir / day / name
+                sizes[fields[1]] = int(fields[3])
+            elif fields[0] != "-":
+                raise _ManifestInvalid
+        self._validate_manifest_days(pending)
+        self._pending = pending
+        self._sizes = sizes
+        self._curr_bytes = sum(sizes.values())
+        self._rebuild_indexes()
+        self._manifest_lines = len(lines) - 2
+
+    def _validate_manifest_days(self, pending: dict[str, Path]) -> None:
+        """Days on disk must match days in the manifest. Unknown day
+        directories are only tolerated if they are empty. Each day must also
+        contain the expected number of files, which catches writes and
+        clears interrupted by a crash in any day.
+        """
+        day_counts: dict[str, int] = {}
+        for path in pending.values():
+            day_counts[path.parent.name] = day_counts.get(path.parent.name, 0) + 1
+        with os.scandir(self._base_dir) as entries:
+            disk_days = {
+                entry.name
+                for entry in entries
+                if entry.is_dir() and self._is_iso_parseable(entry.name)
+            }
+        if not disk_days.issuperset(day_counts):
+            raise _ManifestInvalid
+        for day in disk_days - day_counts.keys():
+            if any((self._base_dir / day).iterdir()):
+                raise _ManifestInvalid
+        for day, count in day_counts.items():
+            with os.scandir(self._base_dir / day) as entries:
+                if sum(1 for _ in entries) != count:
+                    raise _ManifestInvalid
+
     def _today_dir(self) -> Path:
         now = datetime.datetime.now(tz=datetime.timezone.utc)
         return (
@@ -290,8 +1390,50 @@ class TimedRollingFilePersister(PersisterInterface):
             self._curr_dir.mkdir(parents=True, exist_ok=True)
 
     @classmethod
-    def _make_name(cls, dt: datetime.datetime, uid: str) -> str:
-        return f"{dt.isoformat()}.uid[{uid}].json"
+    def _find_size_mismatches(
+        cls, snapshot: list[tuple[str, Path, int]], problems: Problems
+    ) -> list[tuple[str, Path, int, Optional[int]]]:
+        """Return (uid, path, tracked size, disk size or None if missing) for
+        each entry in snapshot whose file size differs from its tracked size."""
+        mismatches: list[tuple[str, Path, int, Optional[int]]] = []
+        for uid, path, size in snapshot:
+            try:
+                disk_size: Optional[int] = path.stat().st_size
+            except FileNotFoundError:
+                disk_size = None
+            except Exception as e:  # noqa: BLE001, PERF203
+                problems.add_error(e).add_error(
+                    ReadFailed("Stat failed", uid=uid, path=path)
+                )
+                continue
+            if disk_size != size:
+                mismatches.append((uid, path, size, disk_size))
+        return mismatches
+
+    @classmethod
+    def _make_name(
+        cls,
+        dt: datetime.datetime,
+        uid: str,
+        size: Optional[int] = None,
+        type_name: str = "",
+    ) -> str:
+        name = f"{dt.isoformat()}.uid[{uid}]"
+        if size is not None:
+            name += f".size[{size}]"
+        if type_name:
+            name += f".type[{type_name}]"
+        return name + ".json"
+
+    @classmethod
+    def _type_name_of(cls, content: bytes) -> str:
+        """Return the TypeName of event content, or "" if not found. A
+        record written by CompressingPersister carries the TypeName of its
+        content in its header."""
+        type_name = record_type_name(content)
+        if type_name is None:
+            type_name = event_type_name(content)
+        return type_name
 
     @classmethod
     def _persisted_item_from_file_path(cls, filepath: Path) -> Optional[_PersistedItem]:
@@ -300,16 +1442,26 @@ class TimedRollingFilePersister(PersisterInterface):
         try:
             match = cls.FILENAME_RGX.match(filepath.name)
             if match and cls._is_iso_parseable(match.group("dt")):
-                item = _PersistedItem(match.group("uid"), filepath)
+                size = match.group("size")
+                item = _PersistedItem(
+                    match.group("uid"),
+                    filepath,
+                    None if size is None else int(size),
+                    match.group("type") or "",
+                )
         except:  # pragma: no cover  # noqa: E722, S110
             pass
         return item
 
     @classmethod
     def _is_iso_parseable(cls, s: str | Path) -> bool:
+        """Names written by this class, UTC isoformat() timestamps, are
+        recognized by pattern alone. Other names are fully parsed."""
         try:
             if isinstance(s, Path):
                 s = s.name
+            if cls.ISO_UTC_RGX.match(s):
+                return True
             return isinstance(datetime.datetime.fromisoformat(s), datetime.datetime)
         except:  # noqa: E722
             return False
@@ -5,6 +5,7 @@ import sys
 import threading
 import traceback
 from functools import cached_property
+from pathlib import Path
 from typing import (
     Any,
     Dict,
@@ -31,6 +32,12 @@ from gwproactor.callbacks import (
     ProactorCallbackFunctions,
     ProactorCallbackInterface,
 )
+from gwproactor.checkpoint import (
+    CHECKPOINT_FILE_NAME,
+    ProactorCheckpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
 from gwproactor.config.app_settings import AppSettings
 from gwproactor.config.proactor_config import ProactorConfig, ProactorName
 from gwproactor.external_watchdog import (
@@ -45,21 +52,29 @@ from gwproactor.links import (
     LinkState,
 )
 from gwproactor.links.mqtt import QOS
+from gwproactor.links.uplink_scheduler import UplinkPriority
 from gwproactor.logger import ProactorLogger
 from gwproactor.message import (
+    BatchAck,
     DBGCommands,
     DBGEvent,
     DBGPayload,
+    EventBatch,
     MQTTConnectFailPayload,
     MQTTConnectPayload,
     MQTTDisconnectPayload,
     MQTTProblemsPayload,
     MQTTReceiptPayload,
     MQTTSubackPayload,
+    MultiAck,
     PatWatchdog,
     Shutdown,
 )
-from gwproactor.persister import PersisterInterface
+from gwproactor.persister import (
+    PersisterInterface,
+    ThreadedPersister,
+    TieredPersister,
+)
 from gwproactor.proactor_interface import (
     AppInterface,
     CommunicatorInterface,
@@ -78,6 +93,8 @@ T = TypeVar("T")
 
 class Proactor(Runnable):
     AWAIT_PROCESSING_FUTURE_ATTRIBUTE: str = "_await_processing_future"
+    REINDEX_MONITOR_SECONDS: float = 1.0
+    PERSISTER_MONITOR_SECONDS: float = 1.0
 
     _name: ProactorName
     _settings: AppSettings
@@ -110,15 +127,27 @@ class Proactor(Runnable):
         self._logger = config.logger
         self._stats = self.make_stats()
         self._event_persister = config.event_persister
+        if self._settings.proactor.threaded_persister and not isinstance(
+            self._event_persister, ThreadedPersister
+        ):
+            self._event_persister = ThreadedPersister(self._event_persister)
+        if self._settings.proactor.tiered_persister_bytes and not isinstance(
+            self._event_persister, TieredPersister
+        ):
+            self._event_persister = TieredPersister(
+                self._event_persister,
+                buffer_bytes=self._settings.proactor.tiered_persister_bytes,
+                max_age_seconds=self._settings.proactor.tiered_persister_max_age_seconds,
+            )
+        self._stats.persister = self._event_persister.metrics
         self._logger.lifecycle(f"Proactor <{self._name}> reindexing events")
         reindex_result = self._event_persister.reindex()
-        self._logger.lifecycle(
-            f"Proactor <{self._name}> reindexing complete.\n"
-            f"  {self._event_persister.num_pending} events present for upload, "
-            f"using approximately {int(self._event_persister.curr_bytes / 1024)} KB / "
-            f"{round(self._event_persister.curr_bytes / 1024 / 1024, 1)} MB "
-            f"storage space."
-        )
+        if self._event_persister.reindexing:
+            self._logger.lifecycle(
+                f"Proactor <{self._name}> reindexing events in background."
+            )
+        else:
+            self._log_reindex_complete()
         if reindex_result.is_err():
             self._reindex_problems = reindex_result.err()
             self._logger.error("ERROR in event persister reindex():")
@@ -158,6 +187,114 @@ class Proactor(Runnable):
     def make_stats(cls) -> ProactorStats:
         return ProactorStats()
 
+    def _log_reindex_complete(self) -> None:
+        self._logger.lifecycle(
+            f"Proactor <{self._name}> reindexing complete.\n"
+            f"  {self._event_persister.num_pending} events present for upload, "
+            f"using approximately {int(self._event_persister.curr_bytes / 1024)} KB / "
+            f"{round(self._event_persister.curr_bytes / 1024 / 1024, 1)} MB "
+            f"storage space."
+        )
+
+    async def _monitor_background_reindex(self) -> None:
+        """Add events found by a background reindex of the event persister
+        to the reupload as they are found."""
+        num_pending = self._event_persister.num_pending
+        while not self._stop_requested:
+            reindexing = self._event_persister.reindexing
+            if self._event_persister.num_pending != num_pending:
+                num_pending = self._event_persister.num_pending
+                self._links.extend_reupload()
+            if not reindexing:
+                break
+            await asyncio.sleep(self.REINDEX_MONITOR_SECONDS)
+        if not self._event_persister.reindexing:
+            self._log_reindex_complete()
+            reindex_problems = self._event_persister.take_reindex_problems()
+            if reindex_problems is not None:
+                self._logger.error("ERROR in event persister background reindex:")
+                self._logger.error(reindex_problems)
+                self.generate_event(
+                    reindex_problems.problem_event(
+                        "Background event reindex() problems"
+                    )
+                )
+
+    def _threaded_persister(self) -> Optional[ThreadedPersister]:
+        persister = self._event_persister
+        if isinstance(persister, TieredPersister):
+            persister = persister.persister
+        if isinstance(persister, ThreadedPersister):
+            return persister
+        return None
+
+    async def _monitor_threaded_persister(self) -> None:
+        """Report errors found by the event persister's I/O thread."""
+        threaded_persister = self._threaded_persister()
+        if threaded_persister is None:
+            return
+        while not self._stop_requested:
+            problems = threaded_persister.take_problems()
+            if problems is not None:
+                self._logger.error("ERROR in event persister I/O thread:")
+                self._logger.error(problems)
+                self.generate_event(
+                    problems.problem_event("Event persister I/O problems")
+                )
+            await asyncio.sleep(self.PERSISTER_MONITOR_SECONDS)
+
+    async def _monitor_tiered_persister(self) -> None:
+        """Spill events buffered in memory for too long to disk."""
+        if not isinstance(self._event_persister, TieredPersister):
+            return
+        while not self._stop_requested:
+            match self._event_persister.spill_expired():
+                case Err(problems) if problems.errors:
+                    self._logger.error("ERROR spilling buffered events:")
+                    self._logger.error(problems)
+                    self.generate_event(
+                        problems.problem_event("Event persister spill problems")
+                    )
+            await asyncio.sleep(self.PERSISTER_MONITOR_SECONDS)
+
+    def _checkpoint_path(self) -> Path:
+        return Path(self._settings.paths.data_dir) / CHECKPOINT_FILE_NAME
+
+    def save_checkpoint(self) -> Result[bool, Problems]:
+        """Save acked events and stats counters. See gwproactor.checkpoint."""
+        return save_checkpoint(
+            self._checkpoint_path(),
+            ProactorCheckpoint.from_stats(self._stats, self._links.recently_acked()),
+        )
+
+    def _restore_checkpoint(self) -> None:
+        match load_checkpoint(self._checkpoint_path()):
+            case Ok(checkpoint) if checkpoint is not None:
+                checkpoint.restore(self._stats)
+                num_cleared = self._links.restore_acked(checkpoint.acked_event_ids)
+                self._logger.lifecycle(
+                    "Restored checkpoint from %s, clearing %d acked events",
+                    self._checkpoint_path(),
+                    num_cleared,
+                )
+            case Err(problems):
+                self._logger.error("ERROR restoring checkpoint:")
+                self._logger.error(problems)
+                self.generate_event(
+                    problems.problem_event("Checkpoint restore problems")
+                )
+
+    async def _checkpoint_periodically(self) -> None:
+        while not self._stop_requested:
+            await asyncio.sleep(self._settings.proactor.checkpoint_seconds)
+            match self.save_checkpoint():
+                case Err(problems):
+                    self._logger.error("ERROR saving checkpoint:")
+                    self._logger.error(problems)
+                    self.generate_event(
+                        problems.problem_event("Checkpoint save problems")
+                    )
+
     def send(self, message: Message[Any]) -> None:
         if self._receive_queue is None:
             raise RuntimeError("ERROR. send() called before Proactor started.")
@@ -341,6 +478,7 @@ class Proactor(Runnable):
         *,
         topic: str = "",
         use_link_topic: bool = False,
+        priority: Optional[UplinkPriority] = None,
     ) -> MQTTMessageInfo:
         return self._links.publish_message(
             link_name=link_name,
@@ -349,6 +487,7 @@ class Proactor(Runnable):
             context=context,
             topic=topic,
             use_link_topic=use_link_topic,
+            priority=priority,
         )
 
     def publish_upstream(
@@ -538,6 +677,34 @@ class Proactor(Runnable):
                 *self._links.start_ping_tasks(),
             ]
         )
+        if self._event_persister.reindexing:
+            self._tasks.append(
+                asyncio.create_task(
+                    self._monitor_background_reindex(),
+                    name="monitor_background_reindex",
+                )
+            )
+        if self._threaded_persister() is not None:
+            self._tasks.append(
+                asyncio.create_task(
+                    self._monitor_threaded_persister(),
+                    name="monitor_threaded_persister",
+                )
+            )
+        if isinstance(self._event_persister, TieredPersister):
+            self._tasks.append(
+                asyncio.create_task(
+                    self._monitor_tiered_persister(),
+                    name="monitor_tiered_persister",
+                )
+            )
+        if self._settings.proactor.checkpoint_seconds:
+            self._tasks.append(
+                asyncio.create_task(
+                    self._checkpoint_periodically(),
+                    name="checkpoint_periodically",
+                )
+            )
         self._tasks.extend(self._callbacks.start_tasks())
 
     @classmethod
@@ -724,12 +891,29 @@ class Proactor(Runnable):
                     case DBGPayload():
                         path_dbg |= 0x00000040
                         self._process_dbg(decoded_message.Payload)
+                    case EventBatch():
+                        path_dbg |= 0x00000400
+                        self._process_event_batch(mqtt_receipt_message, decoded_message)
+                    case BatchAck():
+                        path_dbg |= 0x00000800
+                        self._links.process_batch_ack(
+                            mqtt_receipt_message.Payload.client_name,
+                            decoded_message.Payload,
+                        )
+                    case MultiAck():
+                        path_dbg |= 0x00001000
+                        self._links.process_multi_ack(
+                            mqtt_receipt_message.Payload.client_name,
+                            decoded_message.Payload,
+                        )
                     case _:
                         path_dbg |= 0x00000080
                         self._callbacks.process_mqtt_message(
                             mqtt_receipt_message, decoded_message
                         )
-                if decoded_message.Header.AckRequired:
+                if decoded_message.Header.AckRequired and not isinstance(
+                    decoded_message.Payload, EventBatch
+                ):
                     path_dbg |= 0x00000200
                     self._links.send_ack(
                         mqtt_receipt_message.Payload.client_name, decoded_message
@@ -742,6 +926,34 @@ class Proactor(Runnable):
         )
         return decode_result
 
+    def _process_event_batch(
+        self,
+        mqtt_receipt_message: Message[MQTTReceiptPayload],
+        batch_message: Message[EventBatch],
+    ) -> None:
+        """Process each event in batch_message as if it had arrived in its own
+        message, then ack, in one BatchAck, the events that could be
+        decoded."""
+        client_name = mqtt_receipt_message.Payload.client_name
+        messages, problems = self._links.unpack_event_batch(client_name, batch_message)
+        for message in messages:
+            self._stats.add_decoded_mqtt_message_type(
+                client_name, message.message_type()
+            )
+            self._callbacks.process_mqtt_message(mqtt_receipt_message, message)
+        if problems:
+            self.generate_event(
+                problems.problem_event(
+                    f"EventBatch decoding problems - batch:{batch_message.Header.MessageId}"
+                )
+            )
+        if batch_message.Header.AckRequired:
+            self._links.send_batch_ack(
+                client_name,
+                batch_message,
+                [message.Header.MessageId for message in messages],
+            )
+
     def _process_mqtt_connected(self, message: Message[MQTTConnectPayload]) -> None:
         match self._links.process_mqtt_connected(message):
             case Err(error):
@@ -823,6 +1035,8 @@ class Proactor(Runnable):
         self._loop = asyncio.get_running_loop()
         self._receive_queue = asyncio.Queue()
         self._links.start(self._loop, self._receive_queue)
+        if self._settings.proactor.checkpoint_seconds:
+            self._restore_checkpoint()
         if self._reindex_problems is not None:
             self.generate_event(
                 self._reindex_problems.problem_event("Startup event reindex() problems")
@@ -862,6 +1076,14 @@ class Proactor(Runnable):
             if not task.done():
                 task.cancel()
         self._links.stop()
+        self._event_persister.flush()
+        # Only a started proactor has restored, and so may replace, the
+        # checkpoint.
+        if self._settings.proactor.checkpoint_seconds and self._loop is not None:
+            match self.save_checkpoint():
+                case Err(problems):
+                    self._logger.error("ERROR saving checkpoint at shutdown:")
+                    self._logger.error(problems)
         for communicator in self._communicators.values():
             if isinstance(communicator, Runnable):
                 try:  # noqa: SIM105
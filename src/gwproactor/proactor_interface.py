@@ -19,6 +19,7 @@ from gwproactor.callbacks import ProactorCallbackInterface
 from gwproactor.config.app_settings import AppSettings
 from gwproactor.external_watchdog import ExternalWatchdogCommandBuilder
 from gwproactor.links.mqtt import QOS
+from gwproactor.links.uplink_scheduler import UplinkPriority
 from gwproactor.logger import ProactorLogger
 from gwproactor.stats import ProactorStats
 
@@ -314,6 +315,7 @@ class AppInterface(ABC):
         *,
         topic: str = "",
         use_link_topic: bool = False,
+        priority: Optional[UplinkPriority] = None,
     ) -> MQTTMessageInfo:
         raise NotImplementedError
 
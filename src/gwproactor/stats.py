@@ -5,12 +5,14 @@ from typing import Any, Optional, Sequence
 from gwproto import Message
 
 from gwproactor.message import MQTTReceiptPayload
+from gwproactor.persister.metrics import PersisterMetrics
 
 
 @dataclass
 class ReuploadCounts:
     started: int = 0
     completed: int = 0
+    expired: int = 0
 
     def start(self) -> None:
         self.started += 1
@@ -18,6 +20,36 @@ class ReuploadCounts:
     def complete(self) -> None:
         self.completed += 1
 
+    def expire(self, num_events: int) -> None:
+        self.expired += num_events
+
+
+@dataclass
+class UplinkCounts:
+    """Messages sent and queued by a link's UplinkScheduler, by priority."""
+
+    num_sent: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    num_delayed: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    queue_depth: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    max_queue_depth: int = 0
+
+    @property
+    def total_queue_depth(self) -> int:
+        return sum(self.queue_depth.values())
+
+    def __str__(self) -> str:
+        s = (
+            f"  Uplink queue depth: {self.total_queue_depth}  "
+            f"max: {self.max_queue_depth}"
+        )
+        for priority in self.queue_depth:
+            s += (
+                f"\n    {priority:10s}  sent: {self.num_sent[priority]:7d}  "
+                f"delayed: {self.num_delayed[priority]:7d}  "
+                f"queued: {self.queue_depth[priority]:5d}"
+            )
+        return s
+
 
 @dataclass
 class LinkStats:
@@ -31,6 +63,7 @@ class LinkStats:
     comm_event_counts: dict[str, int] = field(default_factory=lambda: defaultdict(int))
     reupload_counts: ReuploadCounts = field(default_factory=ReuploadCounts)
     timeouts: int = 0
+    uplink: Optional[UplinkCounts] = None
 
     def start_reupload(self) -> None:
         self.reupload_counts.start()
@@ -38,6 +71,9 @@ class LinkStats:
     def complete_reupload(self) -> None:
         self.reupload_counts.complete()
 
+    def expire_reupload_events(self, num_events: int) -> None:
+        self.reupload_counts.expire(num_events)
+
     @property
     def num_received(self) -> int:
         return self.num_received_by_type[Message.type_name()]
@@ -58,6 +94,9 @@ class LinkStats:
                 s += f"\n    {self.comm_event_counts[comm_event]:3d}: [{comm_event}]"
             s += f"\n    {self.reupload_counts.started:3d}: [reuploads_started]"
             s += f"\n    {self.reupload_counts.completed:3d}: [reuploads_completed]"
+            s += f"\n    {self.reupload_counts.expired:3d}: [reupload_events_expired]"
+        if self.uplink is not None:
+            s += f"\n{self.uplink}"
         return s
 
 
@@ -66,6 +105,7 @@ class ProactorStats:
     num_received_by_topic: dict[str, int]
     num_events_received: int = 0
     links: dict[str, LinkStats]
+    persister: Optional[PersisterMetrics] = None
 
     def __init__(self, link_names: Optional[Sequence[str]] = None) -> None:
         self.num_received_by_type = defaultdict(int)
@@ -127,4 +167,6 @@ class ProactorStats:
         for link_name in sorted(self.links):
             s += "\n"
             s += str(self.links[link_name])
+        if self.persister is not None:
+            s += f"\n{self.persister}"
         return s
@@ -1,17 +1,19 @@
 # ruff: noqa: ERA001
 
 import dataclasses
+import json
 from collections import defaultdict
 from dataclasses import dataclass
 from typing import Any, Optional, cast
 
 from gwproto import Message
-from gwproto.messages import Ack, CommEvent, EventBase, EventT
+from gwproto.messages import Ack, AnyEvent, CommEvent, EventBase, EventT
 from paho.mqtt.client import MQTTMessageInfo
 from pydantic import BaseModel
 from result import Result
 
-from gwproactor.links import LinkManager, LinkState
+from gwproactor.links import LinkManager, LinkState, UplinkPriority
+from gwproactor.links.in_flight import InFlightEvents
 from gwproactor_test.instrumented_stats import RecorderLinkStats
 
 
@@ -87,9 +89,21 @@ class RecorderLinks(LinkManager):
         return link
 
     @property
-    def in_flight_events(self) -> dict[str, EventBase]:
+    def in_flight(self) -> InFlightEvents:
         return self._in_flight_events
 
+    @property
+    def in_flight_events(self) -> dict[str, EventBase]:
+        """In-flight events, decoded from the form in which they are held."""
+        events: dict[str, EventBase] = {}
+        for event_id in self._in_flight_events:
+            event_bytes = self._in_flight_events.get(event_id)
+            if event_bytes is not None:
+                events[event_id] = AnyEvent.model_validate(
+                    self._decoded_event(json.loads(event_bytes))
+                )
+        return events
+
     @property
     def num_in_flight(self) -> int:
         return len(self._in_flight_events)
@@ -103,6 +117,7 @@ class RecorderLinks(LinkManager):
         *,
         topic: str = "",
         use_link_topic: bool = False,
+        priority: Optional[UplinkPriority] = None,
     ) -> MQTTMessageInfo:
         if self.acks_paused:
             self.needs_ack.append(_PausedAck(link_name, message, qos, context))
@@ -115,6 +130,7 @@ class RecorderLinks(LinkManager):
             context=context,
             topic=topic,
             use_link_topic=use_link_topic,
+            priority=priority,
         )
 
     def process_ack(self, link_name: str, message_id: str) -> int:
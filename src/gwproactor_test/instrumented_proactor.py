@@ -255,8 +255,13 @@ class InstrumentedProactor(Proactor):
         for link_name, tracked_items in self.links.ack_tracker.ackables.items():
             s += f"  {link_name}:{len(tracked_items):3d}\n"
             for message_id, tracked in tracked_items.items():
-                rp = int(message_id in self.links._reuploads._reupload_pending)  # noqa
-                ru = int(message_id in self.links._reuploads._reuploaded_unacked)  # noqa
+                reuploads = self.links._reuploads  # noqa: SLF001
+                ru = int(message_id in reuploads._reuploaded_unacked)  # noqa: SLF001
+                rp = int(
+                    reuploads.reuploading()
+                    and not ru
+                    and message_id in self.event_persister
+                )
                 is_ack_str = "*" if tracked.is_ack else " "
                 s += (
                     f"    {message_id[:8]}  "
@@ -0,0 +1,413 @@
+"""Benchmark workloads for PersisterInterface implementations.
+
+Each workload runs against a fresh directory for each backend, timing every
+persister call with time.perf_counter(). Latencies are summarized per
+operation as p50/p99/p99.9, and results are collected in a BenchResults
+model whose JSON can be saved and compared across runs and machines with
+compare_results().
+
+Backends are named factories taking (event_dir, max_bytes). Besides the
+built-in BACKENDS, a backend can be registered with register_backend(), or
+named as "module:attribute", which is imported on use.
+"""
+
+import datetime
+import importlib
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, NamedTuple, Optional, Sequence
+
+from pydantic import BaseModel
+
+from gwproactor.persister import (
+    CompressingPersister,
+    PersisterInterface,
+    SegmentLogPersister,
+    SQLitePersister,
+    ThreadedPersister,
+    TieredPersister,
+    TimedRollingFilePersister,
+)
+
+BackendFactory = Callable[[Path, int], PersisterInterface]
+
+BACKENDS: dict[str, BackendFactory] = {
+    "json": lambda event_dir, max_bytes: TimedRollingFilePersister(
+        event_dir, max_bytes
+    ),
+    "segment_log": lambda event_dir, max_bytes: SegmentLogPersister(
+        event_dir, max_bytes
+    ),
+    "sqlite": lambda event_dir, max_bytes: SQLitePersister(event_dir, max_bytes),
+    "compressed": lambda event_dir, max_bytes: CompressingPersister(
+        TimedRollingFilePersister(event_dir, max_bytes)
+    ),
+    "threaded": lambda event_dir, max_bytes: ThreadedPersister(
+        TimedRollingFilePersister(event_dir, max_bytes)
+    ),
+    "tiered": lambda event_dir, max_bytes: TieredPersister(
+        TimedRollingFilePersister(event_dir, max_bytes)
+    ),
+}
+
+PERCENTILES: tuple[float, ...] = (50.0, 99.0, 99.9)
+
+
+def register_backend(name: str, factory: BackendFactory) -> None:
+    BACKENDS[name] = factory
+
+
+def get_backend(name: str) -> BackendFactory:
+    """Return the named backend factory. Names containing ":" are imported
+    as "module:attribute"."""
+    if name in BACKENDS:
+        return BACKENDS[name]
+    if ":" in name:
+        module_name, attribute = name.split(":", 1)
+        factory: BackendFactory = getattr(
+            importlib.import_module(module_name), attribute
+        )
+        return factory
+    raise ValueError(
+        f"ERROR. Unknown persister backend <{name}>. "
+        f"Known backends: {list(BACKENDS)}, or use module:attribute."
+    )
+
+
+def percentile(sorted_samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted samples."""
+    if not sorted_samples:
+        return 0.0
+    rank = math.ceil(pct * len(sorted_samples) / 100)
+    return sorted_samples[min(max(rank, 1), len(sorted_samples)) - 1]
+
+
+class LatencySummary(BaseModel):
+    """Latency of one operation, in seconds."""
+
+    count: int = 0
+    total: float = 0.0
+    mean: float = 0.0
+    p50: float = 0.0
+    p99: float = 0.0
+    p999: float = 0.0
+    max: float = 0.0
+
+    @classmethod
+    def from_samples(cls, samples: Sequence[float]) -> "LatencySummary":
+        if not samples:
+            return cls()
+        sorted_samples = sorted(samples)
+        p50, p99, p999 = (percentile(sorted_samples, pct) for pct in PERCENTILES)
+        total = sum(sorted_samples)
+        return cls(
+            count=len(sorted_samples),
+            total=total,
+            mean=total / len(sorted_samples),
+            p50=p50,
+            p99=p99,
+            p999=p999,
+            max=sorted_samples[-1],
+        )
+
+
+class BenchParams(BaseModel):
+    n: int = 10000
+    """Events persisted by each workload."""
+    rec_size: int = 1024
+    """Approximate bytes per event."""
+    fill_fraction: float = 0.25
+    """For the mixed workload, max_bytes holds this fraction of n events."""
+    ack_every: int = 2
+    """For the mixed workload, retrieve and clear the oldest event after
+    every ack_every persists."""
+    reindex_runs: int = 5
+
+
+class WorkloadResult(BaseModel):
+    backend: str
+    workload: str
+    elapsed: float = 0.0
+    num_events: int = 0
+    events_per_second: float = 0.0
+    num_pending: int = 0
+    curr_bytes: int = 0
+    operations: dict[str, LatencySummary] = {}
+
+    @property
+    def key(self) -> str:
+        return f"{self.backend}/{self.workload}"
+
+
+class BenchResults(BaseModel):
+    created: str = ""
+    host: str = ""
+    platform: str = ""
+    python: str = ""
+    params: BenchParams = BenchParams()
+    results: list[WorkloadResult] = []
+
+    @classmethod
+    def new(cls, params: BenchParams) -> "BenchResults":
+        return cls(
+            created=datetime.datetime.now(tz=datetime.timezone.utc).isoformat(),
+            host=platform.node(),
+            platform=platform.platform(),
+            python=sys.version.split()[0],
+            params=params,
+        )
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(self.model_dump_json(indent=2))
+
+    @classmethod
+    def load(cls, path: Path) -> "BenchResults":
+        return cls.model_validate_json(path.read_text())
+
+
+class _Timer:
+    """Collects per-operation latency samples."""
+
+    samples: dict[str, list[float]]
+
+    def __init__(self) -> None:
+        self.samples = {}
+
+    def call(self, operation: str, func: Callable[..., object], *args: Any) -> None:
+        start = time.perf_counter()
+        func(*args)
+        self.samples.setdefault(operation, []).append(time.perf_counter() - start)
+
+    def summaries(self) -> dict[str, LatencySummary]:
+        return {
+            operation: LatencySummary.from_samples(samples)
+            for operation, samples in self.samples.items()
+        }
+
+
+def make_record(rec_size: int) -> bytes:
+    """Return JSON resembling a persisted event, about rec_size bytes long,
+    with enough random content that it does not compress trivially."""
+    details = os.urandom(max(rec_size // 4, 1)).hex()
+    padding = "." * max(rec_size - len(details) - 128, 0)
+    return json.dumps(
+        {
+            "MessageId": str(uuid.uuid4()),
+            "TimeCreatedMs": int(time.time() * 1000),
+            "Src": "bench",
+            "TypeName": "gridworks.event.problem",
+            "Details": details + padding,
+        }
+    ).encode()
+
+
+class Workload(NamedTuple):
+    name: str
+    description: str
+    run: Callable[[BackendFactory, Path, BenchParams, _Timer], PersisterInterface]
+
+
+def _new_persister(
+    factory: BackendFactory, event_dir: Path, max_bytes: int
+) -> PersisterInterface:
+    persister = factory(event_dir, max_bytes)
+    persister.reindex()
+    return persister
+
+
+def _populate(
+    factory: BackendFactory, event_dir: Path, params: BenchParams, timer: _Timer
+) -> PersisterInterface:
+    record = make_record(params.rec_size)
+    persister = _new_persister(
+        factory, event_dir, 2 * params.n * len(record) + 1024 * 1024
+    )
+    for _ in range(params.n):
+        uid = str(uuid.uuid4())
+        timer.call("persist", persister.persist, uid, record)
+    timer.call("flush", persister.flush)
+    return persister
+
+
+def _basic(
+    factory: BackendFactory, event_dir: Path, params: BenchParams, timer: _Timer
+) -> PersisterInterface:
+    """Persist, reindex, retrieve and clear n events."""
+    persister = _populate(factory, event_dir, params, timer)
+    for _ in range(params.reindex_runs):
+        reindexed = factory(event_dir, 2 * persister.curr_bytes + 1024 * 1024)
+        timer.call("reindex", reindexed.reindex)
+    for uid in persister.pending_ids():
+        timer.call("retrieve", persister.retrieve, uid)
+    for uid in persister.pending_ids():
+        timer.call("clear", persister.clear, uid)
+    timer.call("flush", persister.flush)
+    return persister
+
+
+def _mixed(
+    factory: BackendFactory, event_dir: Path, params: BenchParams, timer: _Timer
+) -> PersisterInterface:
+    """Persist n events into a store that holds fill_fraction of them, so
+    most persists trim, while retrieving and clearing the oldest events as
+    a live upstream link would."""
+    record = make_record(params.rec_size)
+    max_bytes = max(int(params.n * params.fill_fraction) * len(record), len(record))
+    persister = _new_persister(factory, event_dir, max_bytes)
+    persisted: deque[str] = deque()
+    for i in range(params.n):
+        uid = str(uuid.uuid4())
+        timer.call("persist", persister.persist, uid, record)
+        persisted.append(uid)
+        if params.ack_every and (i + 1) % params.ack_every == 0:
+            # Skip events already trimmed.
+            while persisted and persisted[0] not in persister:
+                persisted.popleft()
+            if persisted:
+                oldest = persisted.popleft()
+                timer.call("retrieve", persister.retrieve, oldest)
+                timer.call("clear", persister.clear, oldest)
+    timer.call("flush", persister.flush)
+    return persister
+
+
+def _drain(
+    factory: BackendFactory, event_dir: Path, params: BenchParams, timer: _Timer
+) -> PersisterInterface:
+    """Reupload drain of a backlog of n events: reindex, then retrieve and
+    clear each pending event in order."""
+    populated = _populate(factory, event_dir, params, _Timer())
+    persister = factory(event_dir, 2 * populated.curr_bytes + 1024 * 1024)
+    timer.call("reindex", persister.reindex)
+    for uid in persister.pending_ids():
+        timer.call("retrieve", persister.retrieve, uid)
+        timer.call("clear", persister.clear, uid)
+    timer.call("flush", persister.flush)
+    return persister
+
+
+def _fill(
+    factory: BackendFactory, event_dir: Path, params: BenchParams, timer: _Timer
+) -> PersisterInterface:
+    """Persist until curr_bytes reaches max_bytes, which holds n events, then
+    persist n / 10 more, each of which must trim. Persist latencies are
+    reported separately for each phase."""
+    record = make_record(params.rec_size)
+    persister = _new_persister(factory, event_dir, params.n * len(record))
+    for _ in range(params.n):
+        uid = str(uuid.uuid4())
+        timer.call("persist_filling", persister.persist, uid, record)
+    for _ in range(max(params.n // 10, 1)):
+        uid = str(uuid.uuid4())
+        timer.call("persist_full", persister.persist, uid, record)
+    timer.call("flush", persister.flush)
+    return persister
+
+
+WORKLOADS: dict[str, Workload] = {
+    workload.name: workload
+    for workload in [
+        Workload("basic", _basic.__doc__ or "", _basic),
+        Workload("mixed", _mixed.__doc__ or "", _mixed),
+        Workload("drain", _drain.__doc__ or "", _drain),
+        Workload("fill", _fill.__doc__ or "", _fill),
+    ]
+}
+
+
+def run_workload(
+    backend: str, workload: str, base_dir: Path, params: BenchParams
+) -> WorkloadResult:
+    """Run one workload against a fresh directory, base_dir/backend/workload."""
+    event_dir = base_dir / backend.replace(":", "_") / workload
+    if event_dir.exists():
+        shutil.rmtree(event_dir)
+    event_dir.mkdir(parents=True)
+    timer = _Timer()
+    start = time.perf_counter()
+    persister = WORKLOADS[workload].run(get_backend(backend), event_dir, params, timer)
+    elapsed = time.perf_counter() - start
+    num_events = max(len(samples) for samples in timer.samples.values())
+    return WorkloadResult(
+        backend=backend,
+        workload=workload,
+        elapsed=elapsed,
+        num_events=num_events,
+        events_per_second=num_events / elapsed if elapsed else 0.0,
+        num_pending=persister.num_pending,
+        curr_bytes=persister.curr_bytes,
+        operations=timer.summaries(),
+    )
+
+
+def run_benchmark(
+    backends: Sequence[str],
+    workloads: Sequence[str],
+    base_dir: Path,
+    params: Optional[BenchParams] = None,
+    on_result: Optional[Callable[[WorkloadResult], None]] = None,
+) -> BenchResults:
+    if params is None:
+        params = BenchParams()
+    for workload in workloads:
+        if workload not in WORKLOADS:
+            raise ValueError(
+                f"ERROR. Unknown workload <{workload}>. Known: {list(WORKLOADS)}"
+            )
+    results = BenchResults.new(params)
+    for backend in backends:
+        for workload in workloads:
+            result = run_workload(backend, workload, base_dir, params)
+            results.results.append(result)
+            if on_result is not None:
+                on_result(result)
+    return results
+
+
+class Comparison(NamedTuple):
+    key: str
+    operation: str
+    stat: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else math.inf
+
+
+def compare_results(
+    baseline: BenchResults,
+    current: BenchResults,
+    stats: Sequence[str] = ("p50", "p99", "p999"),
+) -> list[Comparison]:
+    """Return latency comparisons for each operation of each backend and
+    workload present in both results."""
+    baseline_results = {result.key: result for result in baseline.results}
+    comparisons: list[Comparison] = []
+    for result in current.results:
+        if (baseline_result := baseline_results.get(result.key)) is None:
+            continue
+        for operation, summary in result.operations.items():
+            if (baseline_summary := baseline_result.operations.get(operation)) is None:
+                continue
+            comparisons.extend(
+                Comparison(
+                    key=result.key,
+                    operation=operation,
+                    stat=stat,
+                    baseline=getattr(baseline_summary, stat),
+                    current=getattr(summary, stat),
+                )
+                for stat in stats
+            )
+    return comparisons
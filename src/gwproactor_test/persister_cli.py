@@ -8,19 +8,31 @@ import uuid
 from enum import Enum
 from pathlib import Path
 from pstats import SortKey
-from typing import NamedTuple, Optional
+from typing import Annotated, NamedTuple, Optional
 
 import rich
 import typer
 from pydantic import BaseModel
+from rich.table import Table
 
 from gwproactor.config import Paths
 from gwproactor.persister import (
     PersisterInterface,
     TimedRollingFilePersister,
 )
+from gwproactor_test.persister_bench import (
+    BACKENDS,
+    WORKLOADS,
+    BackendFactory,
+    BenchParams,
+    BenchResults,
+    WorkloadResult,
+    compare_results,
+    run_benchmark,
+)
 
 MEASUREMENT_FILE = "persister-measurements.json"
+BENCH_PATHS_NAME = "persister-bench"
 
 app = typer.Typer(
     no_args_is_help=True,
@@ -32,11 +44,18 @@ app = typer.Typer(
 
 class PersisterType(str, Enum):
     json = "json"
+    segment_log = "segment_log"
+    sqlite = "sqlite"
+    compressed = "compressed"
+    threaded = "threaded"
+    tiered = "tiered"
     all = "all"
 
 
-persister_classes: dict[PersisterType, type] = {
-    PersisterType.json: TimedRollingFilePersister,
+persister_factories: dict[PersisterType, BackendFactory] = {
+    persister_type: BACKENDS[persister_type.value]
+    for persister_type in PersisterType
+    if persister_type != PersisterType.all
 }
 
 
@@ -85,7 +104,7 @@ class MeasureCommand(abc.ABC):
         persister: Optional[PersisterInterface] = None,
         paths: Optional[Paths] = None,
     ) -> None:
-        if persister_type not in persister_classes:
+        if persister_type not in persister_factories:
             raise ValueError(f"Unexpected persister type {persister_type}")
         if paths is None:
             self.paths = Paths(name=paths_name(persister_type))
@@ -96,7 +115,9 @@ class MeasureCommand(abc.ABC):
         self.measurements_dir.mkdir(exist_ok=True, parents=True)
         self.measurement_file = self.measurements_dir / MEASUREMENT_FILE
         if persister is None:
-            self.persister = persister_classes[persister_type](self.paths.event_dir)
+            self.persister = persister_factories[persister_type](
+                Path(self.paths.event_dir), TimedRollingFilePersister.DEFAULT_MAX_BYTES
+            )
             if do_reindex:
                 self.persister.reindex()
         else:
@@ -372,7 +393,7 @@ def cleanup(
 ) -> None:
     """Delete event directories and, optionally, measurements."""
     persister_types = (
-        persister_classes.keys()
+        persister_factories.keys()
         if persister_type == PersisterType.all
         else [persister_type]
     )
@@ -517,7 +538,7 @@ def suite(
 ) -> None:
     """Run a suite of measurements for all persister types."""
     persister_types = (
-        persister_classes.keys()
+        persister_factories.keys()
         if persister_type == PersisterType.all
         else [persister_type]
     )
@@ -553,6 +574,150 @@ def suite(
     rich.print("\n")
 
 
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.3f}"
+
+
+def print_workload_result(result: WorkloadResult) -> None:
+    table = Table(
+        title=(
+            f"{result.key}: {result.num_events} events in {result.elapsed:.3f} s "
+            f"({result.events_per_second:.0f}/s)"
+        ),
+        title_justify="left",
+    )
+    for column in [
+        "operation",
+        "count",
+        "mean ms",
+        "p50 ms",
+        "p99 ms",
+        "p99.9 ms",
+        "max ms",
+    ]:
+        table.add_column(column, justify="left" if column == "operation" else "right")
+    for operation, summary in result.operations.items():
+        table.add_row(
+            operation,
+            str(summary.count),
+            _ms(summary.mean),
+            _ms(summary.p50),
+            _ms(summary.p99),
+            _ms(summary.p999),
+            _ms(summary.max),
+        )
+    rich.print(table)
+
+
+@app.command()
+def bench(
+    backend: Annotated[
+        Optional[list[str]],
+        typer.Option(
+            help=(
+                f"Backend to measure, one of {list(BACKENDS)} or module:attribute "
+                "naming a factory taking (event_dir, max_bytes). Repeatable. "
+                "Default: all built-in backends."
+            )
+        ),
+    ] = None,
+    workload: Annotated[
+        Optional[list[str]],
+        typer.Option(
+            help=f"Workload to run, one of {list(WORKLOADS)}. Repeatable. Default: all."
+        ),
+    ] = None,
+    n: int = 10000,
+    rec_size: int = 1024,
+    fill_fraction: float = BenchParams.model_fields["fill_fraction"].default,
+    ack_every: int = BenchParams.model_fields["ack_every"].default,
+    reindex_runs: int = BenchParams.model_fields["reindex_runs"].default,
+    output: Annotated[Optional[Path], typer.Option(help="JSON results file.")] = None,
+    dry_run: bool = False,
+) -> None:
+    """Measure p50/p99/p99.9 latency of persister backends under several
+    workloads, saving JSON results that can be compared with 'compare'."""
+    backends = backend or list(BACKENDS)
+    workloads = workload or list(WORKLOADS)
+    params = BenchParams(
+        n=n,
+        rec_size=rec_size,
+        fill_fraction=fill_fraction,
+        ack_every=ack_every,
+        reindex_runs=reindex_runs,
+    )
+    paths = Paths(name=BENCH_PATHS_NAME)
+    if output is None:
+        output = (
+            Path(paths.data_dir)
+            / "measurements"
+            / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+    rich.print(f"Backends:  {backends}")
+    for workload_ in workloads:
+        rich.print(f"Workload {workload_}: {WORKLOADS[workload_].description}")
+    rich.print(f"Params:    {params}")
+    rich.print(f"Event dir: {paths.event_dir}")
+    rich.print(f"Output:    {output}")
+    if dry_run:
+        return
+    event_dir = Path(paths.event_dir)
+    results = run_benchmark(
+        backends, workloads, event_dir, params, on_result=print_workload_result
+    )
+    shutil.rmtree(event_dir, ignore_errors=True)
+    results.save(output)
+    rich.print(f"Results written to {output}")
+
+
+@app.command()
+def compare(
+    baseline: Path,
+    current: Path,
+    threshold: Annotated[
+        float,
+        typer.Option(
+            help="Exit with an error if any latency ratio exceeds threshold. 0 disables."
+        ),
+    ] = 0.0,
+) -> None:
+    """Compare latencies of two 'bench' result files."""
+    comparisons = compare_results(
+        BenchResults.load(baseline), BenchResults.load(current)
+    )
+    table = Table(title=f"{current.name} vs {baseline.name}", title_justify="left")
+    for column in [
+        "workload",
+        "operation",
+        "stat",
+        "baseline ms",
+        "current ms",
+        "ratio",
+    ]:
+        table.add_column(
+            column,
+            justify="left" if column in {"workload", "operation", "stat"} else "right",
+        )
+    regressions = 0
+    for comparison in comparisons:
+        regressed = bool(threshold) and comparison.ratio > threshold
+        regressions += regressed
+        table.add_row(
+            comparison.key,
+            comparison.operation,
+            comparison.stat,
+            _ms(comparison.baseline),
+            _ms(comparison.current),
+            f"[red]{comparison.ratio:.2f}[/]"
+            if regressed
+            else f"{comparison.ratio:.2f}",
+        )
+    rich.print(table)
+    if regressions:
+        rich.print(f"[red]{regressions} latencies exceed threshold {threshold}[/]")
+        raise typer.Exit(code=1)
+
+
 @app.callback()
 def _main() -> None: ...
 
@@ -0,0 +1,61 @@
+# ruff: noqa: PLR2004
+from pathlib import Path
+
+import pytest
+
+from gwproactor_test.persister_bench import (
+    BACKENDS,
+    WORKLOADS,
+    BenchParams,
+    BenchResults,
+    LatencySummary,
+    compare_results,
+    get_backend,
+    percentile,
+    run_benchmark,
+)
+
+
+def test_latency_summary() -> None:
+    samples = [float(i) for i in range(1, 1001)]
+    assert percentile(sorted(samples), 50) == 500.0
+    assert percentile(sorted(samples), 99.9) == 999.0
+    assert percentile([], 50) == 0.0
+    summary = LatencySummary.from_samples(list(reversed(samples)))
+    assert summary.count == 1000
+    assert summary.p50 == 500.0
+    assert summary.p99 == 990.0
+    assert summary.p999 == 999.0
+    assert summary.max == 1000.0
+    assert LatencySummary.from_samples([]) == LatencySummary()
+
+
+def test_persister_bench(tmp_path: Path) -> None:
+    params = BenchParams(n=40, rec_size=200, reindex_runs=2)
+    results = run_benchmark(list(BACKENDS), list(WORKLOADS), tmp_path, params)
+    assert [result.key for result in results.results] == [
+        f"{backend}/{workload}" for backend in BACKENDS for workload in WORKLOADS
+    ]
+    for result in results.results:
+        assert result.num_events == 40
+        assert result.elapsed > 0
+        if result.workload == "fill":
+            assert result.operations["persist_full"].count == 4
+        if result.workload in {"basic", "drain"}:
+            assert result.num_pending == 0
+
+    # round trip and compare
+    path = tmp_path / "results.json"
+    results.save(path)
+    loaded = BenchResults.load(path)
+    assert loaded == results
+    comparisons = compare_results(loaded, results)
+    assert comparisons
+    assert all(
+        comparison.ratio == 1.0 for comparison in comparisons if comparison.baseline
+    )
+
+    # backends can be named by import path
+    assert get_backend("gwproactor.persister:SQLitePersister") is not None
+    with pytest.raises(ValueError, match="Unknown persister backend"):
+        get_backend("nope")
@@ -0,0 +1,120 @@
+# ruff: noqa: PLR2004
+from pathlib import Path
+
+import pytest
+from result import Err, Ok
+
+from gwproactor.checkpoint import (
+    CHECKPOINT_FILE_NAME,
+    ProactorCheckpoint,
+    load_checkpoint,
+    save_checkpoint,
+)
+from gwproactor.message import DBGEvent, DBGPayload
+from gwproactor.stats import ProactorStats
+from gwproactor_test import LiveTest
+
+
+def test_checkpoint(tmp_path: Path) -> None:
+    path = tmp_path / "data" / CHECKPOINT_FILE_NAME
+    assert load_checkpoint(path) == Ok(None)
+
+    stats = ProactorStats()
+    stats.add_link("upstream")
+    link_stats = stats.link("upstream")
+    stats.num_events_received = 7
+    stats.num_received_by_type["gridworks.event.problem"] = 3
+    link_stats.comm_event_counts["gridworks.event.comm.mqtt.connect"] = 2
+    link_stats.reupload_counts.completed = 4
+    link_stats.timeouts = 5
+    assert save_checkpoint(
+        path, ProactorCheckpoint.from_stats(stats, ["a", "b"])
+    ).is_ok()
+    assert not path.with_name(path.name + ".tmp").exists()
+
+    loaded = load_checkpoint(path).unwrap()
+    assert loaded is not None
+    assert loaded.acked_event_ids == ["a", "b"]
+    # restoring adds to the counts of the new stats; unknown links are dropped
+    restored = ProactorStats()
+    restored.add_link("upstream")
+    restored_link = restored.link("upstream")
+    restored_link.timeouts = 1
+    loaded.links["gone"] = loaded.links["upstream"]
+    loaded.restore(restored)
+    assert restored.num_events_received == 7
+    assert restored.num_received_by_type["gridworks.event.problem"] == 3
+    assert restored_link.comm_event_counts["gridworks.event.comm.mqtt.connect"] == 2
+    assert restored_link.reupload_counts.completed == 4
+    assert restored_link.timeouts == 6
+    assert not restored.has_link("gone")
+
+    path.write_text("{not json")
+    result = load_checkpoint(path)
+    assert isinstance(result, Err)
+    assert "Loading" in str(result.err())
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_restart(request: pytest.FixtureRequest) -> None:
+    """
+    Test:
+        events acked before a restart, but still persisted, are cleared
+        rather than reuploaded, and stats span the restart
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.child import DummyChildSettings
+
+    async with LiveTest(
+        start_child=True,
+        child_app_settings=DummyChildSettings(
+            proactor=ProactorSettings(checkpoint_seconds=0.1)
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for child to connect to mqtt",
+        )
+        for i in range(3):
+            child.generate_event(DBGEvent(Command=DBGPayload(), Msg=f"event {i}"))
+        await h.await_for(
+            lambda: child.links.num_pending >= 3,
+            "ERROR waiting for events to be persisted",
+        )
+        checkpoint_path = child._checkpoint_path()  # noqa: SLF001
+        await h.await_for(
+            checkpoint_path.exists,
+            "ERROR waiting for periodic checkpoint",
+        )
+        pending = child.event_persister.pending_ids()
+        num_events_received = child.stats.num_events_received
+        child.stop()
+        await child.join()
+
+        # As if the acks of two events reached the checkpoint but their
+        # clears never reached storage.
+        checkpoint = load_checkpoint(checkpoint_path).unwrap()
+        assert checkpoint is not None
+        assert checkpoint.num_events_received >= num_events_received
+        checkpoint.acked_event_ids = pending[:2]
+        assert save_checkpoint(checkpoint_path, checkpoint).is_ok()
+
+        h.remove_child()
+        h.start_child()
+        child = h.child
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for restarted child to connect to mqtt",
+        )
+        await h.await_for(
+            lambda: not child.event_persister.reindexing,
+            "ERROR waiting for restarted child to reindex",
+        )
+        assert pending[0] not in child.event_persister
+        assert pending[1] not in child.event_persister
+        assert pending[2] in child.event_persister
+        assert child.stats.num_events_received >= checkpoint.num_events_received
+        assert child.links.recently_acked()[:2] == pending[:2]
@@ -1,13 +1,70 @@
+# ruff: noqa: PLR2004
 import warnings
 from math import floor
 
 import pytest
+from freezegun import freeze_time
 
+from gwproactor import ProactorSettings
 from gwproactor.links import StateName
+from gwproactor.links.in_flight import InFlightEvents
 from gwproactor.message import DBGEvent, DBGPayload
 from gwproactor_test import LiveTest, await_for
 
 
+def test_in_flight_events() -> None:
+    with freeze_time("2025-01-01 00:00:00") as frozen:
+        # without ack latency samples, and if not adaptive, the limit is
+        # max_bytes
+        fixed = InFlightEvents(max_events=3, max_bytes=100, min_bytes=100)
+        assert not fixed.adaptive
+        assert not InFlightEvents(max_events=3, max_bytes=100).adaptive
+        assert not InFlightEvents(
+            max_events=3,
+            max_bytes=ProactorSettings().inflight_events_max_bytes,
+            min_bytes=ProactorSettings().inflight_events_min_bytes,
+        ).adaptive
+        assert fixed.add("a", b"a" * 60)
+        assert not fixed.add("b", b"b" * 50)
+        assert fixed.add("c", b"c" * 40)
+        assert fixed.num_bytes == 100
+        assert fixed.get("c") == b"c" * 40
+        assert fixed.pop("a") == b"a" * 60
+        assert fixed.pop("a") is None
+        assert fixed.add("d", b"d")
+        assert fixed.add("e", b"e")
+        # limited by count
+        assert not fixed.add("f", b"f")
+        assert fixed.take_all() == [("c", b"c" * 40), ("d", b"d"), ("e", b"e")]
+        assert len(fixed) == 0
+        assert fixed.num_bytes == 0
+        # an empty buffer takes anything up to max_bytes
+        assert not fixed.add("big", b"x" * 101)
+        assert fixed.add("big", b"x" * 100)
+
+        events = InFlightEvents(max_events=1000, max_bytes=10_000, min_bytes=300)
+        assert events.adaptive
+        assert events.limit_bytes == 10_000
+        # 100 bytes per second, each acked 3 seconds after it was added
+        for i in range(100):
+            assert events.add(str(i), b"x" * 100)
+            frozen.tick(1)
+            events.pop(str(i - 2))
+        assert events.smoothed_latency == 3.0
+        assert 90 < events.byte_rate < 100
+        assert 500 < events.limit_bytes < 650
+        # slower acks raise the limit
+        for i in range(100, 300):
+            events.add(str(i), b"x" * 100)
+            frozen.tick(1)
+            events.pop(str(i - 10))
+        assert 1800 < events.limit_bytes < 2300
+        assert "in-flight events" in str(events)
+        # a quiet link decays to min_bytes
+        frozen.tick(300)
+        assert events.limit_bytes == 300
+
+
 @pytest.mark.asyncio
 async def test_in_flight_happy_path(request: pytest.FixtureRequest) -> None:
     """Generate a bunch of events. While they are being acked generate a bunch
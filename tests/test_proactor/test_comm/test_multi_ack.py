@@ -0,0 +1,106 @@
+# ruff: noqa: PLR2004
+from typing import Any, Callable
+
+import pytest
+
+from gwproactor.links import (
+    AckCoalescer,
+    AckManager,
+    AckWaitInfo,
+    TimerManagerInterface,
+)
+from gwproactor.message import DBGEvent, DBGPayload
+from gwproactor_test.live_test_helper import LiveTest
+
+
+class _Timers(TimerManagerInterface):
+    def __init__(self) -> None:
+        self.timers: dict[int, tuple[float, Callable[[], None]]] = {}
+        self.next_handle = 0
+
+    def start_timer(self, delay_seconds: float, callback: Callable[[], None]) -> Any:
+        self.next_handle += 1
+        self.timers[self.next_handle] = (delay_seconds, callback)
+        return self.next_handle
+
+    def cancel_timer(self, timer_handle: Any) -> None:
+        self.timers.pop(timer_handle)
+
+    def fire(self) -> None:
+        handle = next(iter(self.timers))
+        self.timers.pop(handle)[1]()
+
+
+def test_ack_coalescer() -> None:
+    timers = _Timers()
+    sent: list[list[str]] = []
+    coalescer = AckCoalescer(timers, sent.append, max_ids=3, window_seconds=0.5)
+
+    # sent when max_ids are waiting
+    for message_id in "abc":
+        coalescer.add(message_id)
+    assert sent == [["a", "b", "c"]]
+    assert not timers.timers
+
+    # or when the window of the first elapses
+    coalescer.add("d")
+    coalescer.add("e")
+    assert len(coalescer) == 2
+    assert [delay for delay, _ in timers.timers.values()] == [0.5]
+    timers.fire()
+    assert sent[-1] == ["d", "e"]
+    assert len(coalescer) == 0
+
+    # clear() drops waiting acks
+    coalescer.add("f")
+    coalescer.clear()
+    assert not timers.timers
+    coalescer.flush()
+    assert sent[-1] == ["d", "e"]
+
+    # cancelling many ack timers at once
+    timed_out: list[AckWaitInfo] = []
+    acks = AckManager(timers, timed_out.append)
+    for message_id in "xyz":
+        acks.start_ack_timer("link", message_id)
+    wait_infos = acks.cancel_ack_timers_for("link", ["x", "z", "unknown"])
+    assert [wait_info.message_id for wait_info in wait_infos] == ["x", "z"]
+    assert acks.num_acks("link") == 1
+    assert len(timers.timers) == 1
+    assert acks.cancel_ack_timers_for("other", ["y"]) == []
+
+
+@pytest.mark.asyncio
+async def test_multi_ack(request: pytest.FixtureRequest) -> None:
+    """
+    Test:
+        a parent coalescing acks answers a burst of events with MultiAcks,
+        which clear the child's events
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.parent import DummyParentSettings
+
+    async with LiveTest(
+        start_child=True,
+        start_parent=True,
+        parent_app_settings=DummyParentSettings(
+            proactor=ProactorSettings(ack_coalesce_max_ids=5)
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        parent = h.parent
+        coalescer = parent.links.ack_coalescer(parent.downstream_client)
+        assert coalescer is not None
+        await h.await_quiescent_connections()
+        upstream_stats = child.stats.link(child.upstream_client)
+        for i in range(20):
+            child.generate_event(DBGEvent(Command=DBGPayload(), Msg=f"event {i}"))
+        await h.await_for(
+            lambda: child.links.num_in_flight == 0 and child.links.num_pending == 0,
+            "ERROR waiting for events to be acked",
+        )
+        assert upstream_stats.num_received_by_type["gridworks.proactor.multi.ack"] > 0
+        assert len(coalescer) == 0
+        assert child.links.num_acks(child.upstream_client) == 0
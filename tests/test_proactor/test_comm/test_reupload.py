@@ -1,17 +1,21 @@
 # ruff: noqa: ERA001,PLR2004
 import time
+import typing
 import warnings
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Iterator, Mapping, Optional
 
 import pytest
-from gwproto import MQTTTopic
-from result import Err
+from gwproto import Header, Message, MQTTTopic
+from result import Err, Ok
 
-from gwproactor import Proactor
-from gwproactor.links import StateName
-from gwproactor.message import DBGEvent, DBGPayload
-from gwproactor.persister import TimedRollingFilePersister
+from gwproactor import AppSettings, Proactor, ProactorLogger
+from gwproactor.links import ReuploadPrefetch, Reuploads, ReuploadWindow, StateName
+from gwproactor.links.event_batch import EventBatchBuilder
+from gwproactor.links.wire import decode_wire_header, encode_wire_message
+from gwproactor.message import BatchAck, DBGEvent, DBGPayload, EventBatch
+from gwproactor.persister import ThreadedPersister, TimedRollingFilePersister
 from gwproactor_test.live_test_helper import (
     LiveTest,
 )
@@ -89,6 +93,215 @@ async def test_reupload_basic(request: pytest.FixtureRequest) -> None:
         )
 
 
+def test_wire_messages() -> None:
+    event = DBGEvent(Command=DBGPayload(), Msg="wire")
+    header = Header(
+        Src="a", Dst="b", MessageType=event.TypeName, MessageId=event.MessageId
+    )
+    message_bytes = encode_wire_message(header, event.model_dump_json().encode())
+    assert decode_wire_header(message_bytes) == header
+    # same bytes as publishing the event would send
+    assert (
+        message_bytes
+        == Message[Any](Src="a", Dst="b", Payload=event).model_dump_json().encode()
+    )
+    assert Message[DBGEvent].model_validate_json(message_bytes).Payload == event
+    assert decode_wire_header(event.model_dump_json().encode()) is None
+    assert decode_wire_header(message_bytes[:-1]) is None
+    assert decode_wire_header(message_bytes.replace(b'"Src"', b'"Sr"')) is None
+
+
+@pytest.mark.asyncio
+async def test_reupload_wire_messages(request: pytest.FixtureRequest) -> None:
+    """
+    Test:
+        events persisted as complete messages are reuploaded without decoding
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.child import DummyChildSettings
+
+    async with LiveTest(
+        start_child=True,
+        add_parent=True,
+        child_app_settings=DummyChildSettings(
+            proactor=ProactorSettings(persist_wire_messages=True)
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        upstream_link = h.child.links.link(child.upstream_client)
+        reupload_counts = h.child.stats.link(child.upstream_client).reupload_counts
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for child to connect to mqtt",
+        )
+        event_ids = child.event_persister.pending_ids()
+        assert event_ids
+        for event_id in event_ids:
+            event_bytes = child.event_persister.retrieve(event_id).unwrap()
+            assert event_bytes is not None
+            header = decode_wire_header(event_bytes)
+            assert header is not None
+            assert header.MessageId == event_id
+            assert header.AckRequired
+
+        h.start_parent()
+        await h.await_for(
+            lambda: upstream_link.active(),
+            "ERROR waiting for parent",
+        )
+        await h.await_for(
+            lambda: reupload_counts.completed > 0
+            and child.links.num_pending == 0
+            and child.links.num_in_flight == 0,
+            "ERROR waiting for re-upload to complete",
+        )
+        assert child.event_persister.num_clears == child.event_persister.num_persists
+
+
+def test_reupload_prefetch() -> None:
+    from gwproactor import AppSettings
+
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    disk = TimedRollingFilePersister(settings.paths.event_dir)
+    assert disk.reindex().is_ok()
+    uids = [str(i) for i in range(10)]
+    assert disk.persist_many([(uid, uid.encode()) for uid in uids]).is_ok()
+    persister = ThreadedPersister(disk)
+    assert persister.reindex().is_ok()
+    prefetch = ReuploadPrefetch(persister, max_events=4)
+    prefetch.refill(uids)
+    assert prefetch.retrieving
+    assert persister.flush().is_ok()
+    assert not prefetch.needs_refill
+    assert prefetch.num_buffered == 4
+
+    # prefetched events are taken from memory, others retrieved
+    assert prefetch.retrieve_many(["0", "1", "5"]) == persister.retrieve_many(
+        ["0", "1", "5"]
+    )
+    assert (prefetch.num_hits, prefetch.num_misses) == (2, 1)
+    assert prefetch.num_buffered == 2
+
+    # events that are no longer upcoming or pending are dropped
+    assert persister.clear("3").is_ok()
+    prefetch.refill(["2", "3", "6", "7"])
+    assert persister.flush().is_ok()
+    assert prefetch.retrieve_many(["2", "3", "6"]) == {
+        "2": Ok(b"2"),
+        "3": Ok(None),
+        "6": Ok(b"6"),
+    }
+    assert (prefetch.num_hits, prefetch.num_misses) == (4, 2)
+    prefetch.clear()
+    assert prefetch.num_buffered == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("threaded_persister", [False, True])
+async def test_reupload_prefetched(
+    request: pytest.FixtureRequest,
+    threaded_persister: bool,  # noqa: FBT001
+) -> None:
+    """
+    Test:
+        a reupload completes with events read ahead of their acks
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.child import DummyChildSettings
+
+    async with LiveTest(
+        start_child=True,
+        add_parent=True,
+        child_app_settings=DummyChildSettings(
+            proactor=ProactorSettings(
+                reupload_prefetch_events=20, threaded_persister=threaded_persister
+            )
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        prefetch = child.links.reupload_prefetch
+        assert prefetch is not None
+        upstream_link = child.links.link(child.upstream_client)
+        reupload_counts = child.stats.link(child.upstream_client).reupload_counts
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for child to connect to mqtt",
+        )
+        events_to_generate = 100
+        for i in range(events_to_generate):
+            child.generate_event(
+                DBGEvent(
+                    Command=DBGPayload(),
+                    Msg=f"event {i + 1} / {events_to_generate}",
+                )
+            )
+        h.start_parent()
+        await h.await_for(
+            lambda: upstream_link.active(),
+            "ERROR waiting for parent",
+        )
+        await h.await_for(
+            lambda: reupload_counts.completed > 0
+            and child.links.num_pending == 0
+            and child.links.num_in_flight == 0,
+            "ERROR waiting for reupload to complete",
+        )
+        assert prefetch.num_hits > events_to_generate / 2
+        assert prefetch.num_buffered == 0
+
+
+@pytest.mark.asyncio
+async def test_reupload_threaded_persister(request: pytest.FixtureRequest) -> None:
+    """
+    Test:
+        a reupload completes when each event's content is read in the
+        persister's I/O thread, without the event loop waiting for it
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.child import DummyChildSettings
+
+    async with LiveTest(
+        start_child=True,
+        add_parent=True,
+        child_app_settings=DummyChildSettings(
+            proactor=ProactorSettings(threaded_persister=True)
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        upstream_link = child.links.link(child.upstream_client)
+        reupload_counts = child.stats.link(child.upstream_client).reupload_counts
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for child to connect to mqtt",
+        )
+        events_to_generate = 50
+        for i in range(events_to_generate):
+            child.generate_event(
+                DBGEvent(
+                    Command=DBGPayload(),
+                    Msg=f"event {i + 1} / {events_to_generate}",
+                )
+            )
+        h.start_parent()
+        await h.await_for(
+            lambda: upstream_link.active(),
+            "ERROR waiting for parent",
+        )
+        await h.await_for(
+            lambda: reupload_counts.completed > 0
+            and child.links.num_pending == 0
+            and child.links.num_in_flight == 0,
+            "ERROR waiting for reupload to complete",
+        )
+
+
 @pytest.mark.asyncio
 async def test_reupload_flow_control_simple(request: pytest.FixtureRequest) -> None:
     """
@@ -176,6 +389,250 @@ async def test_reupload_flow_control_simple(request: pytest.FixtureRequest) -> N
         )
 
 
+class _CountingPersister(TimedRollingFilePersister):
+    num_iter_pending: int = 0
+
+    def iter_pending(self, after_uid: Optional[str] = None) -> Iterator[str]:
+        self.num_iter_pending += 1
+        return super().iter_pending(after_uid)
+
+
+def test_reuploads_pull() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    persister = _CountingPersister(settings.paths.event_dir)
+    assert persister.reindex().is_ok()
+    for i in range(10):
+        assert persister.persist(str(i), b"{}").is_ok()
+    reuploads = Reuploads(
+        ProactorLogger(
+            **typing.cast(Mapping[str, Any], settings.logging.qualified_logger_names())
+        ),
+        persister,
+        num_initial_events=2,
+        excluded=lambda event_id: event_id == "9",
+    )
+
+    # each pull continues the same walk over the persister's pending events
+    assert reuploads.start_reupload() == ["0", "1"]
+    assert reuploads.num_reupload_pending == 8
+    for acked, expected in [("0", ["2"]), ("1", ["3"]), ("2", ["4"])]:
+        assert persister.clear(acked).is_ok()
+        assert reuploads.process_ack_for_reupload(acked) == expected
+    assert persister.num_iter_pending == 1
+
+    # extending counts the pending events not yet sent, without reading
+    # them, and restarts pulling from the oldest
+    assert persister.clear("3").is_ok()
+    assert reuploads.process_ack_for_reupload("3") == ["5"]
+    assert reuploads.extend_reupload() == []
+    assert reuploads.num_reupload_pending == 4
+    for acked, expected in [("4", ["6"]), ("5", ["7"]), ("6", ["8"])]:
+        assert persister.clear(acked).is_ok()
+        assert reuploads.process_ack_for_reupload(acked) == expected
+    assert persister.num_iter_pending == 2
+
+    # the excluded event is skipped, which ends the reupload
+    for acked in ["7", "8"]:
+        assert persister.clear(acked).is_ok()
+        assert reuploads.process_ack_for_reupload(acked) == []
+    assert not reuploads.reuploading()
+    assert reuploads.extend_reupload() == []
+    assert not reuploads.reuploading()
+
+
+def test_reupload_window() -> None:
+    fixed = ReuploadWindow(5)
+    assert not fixed.adaptive
+    fixed.process_ack(1.0)
+    fixed.process_timeout()
+    assert fixed.size == 5
+
+    window = ReuploadWindow(5, min_size=2, max_size=40)
+    assert window.adaptive
+    # timely acks grow the window by one each
+    for _ in range(10):
+        window.process_ack(0.1)
+    assert window.size == 15
+    assert window.min_rtt == 0.1
+    # slow round trips halve it, once per window of acks
+    window.process_ack(1.0)
+    assert window.size == 16
+    window.process_ack(1.0)
+    assert window.size == 8
+    window.process_ack(1.0)
+    assert window.size == 8
+    assert window.num_decreases == 1
+    # timeouts halve it, down to min_size
+    window.process_timeout()
+    assert window.size == 4
+    window.process_timeout()
+    window.process_timeout()
+    assert window.size == 2
+
+    # after congestion, growth is about one per window of acks
+    window = ReuploadWindow(4, max_size=40)
+    window.process_timeout()
+    assert window.size == 2
+    for _ in range(3):
+        window.process_ack(0.1)
+    assert window.size == 3
+    # and it never exceeds max_size
+    for _ in range(2000):
+        window.process_ack(0.1)
+    assert window.size == 40
+
+
+@pytest.mark.asyncio
+async def test_reupload_window_growth(request: pytest.FixtureRequest) -> None:
+    """
+    Test:
+        an adaptive reupload window grows beyond its initial size
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.child import DummyChildSettings
+
+    async with LiveTest(
+        start_child=True,
+        add_parent=True,
+        child_app_settings=DummyChildSettings(
+            proactor=ProactorSettings(
+                num_initial_event_reuploads=2, reupload_window_max=20
+            )
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        upstream_link = h.child.links.link(child.upstream_client)
+        reupload_counts = h.child.stats.link(child.upstream_client).reupload_counts
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for child to connect to mqtt",
+        )
+        events_to_generate = 100
+        for i in range(events_to_generate):
+            child.generate_event(
+                DBGEvent(
+                    Command=DBGPayload(),
+                    Msg=f"event {i + 1} / {events_to_generate}",
+                )
+            )
+        h.start_parent()
+        await h.await_for(
+            lambda: upstream_link.active(),
+            "ERROR waiting for parent",
+        )
+        max_unacked = 0
+
+        def reupload_complete() -> bool:
+            nonlocal max_unacked
+            max_unacked = max(max_unacked, child.links.num_reuploaded_unacked)
+            return (
+                reupload_counts.completed > 0
+                and child.links.num_pending == 0
+                and child.links.num_in_flight == 0
+            )
+
+        await h.await_for(reupload_complete, "ERROR waiting for reupload to complete")
+        assert max_unacked > 2
+        assert child.links.reupload_window.size > 2
+
+
+def test_event_batch_builder() -> None:
+    builder = EventBatchBuilder(max_events=3, max_bytes=20)
+    assert builder.take() is None
+    assert builder.fits(b"x" * 100)
+    builder.add("a", b'{"a":1}')
+    builder.add("b", b'{"b":2}')
+    assert not builder.full
+    assert not builder.fits(b'{"c":"long"}')
+    batch = builder.take()
+    assert batch is not None
+    event_ids, payload_json = batch
+    assert event_ids == ["a", "b"]
+    assert EventBatch.model_validate_json(payload_json) == EventBatch(
+        Events=[{"a": 1}, {"b": 2}]
+    )
+    assert len(builder) == 0
+    assert builder.num_bytes == 0
+    for event_id in "abc":
+        builder.add(event_id, b"{}")
+    assert builder.full
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("persist_wire_messages", [False, True])
+async def test_reupload_event_batches(
+    request: pytest.FixtureRequest, persist_wire_messages: bool
+) -> None:
+    """
+    Test:
+        reuploaded events are sent in batches, each answered by one BatchAck
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.child import DummyChildSettings
+
+    async with LiveTest(
+        start_child=True,
+        add_parent=True,
+        child_app_settings=DummyChildSettings(
+            proactor=ProactorSettings(
+                num_initial_event_reuploads=20,
+                event_batch_max_events=10,
+                persist_wire_messages=persist_wire_messages,
+            )
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        upstream_link = h.child.links.link(child.upstream_client)
+        child_stats = h.child.stats.link(child.upstream_client)
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for child to connect to mqtt",
+        )
+        events_to_generate = 37
+        for i in range(events_to_generate):
+            child.generate_event(
+                DBGEvent(
+                    Command=DBGPayload(),
+                    Msg=f"event {i + 1} / {events_to_generate}",
+                )
+            )
+        num_events = child.links.num_pending
+        h.start_parent()
+        await h.await_for(
+            lambda: upstream_link.active(),
+            "ERROR waiting for parent",
+        )
+        await h.await_for(
+            lambda: child_stats.reupload_counts.completed > 0
+            and child.links.num_pending == 0
+            and child.links.num_in_flight == 0,
+            "ERROR waiting for reupload to complete",
+        )
+        num_batch_acks = child_stats.num_received_by_type[
+            BatchAck.model_fields["TypeName"].default
+        ]
+        assert num_events / 10 <= num_batch_acks < num_events
+        assert child.event_persister.num_clears == child.event_persister.num_persists
+        await h.await_for(
+            lambda: h.parent.event_persister.num_persists >= num_events,
+            "ERROR waiting for parent to persist reuploaded events",
+        )
+
+        # a BatchAck only clears events which were in its batch
+        assert child.event_persister.persist("stray", b"{}").is_ok()
+        child.links._event_batches["batch"] = []  # noqa: SLF001
+        child.links.ack_manager.start_ack_timer(child.upstream_client, "batch")
+        child.links.process_batch_ack(
+            child.upstream_client, BatchAck(AckMessageID="batch", EventIDs=["stray"])
+        )
+        assert "stray" in child.event_persister
+
+
 @pytest.mark.asyncio
 async def test_reupload_flow_control_detail(request: pytest.FixtureRequest) -> None:
     """
@@ -583,3 +1040,45 @@ async def test_reupload_errors(request: pytest.FixtureRequest) -> None:
             exp_child_persists=63,
             exp_parent_pending=64,
         )
+
+
+@pytest.mark.asyncio
+async def test_reupload_expired(request: pytest.FixtureRequest) -> None:
+    """Verify that events older than the persister's retention are dropped,
+    not uploaded, during re-upload.
+    """
+    async with LiveTest(
+        start_child=True,
+        add_parent=True,
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        reupload_counts = h.child.stats.link(child.upstream_client).reupload_counts
+        persister = child.event_persister
+        assert isinstance(persister, TimedRollingFilePersister)
+        # DBGEvents expire immediately; other events are kept.
+        persister.retention_seconds_by_type[
+            DBGEvent.model_fields["TypeName"].default
+        ] = 0
+
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for child to connect to mqtt",
+        )
+        num_kept = child.links.num_pending
+        generator = _EventGen(child)
+        generator.generate(num_ok=10)
+        assert child.links.num_pending == num_kept + 10
+        assert all(persister.expired(entry.uid) for entry in generator.ok)
+
+        h.start_parent()
+        await h.await_for(
+            lambda: reupload_counts.completed > 0
+            and child.links.num_pending == 0
+            and child.links.num_in_flight == 0,
+            "ERROR waiting for re-upload to complete",
+        )
+        assert reupload_counts.expired == 10
+        # Expired events were never read.
+        assert persister.num_retrieves <= num_kept
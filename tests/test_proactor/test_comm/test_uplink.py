@@ -0,0 +1,229 @@
+# ruff: noqa: PLR2004
+from typing import Any, Callable
+
+import pytest
+from freezegun import freeze_time
+from paho.mqtt.client import MQTTMessageInfo
+
+from gwproactor.links import (
+    TimerManagerInterface,
+    TokenBucket,
+    UplinkPriority,
+    UplinkScheduler,
+)
+from gwproactor.message import DBGEvent, DBGPayload
+from gwproactor_test.live_test_helper import LiveTest
+
+
+class _Timers(TimerManagerInterface):
+    def __init__(self) -> None:
+        self.timers: list[tuple[float, Callable[[], None]]] = []
+
+    def start_timer(self, delay_seconds: float, callback: Callable[[], None]) -> Any:
+        self.timers.append((delay_seconds, callback))
+        return len(self.timers) - 1
+
+    def cancel_timer(self, timer_handle: Any) -> None:
+        self.timers.pop(timer_handle)
+
+    def fire(self) -> float:
+        delay, callback = self.timers.pop(0)
+        callback()
+        return delay
+
+
+def test_token_bucket() -> None:
+    unlimited = TokenBucket(0)
+    assert unlimited.seconds_until(1_000_000, 0) == 0
+
+    bucket = TokenBucket(100, burst_seconds=2)
+    now = 0.0
+    bucket._refilled_at = now  # noqa: SLF001
+    assert bucket.capacity == 200
+    assert bucket.seconds_until(200, now) == 0
+    bucket.take(150, now)
+    assert bucket.seconds_until(100, now) == 0.5
+    # more than capacity waits for a full bucket, then goes into debt
+    assert bucket.seconds_until(1000, now) == 1.5
+    now += 1.5
+    bucket.take(1000, now)
+    assert bucket.tokens == -800
+    assert bucket.seconds_until(100, now) == 9
+
+
+def test_uplink_scheduler() -> None:
+    timers = _Timers()
+    sent: list[str] = []
+
+    def send(name: str) -> Callable[[], MQTTMessageInfo]:
+        def _send() -> MQTTMessageInfo:
+            sent.append(name)
+            return MQTTMessageInfo(len(sent))
+
+        return _send
+
+    with freeze_time("2025-01-01 00:00:00") as frozen:
+        scheduler = UplinkScheduler(timers, messages_per_second=2, burst_seconds=1)
+        # the burst is sent at once
+        assert scheduler.publish(UplinkPriority.reupload, 10, send("r1")).mid == 1
+        assert scheduler.publish(UplinkPriority.live, 10, send("l1")).mid == 2
+        assert not timers.timers
+        # then messages are queued by priority
+        for name, priority in [
+            ("b1", UplinkPriority.bulk),
+            ("r2", UplinkPriority.reupload),
+            ("r3", UplinkPriority.reupload),
+            ("l2", UplinkPriority.live),
+        ]:
+            assert scheduler.publish(priority, 10, send(name), name).mid == -1
+        assert scheduler.queued("l2")
+        assert not scheduler.queued("l1")
+        assert scheduler.queue_depth == 4
+        assert scheduler.queue_depths() == {
+            UplinkPriority.control: 0,
+            UplinkPriority.live: 1,
+            UplinkPriority.reupload: 2,
+            UplinkPriority.bulk: 1,
+        }
+        assert len(timers.timers) == 1
+        # control messages are never delayed
+        assert scheduler.publish(UplinkPriority.control, 10, send("c1")).mid == 3
+        assert sent == ["r1", "l1", "c1"]
+
+        # queues drain highest priority first, as the budget refills
+        assert timers.timers[0][0] == 0.5
+        while timers.timers:
+            frozen.tick(timers.timers[0][0])
+            timers.fire()
+        assert sent == ["r1", "l1", "c1", "l2", "r2", "r3", "b1"]
+        assert scheduler.queue_depth == 0
+        assert not scheduler.queued("l2")
+        assert scheduler.counts.max_queue_depth == 4
+        assert scheduler.counts.num_delayed["reupload"] == 2
+        assert scheduler.counts.num_sent["control"] == 1
+        assert "Uplink queue depth" in str(scheduler.counts)
+
+        # clear() drops everything queued
+        assert scheduler.publish(UplinkPriority.live, 10, send("l3")).mid == -1
+        assert scheduler.publish(UplinkPriority.bulk, 10, send("b2"), "b2").mid == -1
+        assert scheduler.queued("b2")
+        assert len(timers.timers) == 1
+        scheduler.clear()
+        assert scheduler.queue_depth == 0
+        assert not scheduler.queued("b2")
+        assert not timers.timers
+        frozen.tick(1)
+        assert scheduler.publish(UplinkPriority.bulk, 10, send("b3")).mid > 0
+        assert "l3" not in sent
+
+
+@pytest.mark.asyncio
+async def test_uplink_rate_limited_reupload(request: pytest.FixtureRequest) -> None:
+    """
+    Test:
+        with a limited uplink, a reupload completes, queueing events by
+        priority
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.child import DummyChildSettings
+
+    async with LiveTest(
+        start_child=True,
+        add_parent=True,
+        child_app_settings=DummyChildSettings(
+            proactor=ProactorSettings(
+                num_initial_event_reuploads=10, uplink_messages_per_second=100
+            )
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        upstream_link = child.links.link(child.upstream_client)
+        scheduler = child.links.uplink_scheduler(child.upstream_client)
+        assert scheduler is not None
+        reupload_counts = child.stats.link(child.upstream_client).reupload_counts
+        await h.await_for(
+            lambda: child.mqtt_quiescent(),
+            "ERROR waiting for child to connect to mqtt",
+        )
+        events_to_generate = 150
+        for i in range(events_to_generate):
+            child.generate_event(
+                DBGEvent(
+                    Command=DBGPayload(),
+                    Msg=f"event {i + 1} / {events_to_generate}",
+                )
+            )
+        h.start_parent()
+        await h.await_for(
+            lambda: upstream_link.active(),
+            "ERROR waiting for parent",
+        )
+        await h.await_for(
+            lambda: reupload_counts.completed > 0
+            and child.links.num_pending == 0
+            and child.links.num_in_flight == 0,
+            "ERROR waiting for reupload to complete",
+        )
+        assert scheduler.counts.num_delayed["reupload"] > 0
+        assert scheduler.counts.max_queue_depth > 0
+        assert scheduler.queue_depth == 0
+        assert "Uplink queue depth" in str(child.stats.link(child.upstream_client))
+
+
+@pytest.mark.asyncio
+async def test_uplink_queued_event_not_reuploaded(
+    request: pytest.FixtureRequest,
+) -> None:
+    """
+    Test:
+        a persisted live event waiting in the uplink scheduler is not sent
+        again by a reupload which pulls the same id
+    """
+    from gwproactor import ProactorSettings
+    from gwproactor_test.dummies.pair.child import DummyChildSettings
+
+    async with LiveTest(
+        start_child=True,
+        add_parent=True,
+        child_app_settings=DummyChildSettings(
+            proactor=ProactorSettings(
+                num_inflight_events=0, uplink_messages_per_second=10
+            )
+        ),
+        request=request,
+    ) as h:
+        child = h.child
+        child.disable_derived_events()
+        upstream_link = child.links.link(child.upstream_client)
+        scheduler = child.links.uplink_scheduler(child.upstream_client)
+        assert scheduler is not None
+        h.start_parent()
+        await h.await_for(
+            lambda: upstream_link.active()
+            and not child.links.reuploading()
+            and child.links.num_pending == 0,
+            "ERROR waiting for initial reupload to complete",
+        )
+
+        # with the budget spent, a live event is persisted and queued
+        scheduler.messages_bucket.tokens = -10
+        event = DBGEvent(Command=DBGPayload(), Msg="queued")
+        child.generate_event(event)
+        assert event.MessageId in child.event_persister
+        assert scheduler.queued(event.MessageId)
+
+        # a reupload pulling it skips it, since the scheduler will send it
+        num_delayed = scheduler.counts.num_delayed["reupload"]
+        num_reuploaded = scheduler.counts.num_sent["reupload"]
+        child.links.extend_reupload()
+        assert not child.links.reuploading()
+        assert scheduler.counts.num_delayed["reupload"] == num_delayed
+
+        await h.await_for(
+            lambda: child.links.num_pending == 0,
+            "ERROR waiting for queued event to be acked",
+        )
+        assert not scheduler.queued(event.MessageId)
+        assert scheduler.counts.num_sent["reupload"] == num_reuploaded
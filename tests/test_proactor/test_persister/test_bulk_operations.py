@@ -0,0 +1,271 @@
+# ruff: noqa: PLR2004
+# mypy: disable-error-code="union-attr"
+import os
+from pathlib import Path
+from typing import Callable, Optional
+
+import pytest
+from result import Err, Ok, Result
+
+from gwproactor import AppSettings
+from gwproactor.persister import (
+    CompressingPersister,
+    ContentTooLarge,
+    Durability,
+    FileMissing,
+    PersisterInterface,
+    SegmentLogPersister,
+    SQLitePersister,
+    StubPersister,
+    ThreadedPersister,
+    TieredPersister,
+    TimedRollingFilePersister,
+    UIDMissingWarning,
+)
+from gwproactor.persister.interface import iter_pending_pages
+from gwproactor.problems import Problems
+
+PersisterFactory = Callable[[Path, int], PersisterInterface]
+
+FACTORIES: dict[str, PersisterFactory] = {
+    "rolling": lambda d, max_bytes: TimedRollingFilePersister(
+        d, max_bytes, durability=Durability.fsync
+    ),
+    "segment_log": lambda d, max_bytes: SegmentLogPersister(
+        d, max_bytes, segment_bytes=64, durability=Durability.fsync
+    ),
+    "sqlite": lambda d, max_bytes: SQLitePersister(d, max_bytes),
+    "compressing": lambda d, max_bytes: CompressingPersister(
+        SQLitePersister(d, max_bytes)
+    ),
+}
+
+
+@pytest.mark.parametrize("name", FACTORIES)
+def test_persister_bulk_operations(name: str) -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir) / name
+    event_dir.mkdir()
+    p = FACTORIES[name](event_dir, 1000)
+    assert p.reindex().is_ok()
+
+    events = [(str(i), f'{{"i": {i}}}'.encode()) for i in range(10)]
+    assert p.persist_many(events).is_ok()
+    assert p.pending_ids() == [uid for uid, _ in events]
+    assert p.num_persists == 10
+
+    results = p.retrieve_many(["3", "missing", "0", "9"])
+    assert list(results) == ["3", "missing", "0", "9"]
+    assert results["3"].unwrap() == b'{"i": 3}'
+    assert results["missing"].unwrap() is None
+    assert results["0"].unwrap() == b'{"i": 0}'
+    assert results["9"].unwrap() == b'{"i": 9}'
+    assert p.num_retrieves == 4
+
+    problems = p.clear_many(["1", "2", "missing", "8"]).unwrap_err()
+    assert len(problems.warnings) == 1
+    assert isinstance(problems.warnings[0], UIDMissingWarning)
+    assert not problems.errors
+    assert p.pending_ids() == ["0", "3", "4", "5", "6", "7", "9"]
+    assert p.num_clears == 4
+
+    # one event too large, others persisted and older events trimmed.
+    problems = p.persist_many(
+        [("a", b"x" * 400), ("big", os.urandom(1001))]
+    ).unwrap_err()
+    assert isinstance(problems.errors[0], ContentTooLarge)
+    assert "a" in p
+    assert "big" not in p
+    assert p.curr_bytes <= 1000
+    assert p.persist_many([("b", os.urandom(480)), ("c", os.urandom(480))]).is_ok()
+    assert p.pending_ids()[-2:] == ["b", "c"]
+    assert "0" not in p
+    assert p.curr_bytes <= 1000
+
+    assert p.clear_many(p.pending_ids()).is_ok()
+    assert p.num_pending == 0
+    assert p.persist_many([]).is_ok()
+    assert p.clear_many([]).is_ok()
+    assert p.retrieve_many([]) == {}
+
+
+@pytest.mark.parametrize("name", FACTORIES)
+def test_persister_iter_pending(name: str) -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir) / name
+    event_dir.mkdir()
+    disk = FACTORIES[name](event_dir, 100_000)
+    assert disk.reindex().is_ok()
+    uids = [str(i) for i in range(600)]
+    assert disk.persist_many([(uid, b"{}") for uid in uids]).is_ok()
+    threaded = ThreadedPersister(disk)
+    assert threaded.reindex().is_ok()
+    for p in [disk, threaded, TieredPersister(disk)]:
+        assert list(p.iter_pending()) == uids
+        assert list(p.iter_pending("299")) == uids[300:]
+        assert list(p.iter_pending("599")) == []
+        # a uid which is not pending starts from the oldest
+        assert list(p.iter_pending("missing")) == uids
+
+    # events cleared and added between pages are seen
+    it = disk.iter_pending()
+    seen = [next(it) for _ in range(10)]
+    assert disk.clear_many(uids[:10] + uids[500:]).is_ok()
+    assert disk.persist("new", b"{}").is_ok()
+    seen.extend(it)
+    assert seen == uids[:500] + ["new"]
+
+    # buffered events follow spilled events
+    tiered = TieredPersister(disk)
+    assert tiered.persist("buffered", b"{}").is_ok()
+    assert list(tiered.iter_pending("new")) == ["buffered"]
+    assert list(tiered.iter_pending("buffered")) == []
+
+
+@pytest.mark.parametrize("name", FACTORIES)
+def test_persister_retrieve_many_later(name: str) -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir) / name
+    event_dir.mkdir()
+    disk = FACTORIES[name](event_dir, 100_000)
+    assert disk.reindex().is_ok()
+    assert disk.persist_many([("a", b"a"), ("b", b"b")]).is_ok()
+    threaded = ThreadedPersister(disk)
+    assert threaded.reindex().is_ok()
+    tiered = TieredPersister(threaded)
+    assert tiered.persist("c", b"c").is_ok()
+    uids = ["c", "missing", "b", "a"]
+    for p in [disk, threaded, tiered]:
+        expected = p.retrieve_many(uids)
+        assert p.retrieve_many_later(uids).result(timeout=5) == expected
+    # unwritten content and the order of queued operations are respected
+    assert threaded.persist("d", b"d").is_ok()
+    assert threaded.clear("a").is_ok()
+    assert threaded.retrieve_many_later(["a", "d"]).result(timeout=5) == {
+        "a": threaded.retrieve("a"),
+        "d": threaded.retrieve("d"),
+    }
+    assert threaded.retrieve("a").unwrap() is None
+
+
+@pytest.mark.parametrize("name", FACTORIES)
+def test_persister_take_dropped(name: str) -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir) / name
+    event_dir.mkdir()
+    p = FACTORIES[name](event_dir, 200)
+    assert p.reindex().is_ok()
+    assert p.persist_many([(str(i), os.urandom(30)) for i in range(3)]).is_ok()
+    # drops are recorded from the first call
+    assert p.take_dropped() == []
+    assert p.persist("3", os.urandom(30)).is_ok()
+    assert p.clear("3").is_ok()
+    assert p.persist("4", os.urandom(120)).is_ok()
+    dropped = p.take_dropped()
+    assert dropped
+    assert "3" not in dropped
+    assert not any(uid in p for uid in dropped)
+    assert sorted(dropped + p.pending_ids()) == ["0", "1", "2", "4"]
+    assert p.take_dropped() == []
+
+
+def test_iter_pending_pages() -> None:
+    pending = dict.fromkeys("abcdefg")
+    assert list(iter_pending_pages(pending, page_size=3)) == list("abcdefg")
+    assert list(iter_pending_pages(pending, "c", page_size=3)) == list("defg")
+    assert list(iter_pending_pages({}, page_size=3)) == []
+    pages = iter_pending_pages(pending, page_size=3)
+    assert [next(pages) for _ in range(3)] == list("abc")
+    # the last uid of a page was removed, so the next page restarts
+    del pending["c"]
+    assert list(pages) == list("abdefg")
+
+
+class _BasicPersister(PersisterInterface):
+    """Implements only the methods a PersisterInterface has always had to."""
+
+    def __init__(self) -> None:
+        self.events: dict[str, bytes] = {}
+
+    def persist(self, uid: str, content: bytes) -> Result[bool, Problems]:
+        self.events[uid] = content
+        return Ok()
+
+    def clear(self, uid: str) -> Result[bool, Problems]:
+        if self.events.pop(uid, None) is None:
+            return Err(Problems(errors=[UIDMissingWarning(uid=uid)]))
+        return Ok()
+
+    def pending_ids(self) -> list[str]:
+        return list(self.events)
+
+    @property
+    def num_pending(self) -> int:
+        return len(self.events)
+
+    @property
+    def curr_bytes(self) -> int:
+        return sum(len(content) for content in self.events.values())
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self.events
+
+    def retrieve(self, uid: str) -> Result[Optional[bytes], Problems]:
+        return Ok(self.events.get(uid))
+
+    def reindex(self) -> Result[Optional[bool], Problems]:
+        return Ok()
+
+    @property
+    def num_persists(self) -> int:
+        return 0
+
+    @property
+    def num_retrieves(self) -> int:
+        return 0
+
+    @property
+    def num_clears(self) -> int:
+        return 0
+
+
+def test_persister_bulk_fallbacks() -> None:
+    p: PersisterInterface = StubPersister()
+    assert p.persist_many([("a", b"{}"), ("b", b"{}")]).is_ok()
+    assert p.num_persists == 2
+    assert p.retrieve_many(["a", "b"]) == {"a": p.retrieve("a"), "b": p.retrieve("b")}
+    assert p.clear_many(["a", "b"]).is_ok()
+    assert p.num_clears == 2
+
+    # a persister written before the bulk operations gets working defaults
+    p = _BasicPersister()
+    assert p.persist_many([("a", b"1"), ("b", b"2"), ("c", b"3")]).is_ok()
+    assert list(p.iter_pending()) == ["a", "b", "c"]
+    assert list(p.iter_pending("a")) == ["b", "c"]
+    assert list(p.iter_pending("missing")) == ["a", "b", "c"]
+    assert p.retrieve_many(["c", "a"]) == {"c": Ok(b"3"), "a": Ok(b"1")}
+    assert p.retrieve_many_later(["b"]).result() == {"b": Ok(b"2")}
+    assert p.clear_many(["a", "missing"]).is_err()
+    assert p.pending_ids() == ["b", "c"]
+    assert p.flush().is_ok()
+    assert not p.reindexing
+    assert p.take_reindex_problems() is None
+
+
+def test_rolling_file_persister_bulk() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    p = TimedRollingFilePersister(settings.paths.event_dir, durability=Durability.fsync)
+    assert p.reindex().is_ok()
+    assert p.persist_many([(str(i), b"{}") for i in range(5)]).is_ok()
+    # one commit: five files and one day directory.
+    assert p.fsync_stats.num_commits == 1
+    assert p.fsync_stats.num_fsyncs == 6
+    p.get_path("2").unlink()
+    results = p.retrieve_many(["1", "2"])
+    assert results["1"].unwrap() == b"{}"
+    assert isinstance(results["2"].unwrap_err().errors[0], FileMissing)
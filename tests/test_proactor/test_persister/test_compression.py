@@ -0,0 +1,209 @@
+# ruff: noqa: PLR2004
+# mypy: disable-error-code="union-attr"
+import threading
+from typing import Optional, Sequence
+
+import gwproto.messages
+import pytest
+from gwproto.messages import ProblemEvent, StartupEvent
+from result import Result
+
+from gwproactor import AppSettings
+from gwproactor.persister import (
+    Codec,
+    CompressingPersister,
+    DecompressionError,
+    ThreadedPersister,
+    TimedRollingFilePersister,
+    train_zstd_dictionary,
+)
+from gwproactor.persister.compression import RECORD_MARKER
+from gwproactor.problems import Problems
+
+
+class BlockedReader(TimedRollingFilePersister):
+    """Blocks retrieves until released, simulating a stalled disk."""
+
+    release: threading.Event
+
+    def __init__(self, base_dir: str) -> None:
+        super().__init__(base_dir)
+        self.release = threading.Event()
+
+    def retrieve_many(
+        self, uids: Sequence[str]
+    ) -> dict[str, Result[Optional[bytes], Problems]]:
+        self.release.wait(5)
+        return super().retrieve_many(uids)
+
+
+def _event_bytes(i: int) -> bytes:
+    return (
+        ProblemEvent(
+            Src=f"s.{i % 7}",
+            ProblemType=gwproto.messages.Problems.error,
+            Summary=f"Problem number {i}",
+            Details="Traceback (most recent call last):\n" * (i % 5 + 1),
+        )
+        .model_dump_json()
+        .encode()
+    )
+
+
+def test_compressing_persister() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    inner = TimedRollingFilePersister(settings.paths.event_dir)
+    p = CompressingPersister(inner)
+    assert p.codec == Codec.zlib
+    assert p.reindex().is_ok()
+
+    # uncompressed events persisted before compression was enabled
+    legacy = _event_bytes(0)
+    assert inner.persist("legacy", legacy).is_ok()
+    assert p.retrieve("legacy").unwrap() == legacy
+
+    # compressed
+    contents = {str(i): _event_bytes(i) for i in range(1, 10)}
+    for uid, content in contents.items():
+        assert p.persist(uid, content).is_ok()
+    for uid, content in contents.items():
+        assert p.retrieve(uid).unwrap() == content
+        assert inner.retrieve(uid).unwrap().startswith(RECORD_MARKER)
+    assert p.compression_stats.num_compressed == 9
+    # each header also carries the event's TypeName
+    assert p.compression_stats.ratio > 1.3
+    assert inner.curr_bytes < len(legacy) + sum(len(c) for c in contents.values())
+    assert p.pending_ids() == ["legacy", *contents]
+    assert p.num_pending == inner.num_pending
+    assert p.curr_bytes == inner.curr_bytes
+    assert "1" in p
+    assert p.num_persists == inner.num_persists
+    assert str(p.compression_stats)
+
+    # small content is stored with a header but not compressed
+    assert p.persist("small", b"{}").is_ok()
+    assert (
+        inner.retrieve("small").unwrap() == RECORD_MARKER + bytes([Codec.none]) + b"{}"
+    )
+    assert p.retrieve("small").unwrap() == b"{}"
+    assert p.compression_stats.num_uncompressed == 1
+
+    # missing
+    assert p.retrieve("missing").unwrap() is None
+
+    # corrupt
+    assert inner.persist("corrupt", RECORD_MARKER + bytes([Codec.zlib]) + b"xx").is_ok()
+    problems = p.retrieve("corrupt").unwrap_err()
+    assert isinstance(problems.errors[-1], DecompressionError)
+
+    assert p.clear("1").is_ok()
+    assert "1" not in inner
+    assert p.num_clears == inner.num_clears
+
+    # reindex, different codec
+    p = CompressingPersister(
+        TimedRollingFilePersister(settings.paths.event_dir), Codec.none
+    )
+    assert p.reindex().is_ok()
+    for uid in ["2", "legacy", "small"]:
+        assert p.retrieve(uid).unwrap() in {contents.get(uid), legacy, b"{}"}
+
+
+def test_compressing_persister_zstd() -> None:
+    pytest.importorskip("zstandard")
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    samples = [_event_bytes(i) for i in range(1000)]
+    dictionary = train_zstd_dictionary(samples, dict_size=4096)
+    p = CompressingPersister(
+        TimedRollingFilePersister(settings.paths.event_dir),
+        zstd_dictionaries=[dictionary],
+    )
+    assert p.codec == Codec.zstd_dict
+    assert p.reindex().is_ok()
+    for i in range(10):
+        assert p.persist(str(i), samples[i]).is_ok()
+    for i in range(10):
+        assert p.retrieve(str(i)).unwrap() == samples[i]
+
+    # zstd without a dictionary, reading records written with one
+    p2 = CompressingPersister(
+        TimedRollingFilePersister(settings.paths.event_dir),
+        Codec.zstd,
+        zstd_dictionaries=[dictionary],
+    )
+    assert p2.reindex().is_ok()
+    assert p2.persist("10", samples[10]).is_ok()
+    for i in range(11):
+        assert p2.retrieve(str(i)).unwrap() == samples[i]
+    assert p.compression_stats.ratio > p2.compression_stats.ratio
+
+    # records written with an unknown dictionary can not be read
+    p3 = CompressingPersister(TimedRollingFilePersister(settings.paths.event_dir))
+    assert p3.reindex().is_ok()
+    assert p3.retrieve("10").unwrap() == samples[10]
+    problems = p3.retrieve("0").unwrap_err()
+    assert isinstance(problems.errors[-1], DecompressionError)
+
+    with pytest.raises(ValueError):
+        CompressingPersister(p3, Codec.zstd_dict)
+
+
+def test_compressing_persister_retrieve_later() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    inner = BlockedReader(settings.paths.event_dir)
+    p = CompressingPersister(ThreadedPersister(inner))
+    assert p.reindex().is_ok()
+    contents = {str(i): _event_bytes(i) for i in range(3)}
+    assert p.persist_many(list(contents.items())).is_ok()
+    assert p.flush().is_ok()
+
+    # the retrieve waits on the wrapped persister's I/O thread, not here
+    future = p.retrieve_many_later(["2", "missing", "0"])
+    assert not future.done()
+    inner.release.set()
+    results = future.result(timeout=5)
+    assert list(results) == ["2", "missing", "0"]
+    assert results["2"].unwrap() == contents["2"]
+    assert results["0"].unwrap() == contents["0"]
+    assert results["missing"].unwrap() is None
+
+
+def test_compressing_persister_priority_classes() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    problem = ProblemEvent(
+        Src="x", ProblemType=gwproto.messages.Problems.error, Summary="s" * 200
+    )
+    startups = [StartupEvent(Src="x") for _ in range(4)]
+    sizer = CompressingPersister(TimedRollingFilePersister(settings.paths.event_dir))
+    records = {
+        event.MessageId: sizer.compress(event.model_dump_json().encode())
+        for event in [problem, *startups]
+    }
+    inner = TimedRollingFilePersister(
+        settings.paths.event_dir,
+        max_bytes=len(records[problem.MessageId])
+        + 2 * max(len(records[startup.MessageId]) for startup in startups),
+        priority_classes={problem.TypeName: 1},
+    )
+    p = CompressingPersister(inner)
+    assert p.reindex().is_ok()
+    for event in [problem, *startups]:
+        assert p.persist(event.MessageId, event.model_dump_json().encode()).is_ok()
+
+    # The compressed problem keeps its class, so outlives newer startups.
+    problem_path = inner.get_path(problem.MessageId)
+    assert problem_path is not None
+    assert problem_path.name.endswith(f".type[{problem.TypeName}].json")
+    assert inner.num_pending_by_priority() == {0: 2, 1: 1}
+    assert p.pending_ids() == [
+        problem.MessageId,
+        startups[2].MessageId,
+        startups[3].MessageId,
+    ]
+    assert p.retrieve(problem.MessageId).unwrap() == (
+        problem.model_dump_json().encode()
+    )
@@ -0,0 +1,128 @@
+# ruff: noqa: PLR2004
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from gwproactor import AppSettings
+from gwproactor.persister import (
+    Durability,
+    SegmentLogPersister,
+    TimedRollingFilePersister,
+    durability,
+)
+from gwproactor.persister.durability import FileSyncer
+
+
+def test_file_syncer(tmp_path: Path) -> None:
+    paths = [tmp_path / f"{i}.json" for i in range(3)]
+    for path in paths:
+        path.write_bytes(b"{}")
+
+    # none
+    syncer = FileSyncer()
+    syncer.written(paths[0])
+    assert syncer.stats.num_commits == 0
+
+    # fsync
+    syncer = FileSyncer(Durability.fsync)
+    syncer.written(paths[0])
+    assert syncer.stats.num_commits == 1
+    assert syncer.stats.num_writes == 1
+    assert syncer.stats.num_fsyncs == 2
+    with paths[1].open("ab") as f:
+        syncer.written(paths[1], f.fileno(), new_file=False)
+    assert syncer.stats.num_commits == 2
+    assert syncer.stats.num_fsyncs == 3
+    assert syncer.stats.max_seconds >= syncer.stats.mean_seconds > 0
+    assert str(syncer.stats)
+
+    # group commit, one writer: synced before returning, without delay
+    syncer = FileSyncer(Durability.group_commit, group_commit_seconds=60)
+    syncer.written_many(paths[:2])
+    assert syncer.stats.num_commits == 1
+    assert syncer.stats.num_writes == 2
+    assert syncer.stats.num_fsyncs == 3  # 2 files + 1 directory
+    assert syncer.stats.num_errors == 0
+
+
+def test_group_commit_concurrent(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    paths = [tmp_path / f"{i}.json" for i in range(3)]
+    for path in paths:
+        path.write_bytes(b"{}")
+    first_fsync = threading.Event()
+    release = threading.Event()
+    fsynced: list[Path] = []
+
+    def slow_fsync_path(path: Path) -> None:
+        if not fsynced:
+            first_fsync.set()
+            release.wait(5)
+        fsynced.append(path)
+
+    monkeypatch.setattr(durability, "fsync_path", slow_fsync_path)
+    syncer = FileSyncer(Durability.group_commit, group_commit_seconds=0.01)
+    threads = [threading.Thread(target=syncer.written, args=(path,)) for path in paths]
+    threads[0].start()
+    assert first_fsync.wait(5)
+    # writes made while a commit runs share the next commit
+    threads[1].start()
+    threads[2].start()
+    time.sleep(0.05)
+    assert syncer.stats.num_commits == 0
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert syncer.stats.num_commits == 2
+    assert syncer.stats.num_writes == 3
+    assert syncer.stats.num_fsyncs == 5  # (1 + 1 directory) + (2 + 1 directory)
+
+    # fsync errors reach every writer in the commit
+    def failing_fsync_path(path: Path) -> None:
+        raise OSError(f"fsync failed: {path}")
+
+    monkeypatch.setattr(durability, "fsync_path", failing_fsync_path)
+    with pytest.raises(OSError, match="fsync failed"):
+        syncer.written(paths[0])
+    assert syncer.stats.num_errors == 2
+
+
+def test_persister_durability() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    rolling_dir = Path(settings.paths.event_dir) / "rolling"
+    rolling_dir.mkdir()
+    p = TimedRollingFilePersister(rolling_dir, durability=Durability.fsync)
+    assert p.reindex().is_ok()
+    assert p.durability == Durability.fsync
+    assert p.persist("a", b"{}").is_ok()
+    assert p.fsync_stats.num_commits == 1
+    assert p.flush().is_ok()
+
+    p = TimedRollingFilePersister(
+        rolling_dir,
+        durability=Durability.group_commit,
+        group_commit_seconds=60,
+    )
+    assert p.reindex().is_ok()
+    for uid in ["b", "c"]:
+        assert p.persist(uid, b"{}").is_ok()
+    assert p.fsync_stats.num_commits == 2
+    assert p.persist_many([("d", b"{}"), ("e", b"{}")]).is_ok()
+    assert p.fsync_stats.num_commits == 3
+    assert p.fsync_stats.num_writes == 4
+    assert p.flush().is_ok()
+
+    s = SegmentLogPersister(
+        Path(settings.paths.event_dir) / "log", durability=Durability.fsync
+    )
+    assert s.reindex().is_ok()
+    assert s.persist("a", b"{}").is_ok()
+    assert s.persist("b", b"{}").is_ok()
+    assert s.fsync_stats.num_commits == 2
+    # only the first record of a segment fsyncs the directory
+    assert s.fsync_stats.num_fsyncs == 3
+    assert s.flush().is_ok()
@@ -0,0 +1,89 @@
+# ruff: noqa: PLR2004
+from pathlib import Path
+
+from gwproactor import AppSettings
+from gwproactor.persister import (
+    CompressingPersister,
+    LatencyHistogram,
+    SegmentLogPersister,
+    SQLitePersister,
+    ThreadedPersister,
+    TieredPersister,
+    TimedRollingFilePersister,
+)
+from gwproactor.stats import ProactorStats
+
+
+def test_latency_histogram() -> None:
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) == 0.0
+    assert histogram.mean_seconds == 0.0
+    assert LatencyHistogram.bucket_index(0) == 0
+    assert LatencyHistogram.bucket_index(0.000_001) == 1
+    assert LatencyHistogram.bucket_index(0.000_003) == 2
+    assert LatencyHistogram.bucket_index(1e9) == len(histogram.buckets) - 1
+    for _ in range(98):
+        histogram.add(0.000_100)
+    histogram.add(0.010)
+    histogram.add(0.500)
+    assert histogram.count == 100
+    assert histogram.max_seconds == 0.500
+    # percentiles are upper bounds, within a factor of two
+    assert 0.000_100 <= histogram.percentile(50) < 0.000_200
+    assert 0.010 <= histogram.percentile(99) < 0.020
+    assert histogram.percentile(100) == 0.500
+    histogram.clear()
+    assert histogram == LatencyHistogram()
+
+
+def test_persister_metrics() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir)
+    (event_dir / "rolling").mkdir()
+    for persister in [
+        TimedRollingFilePersister(event_dir / "rolling", max_bytes=100),
+        SegmentLogPersister(event_dir / "segments", max_bytes=200),
+        SQLitePersister(event_dir / "events.db", max_bytes=100),
+    ]:
+        metrics = persister.metrics
+        assert persister.reindex().is_ok()
+        assert metrics.reindex.latency.count == 1
+        assert persister.persist("a", b"a" * 10).is_ok()
+        assert persister.persist_many([("b", b"b" * 20), ("c", b"c" * 30)]).is_ok()
+        assert metrics.persist.latency.count == 2
+        assert metrics.persist.num_items == 3
+        assert metrics.persist.num_bytes == 60
+        assert persister.retrieve("a").unwrap() == b"a" * 10
+        persister.retrieve_many(["b", "c"])
+        assert metrics.retrieve.latency.count == 2
+        assert metrics.retrieve.num_items == 3
+        assert metrics.retrieve.num_bytes == 60
+        assert persister.clear("c").is_ok()
+        assert metrics.clear.latency.count == 1
+        assert metrics.clear.num_items == 1
+
+        # filling storage trims
+        assert metrics.trim.latency.count == 0
+        for i in range(10):
+            persister.persist(str(i), b"x" * 30)
+        assert metrics.trim.latency.count > 0
+        assert metrics.trim.num_items > 0
+        assert metrics.trim.num_bytes > 0
+        # trimmed events are not recorded as clears
+        assert metrics.clear.latency.count == 1
+
+        assert "persist" in str(metrics)
+        metrics.reset()
+        assert metrics.persist.latency.count == 0
+        assert metrics.persist.num_bytes == 0
+
+    # wrappers report the metrics of the wrapped persister
+    disk = TimedRollingFilePersister(event_dir / "wrapped")
+    assert CompressingPersister(disk).metrics is disk.metrics
+    assert TieredPersister(ThreadedPersister(disk)).metrics is disk.metrics
+
+    stats = ProactorStats()
+    assert "Persister operations" not in str(stats)
+    stats.persister = disk.metrics
+    assert "Persister operations" in str(stats)
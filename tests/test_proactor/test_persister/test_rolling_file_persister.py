@@ -4,26 +4,32 @@
 import datetime
 import json
 import shutil
+import threading
 import time
 from pathlib import Path
 from typing import Any, Optional, Union
 
 import gwproto.messages
+import pytest
 from freezegun import freeze_time
-from gwproto.messages import ProblemEvent
-from result import Result
+from gwproto import Message
+from gwproto.messages import ProblemEvent, StartupEvent
 
 from gwproactor import AppSettings, ExternalWatchdogCommandBuilder, Problems
+from gwproactor.links.wire import encode_wire_message
 from gwproactor.persister import (
     FileExistedWarning,
     FileMissing,
     FileMissingWarning,
     PersisterError,
     ReindexError,
+    SizeMismatchWarning,
     TimedRollingFilePersister,
     TrimFailed,
     UIDExistedWarning,
     UIDMissingWarning,
+    WriteFailed,
+    timed_rolling_file,
 )
 from gwproactor.persister.timed_rolling_file import _PersistedItem  # noqa
 
@@ -802,6 +808,619 @@ def test_persister_indexing() -> None:
         assert p.pending_dict() == index
 
 
+def test_persister_manifest() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    buf = ("." * 100).encode()
+    d1 = _today()
+    d2 = d1 + datetime.timedelta(days=1)
+
+    def _reindexed(*, exp_loaded: bool) -> TimedRollingFilePersister:
+        p_ = TimedRollingFilePersister(settings.paths.event_dir, use_manifest=True)
+        assert p_.reindex().is_ok()
+        assert p_.manifest_loaded == exp_loaded
+        return p_
+
+    with freeze_time(d1):
+        # no manifest yet; full scan creates one
+        p = _reindexed(exp_loaded=False)
+        assert p.manifest_path.exists()
+        for i in range(4):
+            assert p.persist(str(i), buf).is_ok()
+    with freeze_time(d2):
+        for i in range(4, 8):
+            assert p.persist(str(i), buf).is_ok()
+        assert p.persist("8", buf + buf).is_ok()
+        assert p.clear("5").is_ok()
+        index = p.pending_dict()
+        curr_bytes = p.curr_bytes
+        assert curr_bytes == 7 * len(buf) + 2 * len(buf)
+
+        # load from manifest
+        p = _reindexed(exp_loaded=True)
+        assert p.pending_dict() == index
+        assert p.curr_bytes == curr_bytes
+        assert p.pending_ids() == list(index.keys())
+
+        # torn manifest falls back to a full scan, which rewrites the manifest
+        with p.manifest_path.open("a") as f:
+            f.write("+\t8\t")
+        p = _reindexed(exp_loaded=False)
+        assert p.pending_dict() == index
+        assert p.curr_bytes == curr_bytes
+        p = _reindexed(exp_loaded=True)
+
+        # a file in the newest day that the manifest does not know about
+        p7 = p.get_path("7")
+        assert p7 is not None
+        shutil.copy(p7, p7.parent / p7.name.replace("[7]", "[x]"))
+        p = _reindexed(exp_loaded=False)
+        assert p.pending_ids() == ["0", "1", "2", "3", "4", "6", "7", "8", "x"]
+        assert p.clear("x").is_ok()
+        assert p.pending_dict() == index
+        p = _reindexed(exp_loaded=True)
+
+        # a file in an older day, cleared from the manifest but left on disk
+        # by a crash before it was deleted
+        p1 = p.get_path("1")
+        assert p1 is not None
+        content = p1.read_bytes()
+        assert p.clear("1").is_ok()
+        p1.write_bytes(content)
+        p = _reindexed(exp_loaded=False)
+        assert "1" in p
+        assert p.clear("1").is_ok()
+        p = _reindexed(exp_loaded=True)
+
+        # removed day directory
+        shutil.rmtree(p.get_path("0").parent)
+        p = _reindexed(exp_loaded=False)
+        assert p.pending_ids() == ["4", "6", "7", "8"]
+
+        # compaction keeps the manifest small
+        p.MANIFEST_COMPACT_MIN_LINES = 10
+        for i in range(100, 120):
+            assert p.persist(str(i), buf).is_ok()
+            assert p.clear(str(i)).is_ok()
+        with p.manifest_path.open() as f:
+            assert len(f.readlines()) <= 11
+        index = p.pending_dict()
+        p = _reindexed(exp_loaded=True)
+        assert p.pending_dict() == index
+
+
+def test_persister_failed_write(monkeypatch: pytest.MonkeyPatch) -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    p = TimedRollingFilePersister(settings.paths.event_dir, use_manifest=True)
+    assert p.reindex().is_ok()
+    assert p.persist("a", b"a").is_ok()
+    path_open = Path.open
+
+    def _open(path: Path, mode: str = "r", *args: Any, **kwargs: Any) -> Any:
+        if mode == "wb":
+            raise OSError("disk full")
+        return path_open(path, mode, *args, **kwargs)
+
+    with monkeypatch.context() as m:
+        m.setattr(Path, "open", _open)
+        problems = p.persist("b", b"b").unwrap_err()
+    assert isinstance(problems.errors[-1], WriteFailed)
+    assert p.pending_ids() == ["a"]
+    assert p.curr_bytes == 1
+    assert p.get_path("b") is None
+
+    # the manifest still compacts and loads
+    p.MANIFEST_COMPACT_MIN_LINES = 0
+    assert p.persist("c", b"c").is_ok()
+    p = TimedRollingFilePersister(settings.paths.event_dir, use_manifest=True)
+    assert p.reindex().is_ok()
+    assert p.manifest_loaded
+    assert p.pending_ids() == ["a", "c"]
+
+
+class SteppedIndexer(TimedRollingFilePersister):
+    """Background indexer which scans one day directory per step()."""
+
+    steps: threading.Semaphore
+    scanned: threading.Semaphore
+
+    def __init__(self, base_dir: Path | str) -> None:
+        super().__init__(base_dir=base_dir, background_reindex=True)
+        self.steps = threading.Semaphore(0)
+        self.scanned = threading.Semaphore(0)
+
+    def step(self) -> None:
+        self.steps.release()
+        assert self.scanned.acquire(timeout=5)
+
+    def _scan_day_dir(
+        self, day_dir: Path, problems: Problems
+    ) -> list[tuple[_PersistedItem, int]]:
+        assert self.steps.acquire(timeout=5)
+        items = super()._scan_day_dir(day_dir, problems)
+        self.scanned.release()
+        return items
+
+
+def test_persister_background_reindex() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    buf = ("." * 100).encode()
+    days = [_today() + datetime.timedelta(days=i) for i in range(3)]
+    uids: list[list[str]] = []
+    p = TimedRollingFilePersister(settings.paths.event_dir)
+    assert p.reindex().is_ok()
+    for i, day in enumerate(days):
+        with freeze_time(day):
+            uids.append([f"{i}-{j}" for j in range(3)])
+            for uid in uids[-1]:
+                assert p.persist(uid, buf).is_ok()
+    index = p.pending_dict()
+
+    with freeze_time(days[-1]):
+        p = SteppedIndexer(settings.paths.event_dir)
+        assert p.reindex().is_ok()
+        assert not p.join_reindex(timeout=0)
+        assert p.pending_ids() == []
+
+        # events persisted during reindex stay at the end
+        assert p.persist("new", buf).is_ok()
+        p.step()
+        assert p.pending_ids() == [*uids[0], "new"]
+        assert p.retrieve(uids[0][0]).unwrap() == buf
+
+        # events cleared before they are found are deleted when found
+        assert p.clear(uids[2][1]).is_err()
+        p.step()
+        assert p.pending_ids() == [*uids[0], *uids[1], "new"]
+        assert not p.join_reindex(timeout=0)
+        p.step()
+        assert p.join_reindex(timeout=5)
+        assert p.take_reindex_problems() is None
+        assert not p.reindexing
+        exp_uids = [*uids[0], *uids[1], uids[2][0], uids[2][2], "new"]
+        assert p.pending_ids() == exp_uids
+        assert p.curr_bytes == len(exp_uids) * len(buf)
+        assert not index[uids[2][1]].exists()
+
+        p2 = TimedRollingFilePersister(settings.paths.event_dir)
+        assert p2.reindex().is_ok()
+        assert p2.pending_dict() == p.pending_dict()
+
+
+def test_persister_watermark_trim() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    buf = ("." * 100).encode()
+    days = [_today() + datetime.timedelta(days=i) for i in range(3)]
+    with freeze_time(days[0]):
+        p = TimedRollingFilePersister(
+            settings.paths.event_dir,
+            max_bytes=1000,
+            background_trim=True,
+            high_watermark=0.8,
+            low_watermark=0.5,
+        )
+        assert p.reindex().is_ok()
+        assert p.high_watermark_bytes == 800
+        assert p.low_watermark_bytes == 500
+        for j in range(3):
+            assert p.persist(f"0-{j}", buf).is_ok()
+    with freeze_time(days[1]):
+        for j in range(3):
+            assert p.persist(f"1-{j}", buf).is_ok()
+    day_dirs = sorted(p.day_bytes())
+    assert list(p.day_bytes().values()) == [300, 300]
+
+    with freeze_time(days[2]):
+        for j in range(2):
+            assert p.persist(f"2-{j}", buf).is_ok()
+        assert p.curr_bytes == 800
+        assert p.num_day_drops == 0
+        # Passing the high watermark trims in the background to the low
+        # watermark, dropping the oldest day whole.
+        assert p.persist("2-2", buf).is_ok()
+        end = time.time() + 5
+        while p.curr_bytes > p.low_watermark_bytes and time.time() < end:
+            time.sleep(0.01)
+        assert p.num_day_drops == 1
+        assert not day_dirs[0].exists()
+        assert p.pending_ids() == ["1-1", "1-2", "2-0", "2-1", "2-2"]
+        assert p.curr_bytes == 500
+        assert p.num_clears == 1
+        assert p.take_background_problems() is None
+        # the day index matches the pending index
+        assert {
+            day_dir: list(uids)
+            for day_dir, uids in p._day_uids.items()  # noqa: SLF001
+        } == {
+            day_dirs[1]: ["1-1", "1-2"],
+            p.curr_dir: ["2-0", "2-1", "2-2"],
+        }
+        assert not [
+            path
+            for path in Path(settings.paths.event_dir).iterdir()
+            if path.name.startswith(TimedRollingFilePersister.TRASH_PREFIX)
+        ]
+
+        # The current day is never dropped whole.
+        assert p.trim(0).is_ok()
+        assert p.num_pending == 0
+        assert p.day_bytes() == {}
+        assert p.num_day_drops == 2
+        assert not p._day_uids  # noqa: SLF001
+
+        p2 = TimedRollingFilePersister(settings.paths.event_dir)
+        assert p2.reindex().is_ok()
+        assert p2.num_pending == 0
+
+
+def test_persister_verify_sizes() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    p = TimedRollingFilePersister(
+        settings.paths.event_dir, verify_seconds=0.01, metadata_names=True
+    )
+    assert p.reindex().is_ok()
+    for uid in "abc":
+        assert p.persist(uid, uid.encode() * 10).is_ok()
+    a_path = p.get_path("a")
+    assert a_path is not None
+    assert a_path.name.endswith(".uid[a].size[10].json")
+
+    # re-persisting a uid removes its old file
+    problems = p.persist("a", b"A" * 20).unwrap_err()
+    assert isinstance(problems.warnings[0], UIDExistedWarning)
+    assert isinstance(problems.warnings[1], FileExistedWarning)
+    assert not a_path.exists()
+    assert p.curr_bytes == 40
+
+    # sizes in file names are used by reindex
+    p = TimedRollingFilePersister(settings.paths.event_dir)
+    assert p.reindex().is_ok()
+    assert p.pending_ids() == ["b", "c", "a"]
+    assert p.curr_bytes == 40
+
+    # clear uses the tracked size
+    p.get_path("b").write_bytes(b"b" * 5)
+    assert p.clear("b").is_ok()
+    assert p.curr_bytes == 30
+
+    # verification reconciles the index with the disk
+    p.get_path("c").write_bytes(b"c" * 15)
+    p.get_path("a").unlink()
+    problems = p.verify_sizes().unwrap_err()
+    assert not problems.errors
+    assert len(problems.warnings) == 2
+    assert isinstance(problems.warnings[0], SizeMismatchWarning)
+    assert isinstance(problems.warnings[1], FileMissingWarning)
+    assert p.pending_ids() == ["c"]
+    assert p.curr_bytes == 15
+    assert p.verify_sizes().is_ok()
+    assert p.num_verifies == 2
+
+    # periodic verification runs in the background
+    p = TimedRollingFilePersister(settings.paths.event_dir, verify_seconds=0.01)
+    assert p.reindex().is_ok()
+    assert p.curr_bytes == 10
+    time.sleep(0.02)
+    assert p.persist("d", b"d" * 10).is_ok()
+    end = time.time() + 5
+    while p.num_verifies == 0 and time.time() < end:
+        time.sleep(0.01)
+    reported = p.take_background_problems()
+    assert reported is not None
+    assert isinstance(reported.warnings[0], SizeMismatchWarning)
+    assert p.curr_bytes == 25
+
+
+def test_persister_metadata_names() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    startup = StartupEvent(Src="x")
+    content = startup.model_dump_json().encode()
+
+    # By default names keep the format older releases read.
+    p = TimedRollingFilePersister(settings.paths.event_dir)
+    assert not p.metadata_names
+    assert p.reindex().is_ok()
+    assert p.persist("a", content).is_ok()
+    a_path = p.get_path("a")
+    assert a_path is not None
+    assert TimedRollingFilePersister.FILENAME_RGX.match(a_path.name) is not None
+    assert a_path.name.endswith(".uid[a].json")
+
+    # Files written by an older release, without metadata, are read back,
+    # alongside those written with it.
+    old_path = a_path.parent / (
+        datetime.datetime.now(tz=datetime.timezone.utc).isoformat() + ".uid[old].json"
+    )
+    old_path.write_bytes(b"o" * 7)
+    p = TimedRollingFilePersister(settings.paths.event_dir, metadata_names=True)
+    assert p.reindex().is_ok()
+    assert p.persist("b", content).is_ok()
+    b_path = p.get_path("b")
+    assert b_path is not None
+    assert b_path.name.endswith(
+        f".uid[b].size[{len(content)}].type[{startup.TypeName}].json"
+    )
+    p = TimedRollingFilePersister(settings.paths.event_dir)
+    assert p.reindex().is_ok()
+    assert p.pending_ids() == ["a", "old", "b"]
+    assert p.curr_bytes == 2 * len(content) + 7
+    assert p.retrieve("old").unwrap() == b"o" * 7
+    assert p.clear("old").is_ok()
+    assert p.curr_bytes == 2 * len(content)
+
+    # Type based features need TypeNames in names, so turn them on.
+    assert TimedRollingFilePersister(
+        settings.paths.event_dir, priority_classes={}
+    ).metadata_names
+    assert TimedRollingFilePersister(
+        settings.paths.event_dir, retention_seconds_by_type={startup.TypeName: 1}
+    ).metadata_names
+    # including a retention by type added after construction
+    assert not p.metadata_names
+    p.retention_seconds_by_type[startup.TypeName] = 1
+    assert p.metadata_names
+
+
+def test_persister_priority_eviction() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    problem = ProblemEvent(
+        Src="x", ProblemType=gwproto.messages.Problems.error, Summary="s"
+    )
+    priority_classes: dict[str, int] = {problem.TypeName: 1}
+
+    def _content(event: ProblemEvent | StartupEvent) -> bytes:
+        return event.model_dump_json().encode()
+
+    startups = [StartupEvent(Src="x") for _ in range(4)]
+    startup_bytes = len(_content(startups[0]))
+    p = TimedRollingFilePersister(
+        settings.paths.event_dir,
+        max_bytes=len(_content(problem)) + 2 * startup_bytes,
+        priority_classes=priority_classes,
+    )
+    assert p.reindex().is_ok()
+    assert p.persist(problem.MessageId, _content(problem)).is_ok()
+    problem_path = p.get_path(problem.MessageId)
+    assert problem_path is not None
+    assert problem_path.name.endswith(f".type[{problem.TypeName}].json")
+    for startup in startups[:2]:
+        assert p.persist(startup.MessageId, _content(startup)).is_ok()
+    assert p.num_pending_by_priority() == {0: 2, 1: 1}
+
+    # The oldest event, a problem, outlives newer low priority events.
+    for startup in startups[2:]:
+        assert p.persist(startup.MessageId, _content(startup)).is_ok()
+    assert p.pending_ids() == [
+        problem.MessageId,
+        startups[2].MessageId,
+        startups[3].MessageId,
+    ]
+    assert p.num_pending_by_priority() == {0: 2, 1: 1}
+
+    # Classes are recovered from file names by reindex.
+    p = TimedRollingFilePersister(
+        settings.paths.event_dir, priority_classes=priority_classes
+    )
+    assert p.reindex().is_ok()
+    assert p.num_pending_by_priority() == {0: 2, 1: 1}
+    assert p.trim(p.curr_bytes - startup_bytes).is_ok()
+    assert p.pending_ids() == [problem.MessageId, startups[3].MessageId]
+
+    # Without priority classes, trimming is oldest first.
+    p = TimedRollingFilePersister(settings.paths.event_dir)
+    assert p.reindex().is_ok()
+    assert p.num_pending_by_priority() == {}
+    assert p.trim(startup_bytes).is_ok()
+    assert p.pending_ids() == [startups[3].MessageId]
+
+
+def test_persister_parallel_scan() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    buf = ("." * 100).encode()
+    days = [_today() + datetime.timedelta(days=i) for i in range(5)]
+    p = TimedRollingFilePersister(settings.paths.event_dir)
+    assert p.reindex().is_ok()
+    for i, day in enumerate(days):
+        with freeze_time(day):
+            for j in range(3):
+                assert p.persist(f"{i}-{j}", buf * (j + 1)).is_ok()
+    index = p.pending_dict()
+
+    for scan_workers in [1, 4]:
+        p = TimedRollingFilePersister(
+            settings.paths.event_dir, scan_workers=scan_workers
+        )
+        assert p.reindex().is_ok()
+        assert p.pending_dict() == index
+        assert p.pending_ids() == list(index)
+        assert p.curr_bytes == 5 * 6 * len(buf)
+        assert p.day_bytes() == dict.fromkeys(
+            sorted({path.parent for path in index.values()}), 6 * len(buf)
+        )
+
+    # problems from concurrently scanned days are reported in day order
+    class BrokenParser(TimedRollingFilePersister):
+        @classmethod
+        def _persisted_item_from_file_path(
+            cls, filepath: Path
+        ) -> Optional[_PersistedItem]:
+            if ".uid[1-1]" in filepath.name or ".uid[3-2]" in filepath.name:
+                raise ValueError(filepath.name)
+            return super()._persisted_item_from_file_path(filepath)
+
+    p = BrokenParser(settings.paths.event_dir, scan_workers=4)
+    problems = p.reindex().unwrap_err()
+    assert len(problems.errors) == 4
+    assert "[1-1]" in str(problems.errors[0])
+    assert "[3-2]" in str(problems.errors[2])
+    assert p.num_pending == 13
+
+    assert TimedRollingFilePersister._is_iso_parseable(  # noqa: SLF001
+        "2025-01-02T03:04:05.123456+00:00"
+    )
+    assert TimedRollingFilePersister._is_iso_parseable(  # noqa: SLF001
+        "2025-01-02T03:04:05-05:00"
+    )
+    assert not TimedRollingFilePersister._is_iso_parseable(  # noqa: SLF001
+        "x2025-01-02T03:04:05+00:00"
+    )
+
+
+def test_persister_parallel_scan_pat(monkeypatch: pytest.MonkeyPatch) -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    days = [_today() + datetime.timedelta(days=i) for i in range(8)]
+    p = TimedRollingFilePersister(settings.paths.event_dir)
+    assert p.reindex().is_ok()
+    for i, day in enumerate(days):
+        with freeze_time(day):
+            for j in range(20):
+                assert p.persist(f"{i}-{j}", b"{}").is_ok()
+
+    # concurrent scan workers never pat at the same time
+    patting: list[str] = []
+    max_patting = 0
+    num_pats = 0
+
+    def _run(args: list[str], **_: Any) -> None:
+        nonlocal max_patting, num_pats
+        patting.append(threading.current_thread().name)
+        max_patting = max(max_patting, len(patting))
+        num_pats += 1
+        time.sleep(0.001)
+        patting.pop()
+
+    monkeypatch.setattr(timed_rolling_file.subprocess, "run", _run)
+    p = TimedRollingFilePersister(
+        settings.paths.event_dir,
+        pat_watchdog_args=["pat"],
+        reindex_pat_seconds=0.0,
+        scan_workers=8,
+    )
+    assert p.reindex().is_ok()
+    assert p.num_pending == 8 * 20
+    assert num_pats > 0
+    assert max_patting == 1
+
+
+def test_persister_retention() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    problem = ProblemEvent(
+        Src="x", ProblemType=gwproto.messages.Problems.error, Summary="s"
+    )
+    startups = [StartupEvent(Src="x") for _ in range(4)]
+    day_seconds = 24 * 60 * 60
+    p = TimedRollingFilePersister(
+        settings.paths.event_dir,
+        retention_seconds=2 * day_seconds,
+        retention_seconds_by_type={problem.TypeName: 10 * day_seconds},
+    )
+    assert p.reindex().is_ok()
+    day0 = _day_start(_today())
+    with freeze_time(day0 + datetime.timedelta(hours=12)) as frozen:
+        assert p.persist(
+            startups[0].MessageId, startups[0].model_dump_json().encode()
+        ).is_ok()
+        assert p.persist(problem.MessageId, problem.model_dump_json().encode()).is_ok()
+        frozen.tick(datetime.timedelta(hours=1))
+        assert p.persist(
+            startups[1].MessageId, startups[1].model_dump_json().encode()
+        ).is_ok()
+        frozen.move_to(day0 + datetime.timedelta(days=1, hours=12))
+        assert p.persist(
+            startups[2].MessageId, startups[2].model_dump_json().encode()
+        ).is_ok()
+        assert not any(p.expired(uid) for uid in p.pending_ids())
+
+        # events expire by the retention of their type
+        frozen.move_to(day0 + datetime.timedelta(days=2, hours=12, minutes=30))
+        assert p.expired(startups[0].MessageId)
+        assert not p.expired(startups[1].MessageId)
+        assert not p.expired(problem.MessageId)
+        assert not p.expired("missing")
+        assert p.drop_expired().is_ok()
+        assert p.pending_ids() == [
+            problem.MessageId,
+            startups[1].MessageId,
+            startups[2].MessageId,
+        ]
+        assert p.num_expired == 1
+        assert p.num_day_drops == 0
+
+        # days older than the longest retention are dropped whole
+        frozen.move_to(day0 + datetime.timedelta(days=13))
+        assert p.persist(
+            startups[3].MessageId, startups[3].model_dump_json().encode()
+        ).is_ok()
+        assert p.expired(problem.MessageId)
+        assert p.trim(p.max_bytes).is_ok()
+        assert p.pending_ids() == [startups[3].MessageId]
+        assert p.num_expired == 4
+        assert p.num_day_drops == 2
+        assert p.day_bytes() == {p.curr_dir: p.curr_bytes}
+
+    # without retention nothing expires
+    p = TimedRollingFilePersister(settings.paths.event_dir)
+    assert p.reindex().is_ok()
+    assert p.pending_ids() == [startups[3].MessageId]
+    assert not p.expired(startups[3].MessageId)
+
+
+def test_persister_wire_message_types() -> None:
+    """Events persisted as complete upstream messages are classified by the
+    type of their payload, not by the TypeName of their Header."""
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    problem = ProblemEvent(
+        Src="x", ProblemType=gwproto.messages.Problems.error, Summary="s"
+    )
+    startups = [StartupEvent(Src="x") for _ in range(3)]
+
+    def _content(event: ProblemEvent | StartupEvent) -> bytes:
+        return encode_wire_message(
+            Message(Src="x", Payload=event).Header, event.model_dump_json().encode()
+        )
+
+    startup_bytes = len(_content(startups[0]))
+    day_seconds = 24 * 60 * 60
+    p = TimedRollingFilePersister(
+        settings.paths.event_dir,
+        max_bytes=len(_content(problem)) + 2 * startup_bytes,
+        priority_classes={problem.TypeName: 1},
+        retention_seconds=2 * day_seconds,
+        retention_seconds_by_type={problem.TypeName: 10 * day_seconds},
+    )
+    assert p.reindex().is_ok()
+    day0 = _day_start(_today())
+    with freeze_time(day0 + datetime.timedelta(hours=12)) as frozen:
+        assert p.persist(problem.MessageId, _content(problem)).is_ok()
+        problem_path = p.get_path(problem.MessageId)
+        assert problem_path is not None
+        assert problem_path.name.endswith(f".type[{problem.TypeName}].json")
+        for startup in startups:
+            assert p.persist(startup.MessageId, _content(startup)).is_ok()
+        # the oldest event, a problem, outlives a newer low priority event
+        assert p.pending_ids() == [
+            problem.MessageId,
+            startups[1].MessageId,
+            startups[2].MessageId,
+        ]
+        assert p.num_pending_by_priority() == {0: 2, 1: 1}
+
+        # and each event expires by the retention of its own type
+        frozen.move_to(day0 + datetime.timedelta(days=3))
+        assert p.expired(startups[1].MessageId)
+        assert not p.expired(problem.MessageId)
+
+
 def test_persister_problems() -> None:
     settings = AppSettings()
     settings.paths.mkdirs()
@@ -861,7 +1480,7 @@ def test_persister_problems() -> None:
 
         # _trim_old_storage, clear exception
         class BrokenRoller2(TimedRollingFilePersister):
-            def clear(self, uid: str) -> Result[bool, Problems]:  # noqa: ARG002
+            def _clear(self, uid: str, problems: Problems) -> Optional[Path]:  # noqa: ARG002
                 raise ValueError("arg")
 
         p = BrokenRoller2(settings.paths.event_dir, max_bytes=len(buf) + 50)
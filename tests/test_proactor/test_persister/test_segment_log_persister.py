@@ -0,0 +1,189 @@
+# ruff: noqa: PLR2004
+# mypy: disable-error-code="union-attr"
+
+from freezegun import freeze_time
+
+from gwproactor import AppSettings
+from gwproactor.persister import (
+    ContentTooLarge,
+    CorruptRecordWarning,
+    SegmentLogPersister,
+    UIDExistedWarning,
+    UIDMissingWarning,
+)
+from gwproactor.persister.segment_log import RECORD_HEADER
+
+
+def _content(i: int, size: int = 100) -> bytes:
+    s = f'{{"i": {i}, "x": "'
+    return (s + "x" * (size - len(s) - 2) + '"}').encode()
+
+
+def test_segment_log_persister_basic() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    p = SegmentLogPersister(settings.paths.event_dir)
+    assert p.reindex().is_ok()
+    assert p.num_pending == 0
+    assert p.curr_bytes == 0
+    assert p.num_segments == 0
+
+    # persist / retrieve
+    assert p.persist("a", _content(1)).is_ok()
+    assert "a" in p
+    assert p.num_pending == 1
+    assert p.curr_bytes == p.record_size("a", 100)
+    assert p.retrieve("a").unwrap() == _content(1)
+    assert p.retrieve("missing").unwrap() is None
+    assert p.persist("b", _content(2)).is_ok()
+    assert p.pending_ids() == ["a", "b"]
+    assert p.num_segments == 1
+
+    # persist existing uid
+    result = p.persist("a", _content(3))
+    assert result.is_err()
+    assert isinstance(result.err().warnings[0], UIDExistedWarning)
+    assert p.pending_ids() == ["b", "a"]
+    assert p.retrieve("a").unwrap() == _content(3)
+
+    # clear
+    assert p.clear("b").is_ok()
+    assert "b" not in p
+    result = p.clear("b")
+    assert result.is_err()
+    assert isinstance(result.err().warnings[0], UIDMissingWarning)
+
+    # clearing everything deletes the segment
+    assert p.clear("a").is_ok()
+    assert p.num_pending == 0
+    assert p.num_segments == 0
+    assert p.curr_bytes == 0
+    assert not list(settings.paths.event_dir.iterdir())
+    assert p.num_persists == 3
+    assert p.num_retrieves == 3
+    assert p.num_clears == 3
+
+
+def test_segment_log_persister_segments() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    record_size = SegmentLogPersister.record_size("0", 100)
+    p = SegmentLogPersister(
+        settings.paths.event_dir,
+        max_bytes=record_size * 10,
+        segment_bytes=record_size * 3,
+    )
+    assert p.reindex().is_ok()
+    for i in range(6):
+        assert p.persist(str(i), _content(i)).is_ok()
+    assert p.num_segments == 2
+    assert len(list(settings.paths.event_dir.iterdir())) == 2
+
+    # Clearing a segment that is not the oldest does not delete it.
+    for i in range(3, 6):
+        assert p.clear(str(i)).is_ok()
+    assert p.num_segments == 3  # tombstones rolled into a new segment
+
+    # Clearing the oldest segment deletes all fully cleared segments.
+    for i in range(3):
+        assert p.clear(str(i)).is_ok()
+    assert p.num_pending == 0
+    assert p.num_segments == 0
+    assert p.curr_bytes == 0
+
+    # Trimming drops whole segments, oldest first.
+    p = SegmentLogPersister(
+        settings.paths.event_dir,
+        max_bytes=record_size * 10,
+        segment_bytes=record_size * 3,
+    )
+    assert p.reindex().is_ok()
+    assert p.num_pending == 0
+    for i in range(12):
+        assert p.persist(str(i), _content(i)).is_ok()
+        assert p.curr_bytes <= p.max_bytes
+    assert p.pending_ids() == [str(i) for i in range(3, 12)]
+    assert p.retrieve("3").unwrap() == _content(3)
+
+    # A uid persisted again belongs to its newest segment, so trimming its
+    # old segment keeps it.
+    assert p.persist("4", _content(44)).is_err()
+    assert p.persist("12", _content(12)).is_ok()
+    assert p.pending_ids() == [str(i) for i in range(6, 12)] + ["4", "12"]
+    assert p.retrieve("4").unwrap() == _content(44)
+
+    # too large
+    result = p.persist("big", b"x" * (record_size * 10))
+    assert result.is_err()
+    assert isinstance(result.err().errors[0], ContentTooLarge)
+
+
+def test_segment_log_persister_reindex() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    record_size = SegmentLogPersister.record_size("0", 100)
+    p = SegmentLogPersister(settings.paths.event_dir, segment_bytes=record_size * 3)
+    assert p.reindex().is_ok()
+    for i in range(7):
+        assert p.persist(str(i), _content(i)).is_ok()
+    assert p.clear("1").is_ok()
+    assert p.clear("5").is_ok()
+    assert p.persist("2", _content(22)).is_err()
+    curr_bytes = p.curr_bytes
+
+    p2 = SegmentLogPersister(settings.paths.event_dir, segment_bytes=record_size * 3)
+    assert p2.reindex().is_ok()
+    assert p2.pending_ids() == ["0", "3", "4", "6", "2"]
+    assert p2.curr_bytes == curr_bytes
+    for uid in ["0", "3", "4", "6"]:
+        assert p2.retrieve(uid).unwrap() == _content(int(uid))
+    assert p2.retrieve("2").unwrap() == _content(22)
+
+    # Writes after reindex go to a new segment.
+    num_segments = p2.num_segments
+    assert p2.persist("7", _content(7)).is_ok()
+    assert p2.num_segments == num_segments + 1
+
+    # A torn record at the end of a segment is ignored with a warning.
+    last_path = p2.get_path("7")
+    with last_path.open("ab") as f:
+        f.write(RECORD_HEADER.pack(0xA5, 1, 1, 100, 0) + b"8" + b"{")
+    p3 = SegmentLogPersister(settings.paths.event_dir, segment_bytes=record_size * 3)
+    result = p3.reindex()
+    assert result.is_err()
+    assert len(result.err().errors) == 0
+    assert isinstance(result.err().warnings[0], CorruptRecordWarning)
+    assert p3.pending_ids() == ["0", "3", "4", "6", "2", "7"]
+    assert p3.retrieve("7").unwrap() == _content(7)
+
+
+def test_segment_log_persister_retention() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    p = SegmentLogPersister(
+        settings.paths.event_dir, segment_bytes=1, retention_seconds=60
+    )
+    assert p.reindex().is_ok()
+    with freeze_time("2025-01-01 00:00:00") as frozen:
+        assert p.persist("a", _content(1)).is_ok()
+        frozen.tick(30)
+        assert p.persist("b", _content(2)).is_ok()
+        assert p.num_segments == 2
+        assert not p.expired("a")
+        frozen.tick(31)
+        assert p.expired("a")
+        assert not p.expired("b")
+        assert not p.expired("missing")
+
+        # expired segments are dropped when the current segment rolls
+        assert p.persist("c", _content(3)).is_ok()
+        assert p.pending_ids() == ["b", "c"]
+        assert p.num_expired == 1
+        assert p.num_segments == 2
+
+        # the current segment is never dropped
+        frozen.tick(120)
+        assert p.drop_expired().is_ok()
+        assert p.pending_ids() == ["c"]
+        assert p.num_expired == 2
+        assert p.expired("c")
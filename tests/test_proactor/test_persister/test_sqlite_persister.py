@@ -0,0 +1,218 @@
+# ruff: noqa: PLR2004
+# mypy: disable-error-code="union-attr"
+import functools
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from result import Ok, Result
+
+from gwproactor import AppSettings
+from gwproactor.persister import (
+    ContentTooLarge,
+    Durability,
+    SQLitePersister,
+    UIDExistedWarning,
+    UIDMissingWarning,
+)
+from gwproactor.problems import Problems
+
+
+def test_sqlite_persister() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir)
+    p = SQLitePersister(event_dir, max_bytes=100)
+    assert p.db_path == event_dir / SQLitePersister.DB_NAME
+    assert p.reindex().is_ok()
+    assert p.num_pending == 0
+    assert p.curr_bytes == 0
+    assert p.pending_ids() == []
+
+    # persist, retrieve
+    for uid in "abc":
+        assert p.persist(uid, uid.encode() * 10).is_ok()
+    assert p.pending_ids() == ["a", "b", "c"]
+    assert p.num_pending == 3
+    assert p.curr_bytes == 30
+    assert "b" in p
+    assert "d" not in p
+    assert p.retrieve("b").unwrap() == b"b" * 10
+    assert p.retrieve("d").unwrap() is None
+    assert p.num_persists == 3
+    assert p.num_retrieves == 2
+
+    # persist existing uid moves it to the end
+    problems = p.persist("a", b"A" * 20).unwrap_err()
+    assert isinstance(problems.warnings[0], UIDExistedWarning)
+    assert p.pending_ids() == ["b", "c", "a"]
+    assert p.curr_bytes == 40
+    assert p.retrieve("a").unwrap() == b"A" * 20
+
+    # clear
+    assert p.clear("b").is_ok()
+    problems = p.clear("b").unwrap_err()
+    assert isinstance(problems.warnings[0], UIDMissingWarning)
+    assert p.pending_ids() == ["c", "a"]
+    assert p.curr_bytes == 30
+    assert p.num_clears == 2
+
+    # too large
+    problems = p.persist("big", b"x" * 101).unwrap_err()
+    assert isinstance(problems.errors[0], ContentTooLarge)
+    assert p.num_pending == 2
+
+    # trim: 30 + 75 > 100, so the oldest event ("c", 10 bytes) is dropped
+    assert p.persist("d", b"d" * 75).is_ok()
+    assert p.pending_ids() == ["a", "d"]
+    assert p.curr_bytes == 95
+    # trim everything
+    assert p.persist("e", b"e" * 100).is_ok()
+    assert p.pending_ids() == ["e"]
+    assert p.curr_bytes == 100
+
+    # reopen
+    p.close()
+    p = SQLitePersister(event_dir, max_bytes=100)
+    assert p.reindex().is_ok()
+    assert p.pending_ids() == ["e"]
+    assert p.num_pending == 1
+    assert p.curr_bytes == 100
+    assert p.retrieve("e").unwrap() == b"e" * 100
+    assert p.flush().is_ok()
+    assert not p.reindexing
+    assert p.take_reindex_problems() is None
+
+
+def _concurrently(
+    p: SQLitePersister, calls: list[Callable[[], Result[bool, Problems]]]
+) -> list[Result[bool, Problems]]:
+    """Make calls in threads, which all wait for p's lock before any of
+    them gets it."""
+    results: list[Result[bool, Problems]] = [Ok()] * len(calls)
+
+    def _call(i: int) -> None:
+        results[i] = calls[i]()
+
+    threads = [threading.Thread(target=_call, args=(i,)) for i in range(len(calls))]
+    with p._lock:  # noqa: SLF001
+        for thread in threads:
+            thread.start()
+        end = time.time() + 5
+        while p._num_writers < len(calls) and time.time() < end:  # noqa: SLF001
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(timeout=5)
+    return results
+
+
+def test_sqlite_persister_group_commit() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    db_path = Path(settings.paths.event_dir) / "group.sqlite"
+
+    # a lone writer commits at once; a bulk call commits once
+    p = SQLitePersister(
+        db_path, durability=Durability.group_commit, group_commit_seconds=60
+    )
+    assert p.reindex().is_ok()
+    assert p.persist("0", b"{}").is_ok()
+    assert p.num_uncommitted == 0
+    assert p.fsync_stats.num_commits == 1
+    assert p.persist_many([("1", b"{}"), ("2", b"{}")]).is_ok()
+    assert p.num_uncommitted == 0
+    assert p.fsync_stats.num_commits == 2
+    assert p.fsync_stats.num_writes == 3
+
+    # concurrent writers share a commit, and each returns once it is done
+    p = SQLitePersister(
+        db_path, durability=Durability.group_commit, group_commit_seconds=0.05
+    )
+    assert p.reindex().is_ok()
+    results = _concurrently(
+        p, [functools.partial(p.persist, str(i), b"{}") for i in range(3, 8)]
+    )
+    assert all(result.is_ok() for result in results)
+    assert p.num_uncommitted == 0
+    assert 1 <= p.fsync_stats.num_commits < 5
+    assert p.fsync_stats.num_writes == 5
+    reader = SQLitePersister(db_path)
+    assert reader.reindex().is_ok()
+    assert reader.num_pending == 8
+    reader.close()
+
+    # committed once every writer has joined, or batch_size operations are
+    # pending, long before group_commit_seconds
+    p = SQLitePersister(
+        db_path,
+        durability=Durability.group_commit,
+        group_commit_seconds=60,
+        batch_size=3,
+    )
+    assert p.reindex().is_ok()
+    start = time.time()
+    results = _concurrently(
+        p,
+        [
+            functools.partial(p.clear, "0"),
+            functools.partial(p.persist, "8", b"{}"),
+            functools.partial(p.clear_many, ["1", "2"]),
+        ],
+    )
+    assert all(result.is_ok() for result in results)
+    assert time.time() - start < 30
+    assert p.fsync_stats.num_commits <= 2
+    assert p.fsync_stats.num_writes == 4
+    p.close()
+
+    p = SQLitePersister(db_path, durability=Durability.fsync)
+    assert p.reindex().is_ok()
+    assert sorted(p.pending_ids()) == [str(i) for i in range(3, 9)]
+    assert p.persist("9", b"{}").is_ok()
+    assert p.fsync_stats.num_commits == 1
+
+
+def test_sqlite_persister_failed_operation(monkeypatch: pytest.MonkeyPatch) -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    db_path = Path(settings.paths.event_dir) / "failed.sqlite"
+    p = SQLitePersister(
+        db_path,
+        durability=Durability.group_commit,
+        group_commit_seconds=60,
+        batch_size=2,
+    )
+    assert p.reindex().is_ok()
+    assert p.persist_many([("0", b"{}"), ("1", b"{}")]).is_ok()
+
+    # A failure part way through persist_many undoes only that call,
+    # leaving another writer's events in the shared commit in place.
+    persist = p._persist  # noqa: SLF001
+
+    def _persist(db, uid, content, problems) -> None:  # type: ignore[no-untyped-def]  # noqa: ANN001
+        if uid == "4":
+            raise OSError("disk full")
+        persist(db, uid, content, problems)
+
+    monkeypatch.setattr(p, "_persist", _persist)
+    ok, failed = _concurrently(
+        p,
+        [
+            functools.partial(p.persist, "2", b"{}"),
+            functools.partial(p.persist_many, [("3", b"{}"), ("4", b"{}")]),
+        ],
+    )
+    assert ok.is_ok()
+    assert failed.is_err()
+    assert "disk full" in str(failed.err())
+    assert p.num_uncommitted == 0
+    assert p.num_pending == 3
+    assert p.curr_bytes == 6
+    assert p.pending_ids() == ["0", "1", "2"]
+    p.close()
+
+    p = SQLitePersister(db_path)
+    assert p.reindex().is_ok()
+    assert p.pending_ids() == ["0", "1", "2"]
@@ -0,0 +1,226 @@
+# ruff: noqa: PLR2004
+# mypy: disable-error-code="union-attr"
+import threading
+import time
+from pathlib import Path
+from typing import Any, Sequence
+
+from result import Result
+
+from gwproactor import AppSettings
+from gwproactor.persister import (
+    ContentTooLarge,
+    Durability,
+    ThreadedPersister,
+    TimedRollingFilePersister,
+    UIDMissingWarning,
+)
+from gwproactor.problems import Problems
+
+
+class BlockedPersister(TimedRollingFilePersister):
+    """Blocks writes until released, simulating a stalled disk."""
+
+    entered: threading.Event
+    release: threading.Event
+
+    def __init__(self, base_dir: Path, max_bytes: int, **kwargs: Any) -> None:
+        super().__init__(base_dir, max_bytes, **kwargs)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def persist_many(
+        self, events: Sequence[tuple[str, bytes]]
+    ) -> Result[bool, Problems]:
+        self.entered.set()
+        self.release.wait(5)
+        return super().persist_many(events)
+
+
+class BackgroundIndexer(TimedRollingFilePersister):
+    """Reports a background reindex until finished, recording the threads
+    which read its pending ids."""
+
+    finished: threading.Event
+    reader_threads: set[threading.Thread]
+
+    def __init__(self, base_dir: Path) -> None:
+        super().__init__(base_dir)
+        self.finished = threading.Event()
+        self.reader_threads = set()
+
+    @property
+    def reindexing(self) -> bool:
+        return not self.finished.is_set()
+
+    def pending_ids(self) -> list[str]:
+        self.reader_threads.add(threading.current_thread())
+        return super().pending_ids()
+
+
+class CountingPersister(TimedRollingFilePersister):
+    """Counts calls to pending_ids()."""
+
+    num_pending_ids: int = 0
+
+    def pending_ids(self) -> list[str]:
+        self.num_pending_ids += 1
+        return super().pending_ids()
+
+
+def test_threaded_persister() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir)
+    inner = BlockedPersister(event_dir, max_bytes=100)
+    p = ThreadedPersister(inner)
+    assert p.reindex().is_ok()
+    assert p.persister is inner
+
+    # writes return while the disk is stalled; the pending view is current.
+    assert p.persist("a", b"a" * 10).is_ok()
+    assert inner.entered.wait(5)
+    assert p.persist_many([("b", b"b" * 10), ("c", b"c" * 10)]).is_ok()
+    assert p.pending_ids() == ["a", "b", "c"]
+    assert p.num_pending == 3
+    assert "b" in p
+    assert inner.num_pending == 0
+    assert p.curr_bytes == 30
+    # queued content is retrieved from memory
+    assert p.retrieve("b").unwrap() == b"b" * 10
+    assert p.clear("b").is_ok()
+    assert "b" not in p
+    assert p.retrieve("b").unwrap() is None
+    problems = p.clear("b").unwrap_err()
+    assert isinstance(problems.warnings[0], UIDMissingWarning)
+    assert p.num_queued == 3
+
+    # operations run in order once the disk recovers
+    inner.release.set()
+    assert p.flush().is_ok()
+    assert p.num_queued == 0
+    assert inner.pending_ids() == ["a", "c"]
+    assert p.pending_ids() == ["a", "c"]
+    assert p.retrieve_many(["c", "a", "x"]) == {
+        "c": inner.retrieve("c"),
+        "a": inner.retrieve("a"),
+        "x": inner.retrieve("x"),
+    }
+    assert p.take_problems() is None
+
+    # trimming by the wrapped persister is reflected in the pending view
+    assert p.persist("d", b"d" * 95).is_ok()
+    assert p.flush().is_ok()
+    assert p.pending_ids() == ["d"]
+
+    # errors from the I/O thread are collected
+    assert p.persist("big", b"x" * 101).is_ok()
+    assert p.flush().is_ok()
+    assert "big" not in p
+    reported = p.take_problems()
+    assert reported is not None
+    assert isinstance(reported.errors[0], ContentTooLarge)
+    assert p.take_problems() is None
+
+    # reindex
+    p = ThreadedPersister(TimedRollingFilePersister(event_dir, max_bytes=100))
+    assert p.reindex().is_ok()
+    assert p.pending_ids() == ["d"]
+    assert p.retrieve("d").unwrap() == b"d" * 95
+
+
+def test_threaded_persister_background_reindex() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir)
+    disk = TimedRollingFilePersister(event_dir)
+    assert disk.reindex().is_ok()
+    assert disk.persist_many([("a", b"a"), ("b", b"b")]).is_ok()
+
+    inner = BackgroundIndexer(event_dir)
+    p = ThreadedPersister(inner)
+    p.REINDEX_REFRESH_SECONDS = 0.01
+    assert p.reindex().is_ok()
+    assert p.reindexing
+    assert p.pending_ids() == ["a", "b"]
+
+    # the pending view is refreshed by the I/O thread, not by checking
+    # reindexing, until the background reindex finishes
+    inner.finished.set()
+    end = time.time() + 5
+    while p.reindexing and time.time() < end:
+        time.sleep(0.01)
+    assert not p.reindexing
+    assert inner.reader_threads == {p._thread}  # noqa: SLF001
+    assert p.pending_ids() == ["a", "b"]
+
+
+def test_threaded_persister_full_store() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir)
+    inner = CountingPersister(event_dir, max_bytes=100)
+    p = ThreadedPersister(inner)
+    assert p.reindex().is_ok()
+    num_pending_ids = inner.num_pending_ids
+
+    # once the store is full, every write trims; only the trimmed uids
+    # leave the pending view, which is not rebuilt
+    for i in range(50):
+        assert p.persist(f"{i:02d}", b"x" * 10).is_ok()
+    assert p.flush().is_ok()
+    assert inner.num_pending_ids == num_pending_ids
+    assert p.num_pending == inner.num_pending == 10
+    assert p.pending_ids() == [f"{i:02d}" for i in range(40, 50)]
+
+    # as do events which fail to persist
+    assert p.persist("big", b"x" * 101).is_ok()
+    assert p.flush().is_ok()
+    assert "big" not in p
+    assert inner.num_pending_ids == num_pending_ids
+
+
+def test_threaded_persister_group_commit() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir)
+    inner = BlockedPersister(
+        event_dir, max_bytes=10_000, durability=Durability.group_commit
+    )
+    p = ThreadedPersister(inner)
+    assert p.reindex().is_ok()
+
+    # one at a time, from one writer, each persist is synced alone
+    inner.release.set()
+    for i in range(3):
+        assert p.persist(str(i), b"x").is_ok()
+        assert p.flush().is_ok()
+    assert inner.fsync_stats.num_commits == 3
+
+    # persists queued behind a running write are written, and synced,
+    # together
+    inner.release.clear()
+    inner.entered.clear()
+    assert p.persist("3", b"x").is_ok()
+    assert inner.entered.wait(5)
+    for i in range(4, 20):
+        assert p.persist(str(i), b"x").is_ok()
+    assert p.num_queued == 2
+    inner.release.set()
+    assert p.flush().is_ok()
+    assert p.pending_ids() == inner.pending_ids() == [str(i) for i in range(20)]
+    assert inner.fsync_stats.num_writes == 20
+    assert inner.fsync_stats.num_commits == 5
+
+    # other operations are not reordered around merged persists
+    inner.release.clear()
+    inner.entered.clear()
+    assert p.persist("20", b"x").is_ok()
+    assert inner.entered.wait(5)
+    assert p.persist("21", b"x").is_ok()
+    assert p.clear("21").is_ok()
+    assert p.persist("22", b"x").is_ok()
+    assert p.num_queued == 4
+    inner.release.set()
+    assert p.flush().is_ok()
+    assert inner.pending_ids()[-2:] == ["20", "22"]
@@ -0,0 +1,89 @@
+# ruff: noqa: PLR2004
+# mypy: disable-error-code="union-attr"
+from pathlib import Path
+
+from freezegun import freeze_time
+
+from gwproactor import AppSettings
+from gwproactor.persister import (
+    TieredPersister,
+    TimedRollingFilePersister,
+    UIDExistedWarning,
+    UIDMissingWarning,
+)
+
+
+def test_tiered_persister() -> None:
+    settings = AppSettings()
+    settings.paths.mkdirs()
+    event_dir = Path(settings.paths.event_dir)
+    disk = TimedRollingFilePersister(event_dir, max_bytes=1000)
+    p = TieredPersister(disk, buffer_bytes=30, max_age_seconds=10)
+    assert p.reindex().is_ok()
+    assert p.persister is disk
+
+    with freeze_time("2025-01-01 00:00:00") as frozen:
+        # buffered events never reach the disk if cleared in time
+        assert p.persist("a", b"a" * 10).is_ok()
+        assert p.persist("b", b"b" * 10).is_ok()
+        assert p.num_buffered == 2
+        assert p.buffered_bytes == 20
+        assert disk.num_persists == 0
+        assert p.pending_ids() == ["a", "b"]
+        assert p.retrieve("a").unwrap() == b"a" * 10
+        assert p.clear("a").is_ok()
+        assert "a" not in p
+        assert disk.num_persists == 0
+        assert disk.num_retrieves == 0
+
+        # a full buffer spills its oldest events
+        assert p.persist("c", b"c" * 10).is_ok()
+        assert p.persist("d", b"d" * 15).is_ok()
+        assert disk.pending_ids() == ["b"]
+        assert p.pending_ids() == ["b", "c", "d"]
+        assert p.num_pending == 3
+        assert p.curr_bytes == 35
+        assert p.num_spilled == 1
+        assert p.retrieve_many(["d", "b", "x"]) == {
+            "d": p.retrieve("d"),
+            "b": disk.retrieve("b"),
+            "x": disk.retrieve("x"),
+        }
+
+        # events too large to buffer go straight to disk, after older ones
+        assert p.persist("big", b"x" * 31).is_ok()
+        assert disk.pending_ids() == ["b", "c", "d", "big"]
+        assert p.num_buffered == 0
+
+        # persisting an existing uid replaces it
+        assert p.persist("e", b"e" * 5).is_ok()
+        problems = p.persist("e", b"E" * 5).unwrap_err()
+        assert isinstance(problems.warnings[0], UIDExistedWarning)
+        problems = p.persist("b", b"B" * 5).unwrap_err()
+        assert isinstance(problems.warnings[0], UIDExistedWarning)
+        assert p.pending_ids() == ["c", "d", "big", "e", "b"]
+        assert p.retrieve("b").unwrap() == b"B" * 5
+
+        # old events are spilled
+        assert p.spill_expired().is_ok()
+        assert p.num_buffered == 2
+        frozen.tick(10)
+        assert p.spill_expired().is_ok()
+        assert p.num_buffered == 0
+        assert disk.pending_ids() == ["c", "d", "big", "e", "b"]
+
+        # clear_many spans both tiers
+        assert p.persist("f", b"f").is_ok()
+        problems = p.clear_many(["f", "c", "missing"]).unwrap_err()
+        assert isinstance(problems.warnings[0], UIDMissingWarning)
+        assert p.pending_ids() == ["d", "big", "e", "b"]
+
+        # flush spills everything
+        assert p.persist("g", b"g").is_ok()
+        assert p.flush().is_ok()
+        assert p.num_buffered == 0
+        p = TieredPersister(TimedRollingFilePersister(event_dir, max_bytes=1000))
+        assert p.reindex().is_ok()
+        # (events persisted in the same frozen instant reindex in uid order)
+        assert sorted(p.pending_ids()[:-1]) == ["b", "big", "d", "e"]
+        assert p.pending_ids()[-1] == "g"